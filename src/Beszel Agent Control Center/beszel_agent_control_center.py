@@ -1,13 +1,31 @@
-import subprocess
-import tkinter as tk
-from tkinter import ttk, scrolledtext, messagebox
+import sys
+
+# Taken before our own imports (startup diagnostics)
+PRELOADED_MODULES = frozenset(sys.modules)
+
+import json
+import math
+import mmap
 import os
+import queue
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+import random
+import re
 import socket
-import sys
+import threading
+import time
 import ctypes
-import requests
+from ctypes import wintypes
+from dataclasses import dataclass, replace
+import functools
 import subprocess
-import winreg
+
+try:
+    import winreg
+except ImportError:  # non-Windows: only the fake backends are usable
+    winreg = None
 
 SERVICE_NAME = "beszelagent"
 AGENT_PORT = 45876
@@ -55,122 +73,568 @@ THEME = {
 
 current_theme = "light"
 
-# ---------------- Service helper functions ---------------- #
-
-### Get service status -- running, stopped, etc. ###
-def get_service_status():
-    result = subprocess.run(
-        ["sc", "query", SERVICE_NAME],
-        capture_output=True,
-        text=True,
-        creationflags=CREATE_NO_WINDOW
-    )
-    out = result.stdout.upper()
-
-    if "RUNNING" in out:
-        return "Running"
-    if "STOPPED" in out:
-        return "Stopped"
-    if "PAUSED" in out:
-        return "Paused"
-    if "START_PENDING" in out:
-        return "Starting…"
-    if "STOP_PENDING" in out:
-        return "Stopping…"
-    return "Unknown"
+# ---------------- Probe timings ---------------- #
+
+class ProbeTimings:
+    """Calls, errors and last/avg/max duration per instrumented probe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}  # name -> [calls, errors, last, total, max]
+
+    def record(self, name, seconds, failed=False):
+        with self._lock:
+            stats = self._stats.setdefault(name, [0, 0, 0.0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += int(failed)
+            stats[2] = seconds
+            stats[3] += seconds
+            stats[4] = max(stats[4], seconds)
+
+    def snapshot(self):
+        """Rows sorted by total time spent, slowest probe first."""
+        with self._lock:
+            rows = [
+                {
+                    "probe": name,
+                    "calls": calls,
+                    "errors": errors,
+                    "last_ms": round(last * 1000, 3),
+                    "avg_ms": round(total / calls * 1000, 3),
+                    "max_ms": round(peak * 1000, 3),
+                    "total_ms": round(total * 1000, 3),
+                }
+                for name, (calls, errors, last, total, peak) in self._stats.items()
+            ]
+        return sorted(rows, key=lambda r: r["total_ms"], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+probe_timings = ProbeTimings()
+
+
+### Decorator: time every call (monotonic clock), exceptions count as errors ###
+def timed(func):
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = func(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            probe_timings.record(name, elapsed, failed)
+            metrics.observe("beszel_call_duration_seconds", elapsed, probe=name)
+    return wrapper
 
-### Get service start type -- automatic, manual, disabled ###
-def get_start_type():
-    result = subprocess.run(
-        ["sc", "qc", SERVICE_NAME],
-        capture_output=True,
-        text=True,
-        creationflags=CREATE_NO_WINDOW
-    )
-    out = result.stdout.upper()
-
-    if "DELAYED_AUTO_START" in out:
-        return "Automatic (Delayed)"
-    if "AUTO_START" in out:
-        return "Automatic"
-    if "DEMAND_START" in out:
-        return "Manual"
-    if "DISABLED" in out:
-        return "Disabled"
-    return "Unknown"
+# ---------------- Service helper functions ---------------- #
 
-### Get installation path from registry ###
-def get_install_path():
+# ---------------- Service query backend ---------------- #
+
+PARAMETERS_KEY = r"SYSTEM\CurrentControlSet\Services\beszelagent\Parameters"
+
+# SCM constants (winsvc.h)
+SC_MANAGER_CONNECT = 0x0001
+SERVICE_QUERY_CONFIG = 0x0001
+SERVICE_QUERY_STATUS = 0x0004
+SERVICE_START = 0x0010
+SERVICE_STOP = 0x0020
+SERVICE_CONTROL_STOP = 1
+SERVICE_CONFIG_DELAYED_AUTO_START_INFO = 3
+ERROR_INSUFFICIENT_BUFFER = 122
+ERROR_SERVICE_ALREADY_RUNNING = 1056
+ERROR_SERVICE_NOT_ACTIVE = 1062
+
+SERVICE_STATES = {
+    1: "STOPPED",
+    2: "START_PENDING",
+    3: "STOP_PENDING",
+    4: "RUNNING",
+    5: "CONTINUE_PENDING",
+    6: "PAUSE_PENDING",
+    7: "PAUSED",
+}
+SERVICE_START_TYPES = {
+    0: "BOOT_START",
+    1: "SYSTEM_START",
+    2: "AUTO_START",
+    3: "DEMAND_START",
+    4: "DISABLED",
+}
 
-    reg_key = r"HKLM\SYSTEM\CurrentControlSet\Services\beszelagent\Parameters"
 
+class SERVICE_STATUS(ctypes.Structure):
+    _fields_ = [
+        ("dwServiceType", wintypes.DWORD),
+        ("dwCurrentState", wintypes.DWORD),
+        ("dwControlsAccepted", wintypes.DWORD),
+        ("dwWin32ExitCode", wintypes.DWORD),
+        ("dwServiceSpecificExitCode", wintypes.DWORD),
+        ("dwCheckPoint", wintypes.DWORD),
+        ("dwWaitHint", wintypes.DWORD),
+    ]
+
+
+class QUERY_SERVICE_CONFIGW(ctypes.Structure):
+    _fields_ = [
+        ("dwServiceType", wintypes.DWORD),
+        ("dwStartType", wintypes.DWORD),
+        ("dwErrorControl", wintypes.DWORD),
+        ("lpBinaryPathName", wintypes.LPWSTR),
+        ("lpLoadOrderGroup", wintypes.LPWSTR),
+        ("dwTagId", wintypes.DWORD),
+        ("lpDependencies", wintypes.LPWSTR),
+        ("lpServiceStartName", wintypes.LPWSTR),
+        ("lpDisplayName", wintypes.LPWSTR),
+    ]
+
+
+@dataclass(frozen=True)
+class ServiceSnapshot:
+    """State, start type and install path of a service, read in one go."""
+    exists: bool
+    state: str = "UNKNOWN"          # SCM name, e.g. "RUNNING", "STOP_PENDING"
+    start_type: str = "UNKNOWN"     # "AUTO_START", "DELAYED_AUTO_START", ...
+    application: str | None = None  # Parameters\Application (expanded)
+
+
+def read_service_application(service_name=SERVICE_NAME):
+    """Read Parameters\\Application via winreg (no reg.exe)."""
+    key_path = rf"SYSTEM\CurrentControlSet\Services\{service_name}\Parameters"
     try:
-        result = subprocess.run(
-            ["reg", "query", reg_key, "/v", "Application"],
-            capture_output=True,
-            text=True,
-            creationflags=CREATE_NO_WINDOW
+        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, key_path, 0, winreg.KEY_READ) as key:
+            value, _ = winreg.QueryValueEx(key, "Application")
+    except OSError:
+        return None
+    if not value:
+        return None
+    # Expand %PROGRAMFILES%, %SYSTEMROOT%, etc.
+    return os.path.expandvars(str(value).strip().strip('"'))
+
+
+class WindowsServiceBackend:
+    """Queries and controls services via the Service Control Manager in-process."""
+
+    def __init__(self, read_application=read_service_application):
+        self.read_application = read_application
+
+    @staticmethod
+    def _advapi32():
+        advapi32 = ctypes.WinDLL("advapi32", use_last_error=True)
+        advapi32.OpenSCManagerW.restype = wintypes.HANDLE
+        advapi32.OpenServiceW.restype = wintypes.HANDLE
+        advapi32.OpenServiceW.argtypes = [wintypes.HANDLE, wintypes.LPCWSTR, wintypes.DWORD]
+        advapi32.CloseServiceHandle.argtypes = [wintypes.HANDLE]
+        return advapi32
+
+    def _control(self, service_name, access, action, ignored_error):
+        advapi32 = self._advapi32()
+        scm = advapi32.OpenSCManagerW(None, None, SC_MANAGER_CONNECT)
+        if not scm:
+            raise ctypes.WinError(ctypes.get_last_error())
+        try:
+            svc = advapi32.OpenServiceW(scm, service_name, access)
+            if not svc:
+                raise ctypes.WinError(ctypes.get_last_error())
+            try:
+                if not action(advapi32, wintypes.HANDLE(svc)):
+                    err = ctypes.get_last_error()
+                    if err != ignored_error:
+                        raise ctypes.WinError(err)
+            finally:
+                advapi32.CloseServiceHandle(svc)
+        finally:
+            advapi32.CloseServiceHandle(scm)
+
+    def start(self, service_name=SERVICE_NAME):
+        """Ask the SCM to start the service (returns before it is RUNNING)."""
+        self._control(
+            service_name, SERVICE_START,
+            lambda api, svc: api.StartServiceW(svc, 0, None),
+            ERROR_SERVICE_ALREADY_RUNNING
         )
 
-        out = result.stdout
+    def stop(self, service_name=SERVICE_NAME):
+        """Send SERVICE_CONTROL_STOP (returns before it is STOPPED)."""
+        status = SERVICE_STATUS()
+        self._control(
+            service_name, SERVICE_STOP,
+            lambda api, svc: api.ControlService(svc, SERVICE_CONTROL_STOP, ctypes.byref(status)),
+            ERROR_SERVICE_NOT_ACTIVE
+        )
 
-        if "Application" in out:
-            # Teile am Datentyp: REG_SZ *oder* REG_EXPAND_SZ
-            if "REG_EXPAND_SZ" in out:
-                parts = out.split("REG_EXPAND_SZ")
-            elif "REG_SZ" in out:
-                parts = out.split("REG_SZ")
-            else:
-                return "Unknown"
+    def query(self, service_name=SERVICE_NAME):
+        advapi32 = self._advapi32()
 
-            path = parts[1].strip().strip('"')
+        scm = advapi32.OpenSCManagerW(None, None, SC_MANAGER_CONNECT)
+        if not scm:
+            return ServiceSnapshot(exists=False)
+        try:
+            svc = advapi32.OpenServiceW(scm, service_name, SERVICE_QUERY_STATUS | SERVICE_QUERY_CONFIG)
+            if not svc:
+                return ServiceSnapshot(exists=False)
+            try:
+                return ServiceSnapshot(
+                    exists=True,
+                    state=self._query_state(advapi32, svc),
+                    start_type=self._query_start_type(advapi32, svc),
+                    application=self.read_application(service_name),
+                )
+            finally:
+                advapi32.CloseServiceHandle(svc)
+        finally:
+            advapi32.CloseServiceHandle(scm)
+
+    @staticmethod
+    def _query_state(advapi32, svc):
+        status = SERVICE_STATUS()
+        if not advapi32.QueryServiceStatus(wintypes.HANDLE(svc), ctypes.byref(status)):
+            return "UNKNOWN"
+        return SERVICE_STATES.get(status.dwCurrentState, "UNKNOWN")
+
+    @staticmethod
+    def _query_start_type(advapi32, svc):
+        needed = wintypes.DWORD(0)
+        advapi32.QueryServiceConfigW(wintypes.HANDLE(svc), None, 0, ctypes.byref(needed))
+        if ctypes.get_last_error() != ERROR_INSUFFICIENT_BUFFER:
+            return "UNKNOWN"
+
+        buf = ctypes.create_string_buffer(needed.value)
+        if not advapi32.QueryServiceConfigW(wintypes.HANDLE(svc), buf, needed, ctypes.byref(needed)):
+            return "UNKNOWN"
+        config = ctypes.cast(buf, ctypes.POINTER(QUERY_SERVICE_CONFIGW)).contents
+        start_type = SERVICE_START_TYPES.get(config.dwStartType, "UNKNOWN")
+
+        if start_type == "AUTO_START":
+            delayed = wintypes.BOOL(0)
+            if advapi32.QueryServiceConfig2W(
+                wintypes.HANDLE(svc),
+                SERVICE_CONFIG_DELAYED_AUTO_START_INFO,
+                ctypes.byref(delayed),
+                ctypes.sizeof(delayed),
+                ctypes.byref(needed)
+            ) and delayed.value:
+                start_type = "DELAYED_AUTO_START"
+        return start_type
+
+
+class FakeServiceBackend:
+    """In-memory backend for tests and benchmarks on non-Windows hosts."""
+
+    def __init__(self, services=None):
+        self.services = dict(services or {})
+        self.queries = 0
+        self.controls = []
+
+    def set(self, service_name=SERVICE_NAME, **fields):
+        current = self.services.get(service_name, ServiceSnapshot(exists=True))
+        self.services[service_name] = replace(current, exists=True, **fields)
+
+    def query(self, service_name=SERVICE_NAME):
+        self.queries += 1
+        return self.services.get(service_name, ServiceSnapshot(exists=False))
+
+    def start(self, service_name=SERVICE_NAME):
+        self.controls.append(("start", service_name))
+        self.set(service_name, state="RUNNING")
+
+    def stop(self, service_name=SERVICE_NAME):
+        self.controls.append(("stop", service_name))
+        self.set(service_name, state="STOPPED")
+
+
+# ---------------- Registry cache ---------------- #
+
+# winreg value types (numeric, so the fakes work without winreg)
+REG_SZ = 1
+REG_EXPAND_SZ = 2
+REG_BINARY = 3
+REG_DWORD = 4
+REG_MULTI_SZ = 7
+REG_QWORD = 11
+REG_TYPE_NAMES = {
+    REG_SZ: "REG_SZ",
+    REG_EXPAND_SZ: "REG_EXPAND_SZ",
+    REG_BINARY: "REG_BINARY",
+    REG_DWORD: "REG_DWORD",
+    REG_MULTI_SZ: "REG_MULTI_SZ",
+    REG_QWORD: "REG_QWORD",
+}
 
-            # Expand %PROGRAMFILES%, %SYSTEMROOT%, etc.
-            path = os.path.expandvars(path)
+REG_NOTIFY_CHANGE_NAME = 0x00000001
+REG_NOTIFY_CHANGE_LAST_SET = 0x00000004
+REG_NOTIFY_THREAD_AGNOSTIC = 0x10000000  # survives the end of the arming thread
+WAIT_OBJECT_0 = 0
+REGISTRY_RETRY = 10.0  # re-read interval while a key is missing / not watchable
+
+
+@dataclass(frozen=True)
+class RegistryValue:
+    name: str
+    value: object
+    type: int
+
+    @property
+    def type_name(self):
+        return REG_TYPE_NAMES.get(self.type, f"REG_{self.type}")
+
+
+@dataclass(frozen=True)
+class RegistrySnapshot:
+    exists: bool
+    values: tuple = ()  # RegistryValue, in registry order
+
+    def get(self, name, default=None):
+        # Value names are case-insensitive in the registry
+        for v in self.values:
+            if v.name.lower() == name.lower():
+                return v.value
+        return default
+
+    @property
+    def application(self):
+        value = self.get("Application")
+        if not value:
+            return None
+        return os.path.expandvars(str(value).strip().strip('"'))
+
+
+class RegistryWatch:
+    """One-shot RegNotifyChangeKeyValue on a key, polled through its event."""
+
+    def __init__(self, key_path):
+        self.key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, key_path, 0, winreg.KEY_NOTIFY)
+
+        self.kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        self.kernel32.CreateEventW.restype = wintypes.HANDLE
+        self.kernel32.CreateEventW.argtypes = [ctypes.c_void_p, wintypes.BOOL, wintypes.BOOL, wintypes.LPCWSTR]
+        self.kernel32.WaitForSingleObject.argtypes = [wintypes.HANDLE, wintypes.DWORD]
+        self.kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+        self.event = self.kernel32.CreateEventW(None, True, False, None)  # manual reset
+        if not self.event:
+            self.key.Close()
+            raise ctypes.WinError(ctypes.get_last_error())
+
+        advapi32 = ctypes.WinDLL("advapi32", use_last_error=True)
+        advapi32.RegNotifyChangeKeyValue.argtypes = [
+            wintypes.HKEY, wintypes.BOOL, wintypes.DWORD, wintypes.HANDLE, wintypes.BOOL
+        ]
+        err = advapi32.RegNotifyChangeKeyValue(
+            wintypes.HKEY(int(self.key)), False,
+            REG_NOTIFY_CHANGE_NAME | REG_NOTIFY_CHANGE_LAST_SET | REG_NOTIFY_THREAD_AGNOSTIC,
+            self.event, True
+        )
+        if err:
+            self.close()
+            raise ctypes.WinError(err)
 
-            return path
-    except Exception:
-        pass
+    def changed(self):
+        return self.kernel32.WaitForSingleObject(self.event, 0) == WAIT_OBJECT_0
 
-    return "Unknown"
+    def close(self):
+        self.kernel32.CloseHandle(self.event)
+        self.key.Close()
 
-### Get system environment variables ###
-def get_env_vars():
-    reg_path = r"SYSTEM\CurrentControlSet\Services\beszelagent\Parameters"
 
-    try:
-        key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, reg_path)
-    except FileNotFoundError:
-        return "Registry path not found."
+class WindowsRegistry:
+    """Reads HKLM keys via winreg; watch() arms a change notification."""
 
-    lines = []
-    index = 0
+    def read(self, key_path):
+        values = []
+        try:
+            with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, key_path, 0, winreg.KEY_READ) as key:
+                index = 0
+                while True:
+                    try:
+                        name, value, vtype = winreg.EnumValue(key, index)
+                    except OSError:
+                        break  # keine weiteren Einträge
+                    values.append(RegistryValue(name, value, vtype))
+                    index += 1
+        except OSError:
+            return RegistrySnapshot(exists=False)
+        return RegistrySnapshot(exists=True, values=tuple(values))
 
-    while True:
+    def watch(self, key_path):
         try:
-            name, value, vtype = winreg.EnumValue(key, index)
+            return RegistryWatch(key_path)
         except OSError:
-            break  # keine weiteren Einträge
-        index += 1
+            return None  # key missing: the cache falls back to REGISTRY_RETRY
+
+
+class FakeRegistryWatch:
+    def __init__(self, registry, key_path):
+        self.registry = registry
+        self.key_path = key_path
+        self.fired = False
+
+    def changed(self):
+        return self.fired
+
+    def close(self):
+        if self in self.registry.watches:
+            self.registry.watches.remove(self)
+
+
+class FakeRegistry:
+    """In-memory registry (same interface) for tests on non-Windows hosts."""
+
+    def __init__(self, keys=None):
+        # key_path -> {name: (value, type)}
+        self.keys = {path: dict(values) for path, values in (keys or {}).items()}
+        self.watches = []
+        self.reads = 0
+
+    def set_value(self, key_path, name, value, vtype=REG_SZ):
+        self.keys.setdefault(key_path, {})[name] = (value, vtype)
+        self._notify(key_path)
+
+    def delete_key(self, key_path):
+        self.keys.pop(key_path, None)
+        self._notify(key_path)
 
-        # Typ-Name bestimmen
-        if vtype == winreg.REG_SZ:
-            type_name = "REG_SZ"
-            value_str = str(value)
+    def _notify(self, key_path):
+        for watch in self.watches:
+            if watch.key_path == key_path:
+                watch.fired = True
 
-        elif vtype == winreg.REG_EXPAND_SZ:
-            type_name = "REG_EXPAND_SZ"
-            value_str = os.path.expandvars(value)
+    def read(self, key_path):
+        self.reads += 1
+        if key_path not in self.keys:
+            return RegistrySnapshot(exists=False)
+        return RegistrySnapshot(True, tuple(
+            RegistryValue(name, value, vtype) for name, (value, vtype) in self.keys[key_path].items()
+        ))
 
-        elif vtype == winreg.REG_MULTI_SZ:
-            type_name = "REG_MULTI_SZ"
-            value_str = "\n  " + "\n  ".join(value)
+    def watch(self, key_path):
+        if key_path not in self.keys:
+            return None
+        watch = FakeRegistryWatch(self, key_path)
+        self.watches.append(watch)
+        return watch
+
+
+class RegistryCache:
+    """
+    Typed snapshot of one registry key.
+
+    Reloaded only after its change notification fired (the watch is armed
+    before the read, so no change between the two is lost). While the key
+    does not exist it is re-read every `retry` seconds instead.
+    """
+
+    def __init__(self, backend, key_path, retry=REGISTRY_RETRY):
+        self.backend = backend
+        self.key_path = key_path
+        self.retry = retry
+        self.loads = 0
+        self.hits = 0
+        self._snapshot = None
+        self._watch = None
+        self._loaded = 0.0
+        self._lock = threading.Lock()
+
+    def _stale(self):
+        if self._snapshot is None:
+            return True
+        if self._watch is None:
+            return time.monotonic() - self._loaded >= self.retry
+        return self._watch.changed()
+
+    def get(self):
+        with self._lock:
+            if not self._stale():
+                self.hits += 1
+                return self._snapshot
+            if self._watch is not None:
+                self._watch.close()
+            self._watch = self.backend.watch(self.key_path)
+            self._snapshot = self.backend.read(self.key_path)
+            self._loaded = time.monotonic()
+            self.loads += 1
+            return self._snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def stats(self):
+        with self._lock:
+            return {"loads": self.loads, "hits": self.hits, "watched": self._watch is not None}
+
+parameters_cache = RegistryCache(WindowsRegistry(), PARAMETERS_KEY)
+
+
+### Application value of our own service from the cache (SCM queries) ###
+def read_cached_application(service_name=SERVICE_NAME):
+    if service_name != SERVICE_NAME:
+        return read_service_application(service_name)
+    return parameters_cache.get().application
+
+
+service_backend = WindowsServiceBackend(read_application=read_cached_application)
+
+# Anzeige-Texte für die SCM-Namen
+STATE_LABELS = {
+    "RUNNING": "Running",
+    "STOPPED": "Stopped",
+    "PAUSED": "Paused",
+    "START_PENDING": "Starting…",
+    "STOP_PENDING": "Stopping…",
+}
+START_TYPE_LABELS = {
+    "DELAYED_AUTO_START": "Automatic (Delayed)",
+    "AUTO_START": "Automatic",
+    "DEMAND_START": "Manual",
+    "DISABLED": "Disabled",
+}
+
+### One SCM query for all fields of a status tick ###
+@timed
+def query_service():
+    return service_backend.query(SERVICE_NAME)
+
+### Get service status -- running, stopped, etc. ###
+@timed
+def get_service_status(snapshot=None):
+    snapshot = snapshot or service_backend.query(SERVICE_NAME)
+    return STATE_LABELS.get(snapshot.state, "Unknown")
+
+### Get service start type -- automatic, manual, disabled ###
+@timed
+def get_start_type(snapshot=None):
+    snapshot = snapshot or service_backend.query(SERVICE_NAME)
+    return START_TYPE_LABELS.get(snapshot.start_type, "Unknown")
+
+### Get installation path from registry ###
+@timed
+def get_install_path(snapshot=None):
+    snapshot = snapshot or service_backend.query(SERVICE_NAME)
+    return snapshot.application or "Unknown"
 
+### Get system environment variables ###
+@timed
+def get_env_vars():
+    snapshot = parameters_cache.get()
+    if not snapshot.exists:
+        return "Registry path not found."
+
+    lines = []
+    for v in snapshot.values:
+        if v.type == REG_EXPAND_SZ:
+            value_str = os.path.expandvars(v.value)
+        elif v.type == REG_MULTI_SZ:
+            value_str = "\n  " + "\n  ".join(v.value)
         else:
-            type_name = f"REG_{vtype}"
-            value_str = str(value)
+            value_str = str(v.value)
 
-        lines.append(f"{name} ({type_name}):\n  {value_str}\n")
+        lines.append(f"{v.name} ({v.type_name}):\n  {value_str}\n")
 
     return "\n".join(lines) if lines else "No values found."
 
@@ -185,16 +649,11 @@ def download_latest_agent():
     except Exception as e:
         messagebox.showerror("Download failed", str(e))
 
-### Test connection to agent port ###
+### Test connection to agent port (blocking, one-shot) ###
+@timed
 def test_agent_connection():
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.settimeout(1.0)
-    try:
-        s.connect(("127.0.0.1", AGENT_PORT))
-        s.close()
-        return True
-    except Exception:
-        return False
+    results = PortProber(targets=["127.0.0.1"]).probe_once()
+    return any(r.latency_ms is not None for r in results)
 
 ### Ensure Beszel Agent Control Center is running as admin ###    
 def ensure_admin():
@@ -215,18 +674,120 @@ def ensure_admin():
         )
         sys.exit()
 
-# Call immediately at startup
-ensure_admin()
+# ---------------- GitHub release cache ---------------- #
+
+GITHUB_RELEASE_API = "https://api.github.com/repos/henrygd/beszel/releases/latest"
+
+# Gemeinsamer Cache für Installer und Control Center (gleiches Format!)
+RELEASE_CACHE_FILE = os.path.join(
+    os.environ.get("ProgramData", r"C:\ProgramData"),
+    "beszel-agent",
+    "release-cache.json"
+)
+RELEASE_CACHE_TTL = int(os.environ.get("BESZEL_RELEASE_CACHE_TTL", "3600"))
+RELEASE_CACHE_JITTER = 0.2     # up to +20% of the TTL, so hosts don't refresh in lockstep
+RELEASE_CACHE_RETRY = 300      # retry delay after network errors / non-200 answers
+
+
+def load_release_cache(cache_file=RELEASE_CACHE_FILE):
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        return entry if isinstance(entry, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_release_cache(entry, cache_file=RELEASE_CACHE_FILE):
+    # Atomic replace so a second process never reads a half-written file
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print("Could not write release cache:", e)
+
+
+def get_latest_release(api_url=GITHUB_RELEASE_API, cache_file=RELEASE_CACHE_FILE,
+                       ttl=RELEASE_CACHE_TTL, force=False):
+    """
+    Return the latest release metadata ({"tag_name", "assets"}) or None.
+
+    Served from the on-disk cache while it is fresh. Otherwise GitHub is asked
+    with If-None-Match, so an unchanged release costs a 304 that does not count
+    against the rate limit. X-RateLimit-* headers are honoured: once the limit
+    is used up, nothing is sent before X-RateLimit-Reset.
+    """
+    entry = load_release_cache(cache_file)
+    data = entry.get("data")
+    now = time.time()
+
+    if not force and data and now < entry.get("expires", 0):
+        return data
+    if entry.get("ratelimit_remaining") == 0 and now < entry.get("ratelimit_reset", 0):
+        return data
+
+    # Networking stack only when a request is really needed
+    import requests
+
+    headers = {"Accept": "application/vnd.github+json"}
+    if data and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+
+    expires = now + ttl + random.uniform(0, ttl * RELEASE_CACHE_JITTER)
+    try:
+        resp = requests.get(api_url, headers=headers, timeout=5)
+    except requests.RequestException as e:
+        print("Release check failed:", e)
+        metrics.inc("beszel_github_requests_total", result="error")
+        entry["expires"] = now + RELEASE_CACHE_RETRY
+        save_release_cache(entry, cache_file)
+        return data
+
+    metrics.inc("beszel_github_requests_total", result=str(resp.status_code))
+    remaining = resp.headers.get("X-RateLimit-Remaining")
+    reset = resp.headers.get("X-RateLimit-Reset")
+    if remaining is not None and remaining.isdigit():
+        entry["ratelimit_remaining"] = int(remaining)
+    if reset is not None and reset.isdigit():
+        entry["ratelimit_reset"] = int(reset)
+
+    if resp.status_code == 200:
+        try:
+            payload = resp.json()
+            data = {
+                "tag_name": payload.get("tag_name", ""),
+                "assets": [
+                    {"name": a.get("name", ""), "browser_download_url": a.get("browser_download_url", "")}
+                    for a in payload.get("assets", [])
+                ],
+            }
+            entry["data"] = data
+            entry["etag"] = resp.headers.get("ETag")
+        except ValueError:
+            expires = now + RELEASE_CACHE_RETRY
+    elif resp.status_code != 304:
+        # 403/429 (rate limited) or server error: keep the old data, try later
+        expires = now + RELEASE_CACHE_RETRY
+
+    if entry.get("ratelimit_remaining") == 0:
+        expires = max(expires, entry.get("ratelimit_reset", 0))
+
+    entry["expires"] = expires
+    entry["checked"] = now
+    save_release_cache(entry, cache_file)
+    return data
 
 ### Fetch latest agent version from GitHub ###
+@timed
 def get_github_latest_version():
-    try:
-        resp = requests.get("https://api.github.com/repos/henrygd/beszel/releases/latest", timeout=5)
-        data = resp.json()
-        tag = data.get("tag_name", "").strip()  # z.B. "v0.16.1"
-        return tag.lstrip("v")  # <-- entfernt führendes v
-    except:
+    release = get_latest_release()
+    if not release:
         return None
+    tag = release.get("tag_name", "").strip()  # z.B. "v0.16.1"
+    return tag.lstrip("v") or None  # <-- entfernt führendes v
 
 ### Compare installed and latest versions ###
 def compare_versions(installed, latest):
@@ -244,36 +805,1419 @@ def compare_versions(installed, latest):
 
 ### Trigger agent update check ###
 def trigger_agent_update_check():
-    agent_path = os.path.join(path_var.get(), "beszel-agent.exe")
-    get_github_latest_version(agent_path)
+    # Version lookup runs in the status poller, never on the Tk thread
+    refresh_all()
 
-# ---------------- GUI actions ---------------- #
-### Service control functions ###
-def start_service():
-    subprocess.run(
-        ["sc", "start", SERVICE_NAME],
+# ---------------- Metrics exporter ---------------- #
+
+METRICS_DEFAULT_PORT = 45877                 # agent port + 1
+METRICS_PORT = int(os.environ.get("BESZEL_METRICS_PORT", "0"))  # GUI: 0 = exporter off
+METRICS_BIND = os.environ.get("BESZEL_METRICS_BIND", "127.0.0.1")
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# name -> (type, help); the exposition order follows this dict
+METRIC_FAMILIES = {
+    "beszel_service_installed": ("gauge", "1 if the agent service is registered with the SCM."),
+    "beszel_service_up": ("gauge", "1 if the agent service is RUNNING."),
+    "beszel_service_state": ("gauge", "Current SCM state of the agent service (one series per state)."),
+    "beszel_service_start_type": ("gauge", "Configured start type of the agent service (one series per type)."),
+    "beszel_agent_info": ("gauge", "Installed and latest released agent version."),
+    "beszel_agent_update_available": ("gauge", "1 if the installed agent differs from the latest release."),
+    "beszel_port_reachable": ("gauge", "1 if the agent port accepted a TCP connection on the last sweep."),
+    "beszel_port_latency_seconds": ("gauge", "TCP connect latency to the agent port on the last sweep."),
+    "beszel_status_timestamp_seconds": ("gauge", "Unix time of the cached status snapshot."),
+    "beszel_probe_duration_seconds": ("summary", "Duration of the periodic refresh probes."),
+    "beszel_call_duration_seconds": ("summary", "Duration of the instrumented probe functions (Diagnostics window)."),
+    "beszel_probe_errors_total": ("counter", "Refresh probes that raised an exception."),
+    "beszel_process_spawns_total": ("counter", "Child processes started by the Control Center."),
+    "beszel_github_requests_total": ("counter", "Requests sent to the GitHub releases API (cache hits excluded)."),
+}
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+class Metrics:
+    """
+    In-memory metric values for /metrics.
+
+    Probes, jobs and the release check write here when they run anyway;
+    render() only formats what is cached, so a scrape never triggers a probe.
+    """
+
+    def __init__(self, families=METRIC_FAMILIES):
+        self.families = families
+        self._lock = threading.Lock()
+        self._series = {name: {} for name in families}  # name -> {labels: value}
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted(labels.items()))
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._series[name][self._key(labels)] = float(value)
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            series = self._series[name]
+            key = self._key(labels)
+            series[key] = series.get(key, 0.0) + amount
+
+    def replace(self, name, series):
+        """Swap a whole family, e.g. per-host gauges when hosts come and go."""
+        with self._lock:
+            self._series[name] = {self._key(labels): float(v) for labels, v in series}
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series[name]
+            total, count = series.get(key, (0.0, 0))
+            series[key] = (total + seconds, count + 1)
+
+    def value(self, name, **labels):
+        with self._lock:
+            return self._series[name].get(self._key(labels))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in self.families.items():
+                series = self._series[name]
+                if not series:
+                    continue
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(series.items()):
+                    labels = ",".join(f'{k}="{escape_label_value(v)}"' for k, v in key)
+                    labels = f"{{{labels}}}" if labels else ""
+                    if kind == "summary":
+                        lines.append(f"{name}_sum{labels} {value[0]:.6f}")
+                        lines.append(f"{name}_count{labels} {value[1]}")
+                    else:
+                        lines.append(f"{name}{labels} {value:.15g}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+
+### Status gauges from one snapshot (called where the snapshot is taken) ###
+def record_status_metrics(service, installed, latest):
+    installed = None if installed == "Unknown" else installed
+    metrics.set("beszel_service_installed", int(service.exists))
+    metrics.set("beszel_service_up", int(service.state == "RUNNING"))
+    metrics.replace("beszel_service_state", [
+        ({"state": state}, int(service.state == state))
+        for state in [*SERVICE_STATES.values(), "UNKNOWN"]
+    ])
+    metrics.replace("beszel_service_start_type", [
+        ({"start_type": start_type}, int(service.start_type == start_type))
+        for start_type in [*SERVICE_START_TYPES.values(), "DELAYED_AUTO_START", "UNKNOWN"]
+    ])
+    metrics.replace("beszel_agent_info", [
+        ({"installed": installed or "unknown", "latest": latest or "unknown"}, 1)
+    ])
+    metrics.set("beszel_agent_update_available", int(compare_versions(installed, latest) == "Update available"))
+    metrics.set("beszel_status_timestamp_seconds", time.time())
+
+
+### Port gauges from one PortProber sweep ###
+def record_port_metrics(results):
+    metrics.replace("beszel_port_reachable", [
+        ({"host": r.host}, int(r.latency_ms is not None)) for r in results
+    ])
+    metrics.replace("beszel_port_latency_seconds", [
+        ({"host": r.host}, r.latency_ms / 1000) for r in results if r.latency_ms is not None
+    ])
+
+
+### Serve /metrics from a daemon thread; returns the server (shutdown()) ###
+def start_metrics_server(port=METRICS_DEFAULT_PORT, bind=METRICS_BIND, registry=None):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    registry = registry or metrics
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/metrics", "/metrics/"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", METRICS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # every scrape would end up in the (absent) console
+
+    server = ThreadingHTTPServer((bind, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="Metrics", daemon=True).start()
+    return server
+
+metrics_server = None
+
+# ---------------- Refresh scheduler ---------------- #
+
+@dataclass
+class ScheduledProbe:
+    func: object
+    interval: float
+    due: float                # monotonic time of the pending run, inf while running
+    scheduled: int = 1        # runs armed (timer or request while running)
+    executed: int = 0
+    requested: int = 0        # explicit "refresh now" calls
+    running: bool = False
+
+
+class RefreshScheduler:
+    """
+    Single owner of all periodic refreshes.
+
+    Every probe has exactly one pending run (its `due` time) and its own
+    worker lane, so a slow probe never delays another one and never runs
+    twice at once. request() only moves the pending run to "now"; any
+    number of requests before it starts coalesce into that one run.
+    """
+
+    def __init__(self):
+        self._probes = {}
+        self._cond = threading.Condition()
+        self._stopped = False
+
+    def add(self, name, func, interval, initial_delay=0.0):
+        self._probes[name] = ScheduledProbe(func, interval, time.monotonic() + initial_delay)
+
+    def start(self):
+        for name in self._probes:
+            threading.Thread(
+                target=self._lane, args=(name,), name=f"Refresh-{name}", daemon=True
+            ).start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def request(self, name):
+        """Run `name` as soon as possible (coalesces with a pending run)."""
+        with self._cond:
+            probe = self._probes.get(name)
+            if probe is None:
+                return
+            probe.requested += 1
+            if probe.due == math.inf:
+                # Running right now: arm exactly one follow-up run
+                probe.scheduled += 1
+            probe.due = min(probe.due, time.monotonic())
+            self._cond.notify_all()
+
+    def set_interval(self, name, interval):
+        with self._cond:
+            probe = self._probes[name]
+            if probe.due != math.inf:
+                probe.due = min(probe.due, time.monotonic() + interval)
+            probe.interval = interval
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                name: {
+                    "interval": p.interval,
+                    "scheduled": p.scheduled,
+                    "executed": p.executed,
+                    "requested": p.requested,
+                    "pending": p.scheduled - p.executed,
+                }
+                for name, p in self._probes.items()
+            }
+
+    def _lane(self, name):
+        probe = self._probes[name]
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    delay = probe.due - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                if self._stopped:
+                    return
+                probe.due = math.inf
+                probe.running = True
+
+            start = time.perf_counter()
+            try:
+                probe.func()
+            except Exception as e:
+                print(f"Refresh '{name}' failed:", e)
+                metrics.inc("beszel_probe_errors_total", probe=name)
+            metrics.observe("beszel_probe_duration_seconds", time.perf_counter() - start, probe=name)
+
+            with self._cond:
+                probe.running = False
+                probe.executed += 1
+                if probe.due == math.inf:
+                    probe.due = time.monotonic() + probe.interval
+                    probe.scheduled += 1
+
+refresh_scheduler = None
+
+# ---------------- Background status poller ---------------- #
+
+### Collect one status snapshot (runs in a scheduler lane) ###
+def collect_status_snapshot():
+    # One in-process SCM/registry query per tick, no sc.exe / reg.exe
+    service = query_service()
+    status = get_service_status(service)
+    start_type = get_start_type(service)
+    path = get_install_path(service)
+
+    installed = get_installed_agent_version(resolve_agent_exe(path))
+    latest = get_github_latest_version()
+    record_status_metrics(service, installed, latest)
+
+    # Only indicate update availability (no URLs)
+    if compare_versions(installed, latest) == "Up to date":
+        update_available = "✔ Agent is up to date"
+    else:
+        update_available = "⚠ Update available"
+
+    return {
+        "status": status,
+        "start_type": start_type,
+        "path": path,
+        "version": installed,
+        "agent_installed": installed or "Unknown",
+        "agent_latest": latest or "Failed to check",
+        "update_available": update_available,
+    }
+
+class StatusPoller:
+    """
+    Gathers status snapshots off the Tk thread (driven by the
+    RefreshScheduler) and puts only the changed fields (dict) into out_queue.
+    """
+
+    def __init__(self, out_queue, collect=collect_status_snapshot):
+        self.out_queue = out_queue
+        self.collect = collect
+        self._last = {}
+
+    def poll_once(self):
+        start = time.perf_counter()
+        try:
+            snapshot = self.collect()
+        except Exception as e:
+            print("Status poll failed:", e)
+            return
+        status_history.record_refresh((time.perf_counter() - start) * 1000)
+        diff = {k: v for k, v in snapshot.items() if self._last.get(k) != v}
+        if diff:
+            self._last = snapshot
+            self.out_queue.put(diff)
+
+status_queue = queue.Queue()
+status_poller = None
+
+# ---------------- Service state watcher ---------------- #
+
+# Volle Aktualisierung (Version, Pfad, GitHub) nur noch selten –
+# Statuswechsel kommen über den ServiceStateWatcher
+FULL_REFRESH_INTERVAL = 60.0
+
+PENDING_STATES = {"START_PENDING", "STOP_PENDING", "CONTINUE_PENDING", "PAUSE_PENDING"}
+
+# NotifyServiceStatusChangeW (winsvc.h)
+SERVICE_NOTIFY_STATUS_CHANGE = 2
+SERVICE_NOTIFY_ALL_STATES = 0x7F | 0x200  # every SERVICE_NOTIFY_* state + DELETE_PENDING
+STATE_CODES = {name: code for code, name in SERVICE_STATES.items()}
+WAIT_IO_COMPLETION = 0xC0
+
+
+class AdaptivePollPolicy:
+    """
+    Fallback poll interval: fast while the service is in a *_PENDING state,
+    back to base on a change, then doubling up to maximum while it is stable.
+    """
+
+    def __init__(self, base=2.0, fast=0.5, maximum=60.0, factor=2.0):
+        self.base = base
+        self.fast = fast
+        self.maximum = maximum
+        self.factor = factor
+        self.current = base
+
+    def next_interval(self, state, changed):
+        if state in PENDING_STATES:
+            self.current = self.fast
+        elif changed:
+            self.current = self.base
+        else:
+            self.current = min(self.current * self.factor, self.maximum)
+        return self.current
+
+
+class ScmNotificationSource:
+    """
+    Service state change notifications from the SCM.
+
+    wait() registers NotifyServiceStatusChangeW and sleeps alertably, so the
+    SCM callback (an APC) runs on the calling thread. available turns False
+    when the API cannot be used; the watcher then polls instead.
+    """
+
+    def __init__(self, service_name=SERVICE_NAME):
+        self.service_name = service_name
+        self.available = os.name == "nt"
+        self._advapi32 = None
+        self._kernel32 = None
+        self._scm = None
+        self._svc = None
+        self._notify = None
+        self._callback = None
+        self._fired = False
+
+    def _setup(self):
+        class SERVICE_STATUS_PROCESS(ctypes.Structure):
+            _fields_ = SERVICE_STATUS._fields_ + [
+                ("dwProcessId", wintypes.DWORD),
+                ("dwServiceFlags", wintypes.DWORD),
+            ]
+
+        callback_type = ctypes.WINFUNCTYPE(None, ctypes.c_void_p)
+
+        class SERVICE_NOTIFYW(ctypes.Structure):
+            _fields_ = [
+                ("dwVersion", wintypes.DWORD),
+                ("pfnNotifyCallback", callback_type),
+                ("pContext", ctypes.c_void_p),
+                ("dwNotificationStatus", wintypes.DWORD),
+                ("ServiceStatus", SERVICE_STATUS_PROCESS),
+                ("dwNotificationTriggered", wintypes.DWORD),
+                ("pszServiceNames", wintypes.LPWSTR),
+            ]
+
+        self._notify_type = SERVICE_NOTIFYW
+        self._callback_type = callback_type
+        self._advapi32 = ctypes.WinDLL("advapi32", use_last_error=True)
+        self._kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        self._advapi32.OpenSCManagerW.restype = wintypes.HANDLE
+        self._advapi32.OpenServiceW.restype = wintypes.HANDLE
+        self._advapi32.OpenServiceW.argtypes = [wintypes.HANDLE, wintypes.LPCWSTR, wintypes.DWORD]
+        self._advapi32.CloseServiceHandle.argtypes = [wintypes.HANDLE]
+
+        self._scm = self._advapi32.OpenSCManagerW(None, None, SC_MANAGER_CONNECT)
+        if self._scm:
+            self._svc = self._advapi32.OpenServiceW(self._scm, self.service_name, SERVICE_QUERY_STATUS)
+        if not self._svc:
+            self.close()
+            self.available = False
+
+    def _register(self, current):
+        def on_notify(_):
+            self._fired = True
+
+        self._fired = False
+        self._callback = self._callback_type(on_notify)
+        self._notify = self._notify_type(
+            dwVersion=SERVICE_NOTIFY_STATUS_CHANGE,
+            pfnNotifyCallback=self._callback
+        )
+        # The SCM fires at once if the service is already in a requested
+        # state, so leave the current one out (SERVICE_NOTIFY_x == 1 << (x - 1))
+        mask = SERVICE_NOTIFY_ALL_STATES
+        if current in STATE_CODES:
+            mask &= ~(1 << (STATE_CODES[current] - 1))
+        err = self._advapi32.NotifyServiceStatusChangeW(
+            wintypes.HANDLE(self._svc), mask, ctypes.byref(self._notify)
+        )
+        if err != 0:
+            # e.g. ERROR_SERVICE_MARKED_FOR_DELETE – fall back to polling
+            self._notify = None
+            self.close()
+            self.available = False
+
+    def wait(self, timeout, current=None):
+        """Return the new SCM state name, or None on timeout."""
+        if not self.available:
+            return None
+        try:
+            if self._svc is None:
+                self._setup()
+            if self.available and self._notify is None:
+                self._register(current)
+            if not self.available:
+                return None
+
+            self._kernel32.SleepEx(int(timeout * 1000), True)
+            if not self._fired:
+                return None
+
+            state = SERVICE_STATES.get(self._notify.ServiceStatus.dwCurrentState, "UNKNOWN")
+            self._notify = None  # one-shot: register again on the next wait()
+            return state
+        except (AttributeError, OSError) as e:
+            print("Service notifications unavailable:", e)
+            self.available = False
+            return None
+
+    def close(self):
+        if self._advapi32 is not None:
+            if self._svc:
+                self._advapi32.CloseServiceHandle(self._svc)
+            if self._scm:
+                self._advapi32.CloseServiceHandle(self._scm)
+        self._svc = None
+        self._scm = None
+
+
+class FakeNotificationSource:
+    """Headless stand-in for ScmNotificationSource; push() simulates the SCM."""
+
+    def __init__(self, available=True):
+        self.available = available
+        self._queue = queue.Queue()
+
+    def push(self, state):
+        self._queue.put(state)
+
+    def wait(self, timeout, current=None):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        pass
+
+
+class ServiceStateWatcher(threading.Thread):
+    """
+    Calls on_change(state) whenever the service state changes.
+
+    Uses the notification source while it is available; otherwise polls the
+    service backend on the AdaptivePollPolicy schedule. Even with
+    notifications, a poll runs after max_wait as a safety net.
+    """
+
+    def __init__(self, on_change, source=None, backend=None, policy=None,
+                 service_name=SERVICE_NAME, max_wait=60.0):
+        super().__init__(name="ServiceStateWatcher", daemon=True)
+        self.on_change = on_change
+        self.source = source if source is not None else ScmNotificationSource(service_name)
+        self.backend = backend
+        self.policy = policy or AdaptivePollPolicy()
+        self.service_name = service_name
+        self.max_wait = max_wait
+        self.state = None
+        self.notifications = 0
+        self.polls = 0
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _poll(self):
+        self.polls += 1
+        backend = self.backend or service_backend
+        return backend.query(self.service_name).state
+
+    def _publish(self, state):
+        changed = state != self.state
+        if changed:
+            self.state = state
+            try:
+                self.on_change(state)
+            except Exception as e:
+                print("State change handler failed:", e)
+        return changed
+
+    def step(self):
+        """One watcher iteration; returns the seconds waited (for tests)."""
+        if self.source.available and self.state not in PENDING_STATES:
+            new_state = self.source.wait(self.max_wait, self.state)
+            if new_state is not None:
+                self.notifications += 1
+            else:
+                new_state = self._poll()
+            changed = self._publish(new_state)
+            self.policy.next_interval(self.state, changed)
+            return self.max_wait
+
+        # Polling fallback (also used to follow *_PENDING states closely)
+        interval = self.policy.current
+        if self._stopped.wait(interval):
+            return interval
+        changed = self._publish(self._poll())
+        self.policy.next_interval(self.state, changed)
+        return interval
+
+    def run(self):
+        self._publish(self._poll())
+        self.policy.next_interval(self.state, True)
+        try:
+            while not self._stopped.is_set():
+                self.step()
+        finally:
+            self.source.close()
+
+service_watcher = None
+
+# ---------------- Agent port probe ---------------- #
+
+PROBE_INTERVAL = 10.0
+PROBE_TIMEOUT = 1.0
+
+
+class LatencyHistogram:
+    """
+    Connect latencies (ms) of the last `window` probes in log-spaced buckets
+    (25% apart). record() is O(1), percentile() walks the ~60 buckets.
+    """
+
+    BOUNDS = tuple(0.05 * 1.25 ** i for i in range(60))  # 0.05 ms … ~30 s
+
+    def __init__(self, window=1000):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.samples = deque(maxlen=window)  # bucket index per sample
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms):
+        idx = bisect_left(self.BOUNDS, latency_ms)
+        with self._lock:
+            if len(self.samples) == self.samples.maxlen:
+                self.counts[self.samples[0]] -= 1
+            self.samples.append(idx)
+            self.counts[idx] += 1
+
+    def percentile(self, p):
+        """Upper bucket bound below which p% of the samples fall, or None."""
+        with self._lock:
+            total = len(self.samples)
+            if not total:
+                return None
+            rank = max(1, math.ceil(p / 100 * total))
+            seen = 0
+            for idx, count in enumerate(self.counts):
+                seen += count
+                if seen >= rank:
+                    return self.BOUNDS[idx] if idx < len(self.BOUNDS) else float("inf")
+        return None
+
+    def summary(self):
+        return {
+            "count": len(self.samples),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+@dataclass(frozen=True)
+class ProbeResult:
+    host: str
+    latency_ms: float | None  # None = not reachable
+    error: str | None = None
+
+
+### One TCP connect with latency measurement ###
+async def probe_tcp(host, port, timeout):
+    import asyncio
+
+    start = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError) as e:
+        return ProbeResult(host, None, str(e) or type(e).__name__)
+    latency_ms = (time.perf_counter() - start) * 1000
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return ProbeResult(host, latency_ms)
+
+
+### Loopback (IPv4 + IPv6) plus every address bound to this host ###
+def discover_probe_targets(port=AGENT_PORT):
+    targets = {"127.0.0.1", "::1"}
+    try:
+        for family, _, _, _, sockaddr in socket.getaddrinfo(
+            socket.gethostname(), port, proto=socket.IPPROTO_TCP
+        ):
+            if family in (socket.AF_INET, socket.AF_INET6):
+                targets.add(sockaddr[0])
+    except OSError:
+        pass
+    return sorted(targets)
+
+
+class PortProber:
+    """
+    Probes the agent port on all targets concurrently (asyncio, imported on
+    first use), off the Tk thread (sweep() runs in a scheduler lane every
+    PROBE_INTERVAL).
+    Latencies go into one LatencyHistogram per host; on_result(results)
+    gets every sweep.
+    """
+
+    def __init__(self, on_result=None, port=AGENT_PORT, timeout=PROBE_TIMEOUT, targets=None):
+        self.on_result = on_result
+        self.port = port
+        self.timeout = timeout
+        self.targets = targets
+        self.histograms = {}
+        self.last_results = []
+
+    async def _probe_all(self):
+        import asyncio
+
+        targets = self.targets or discover_probe_targets(self.port)
+        return await asyncio.gather(*(probe_tcp(host, self.port, self.timeout) for host in targets))
+
+    def probe_once(self):
+        import asyncio
+
+        results = asyncio.run(self._probe_all())
+        for r in results:
+            if r.latency_ms is not None:
+                self.histograms.setdefault(r.host, LatencyHistogram()).record(r.latency_ms)
+        self.last_results = results
+        return results
+
+    def sweep(self):
+        results = self.probe_once()
+        if self.on_result is not None:
+            self.on_result(results)
+        return results
+
+
+### Badge text, e.g. "Connected (2.1 ms p95)" ###
+def format_connection_status(results, histograms):
+    reachable = [r for r in results if r.latency_ms is not None]
+    if not reachable:
+        return "Not reachable"
+
+    # Prefer IPv4 loopback – that is what the badge always showed
+    ref = next((r for r in reachable if r.host == "127.0.0.1"), reachable[0])
+    p95 = histograms[ref.host].percentile(95) if ref.host in histograms else None
+    if p95 is None:
+        return "Connected"
+    return f"Connected ({p95:.1f} ms p95)"
+
+
+def on_probe_result(results):
+    record_port_metrics(results)
+
+    # History is sampled once per sweep (= poll resolution)
+    loopback = next((r for r in results if r.host == "127.0.0.1"), None)
+    status_history.record_latency(loopback.latency_ms if loopback else None)
+    status_history.record_state(service_watcher.state if service_watcher else None)
+
+    status_queue.put({
+        "connection": format_connection_status(results, port_prober.histograms),
+        "history": time.time(),
+    })
+
+port_prober = None
+
+# ---------------- Status history / sparklines ---------------- #
+
+HISTORY_SECONDS = 24 * 3600
+HISTORY_CAPACITY = int(HISTORY_SECONDS / PROBE_INTERVAL)  # one sample per probe sweep
+SPARKLINE_WIDTH = 160
+SPARKLINE_HEIGHT = 22
+
+
+class RingBuffer:
+    """
+    Fixed-size history in two flat arrays (values + timestamps) – no Python
+    object per sample. Memory is allocated once: capacity * (itemsize + 8).
+    """
+
+    def __init__(self, capacity=HISTORY_CAPACITY, typecode="f"):
+        self.capacity = capacity
+        self.values = array(typecode, bytes(array(typecode).itemsize * capacity))
+        self.times = array("d", bytes(8 * capacity))
+        self.size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def append(self, value, timestamp=None):
+        with self._lock:
+            self.values[self._next] = value
+            self.times[self._next] = time.time() if timestamp is None else timestamp
+            self._next = (self._next + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+
+    def snapshot(self, seconds=None):
+        """(times, values) arrays in chronological order, optionally the last `seconds`."""
+        with self._lock:
+            if self.size < self.capacity:
+                times = self.times[:self.size]
+                values = self.values[:self.size]
+            else:
+                times = self.times[self._next:] + self.times[:self._next]
+                values = self.values[self._next:] + self.values[:self._next]
+        if seconds is not None and times:
+            cut = bisect_left(times, times[-1] - seconds)
+            times, values = times[cut:], values[cut:]
+        return times, values
+
+
+### min / max / mean in one pass, percentiles via statistics.quantiles (NaN = no sample) ###
+def summarize_window(values):
+    import statistics  # pulls in decimal/fractions, not needed before the first redraw
+
+    finite = array("d")
+    low, high, total = math.inf, -math.inf, 0.0
+    for v in values:
+        if v != v:  # NaN
+            continue
+        finite.append(v)
+        total += v
+        if v < low:
+            low = v
+        if v > high:
+            high = v
+    if not finite:
+        return None
+    # 19 cut points in 5% steps: [9] is the median, [18] the 95th percentile
+    cuts = statistics.quantiles(finite, n=20, method="inclusive") if len(finite) > 1 else [low] * 19
+    return {
+        "min": low,
+        "max": high,
+        "mean": total / len(finite),
+        "p50": cuts[9],
+        "p95": cuts[18],
+    }
+
+
+### Reduce a window to one value per pixel column (max per column) ###
+def downsample(values, columns):
+    n = len(values)
+    if n <= columns:
+        return list(values)
+    step = n / columns
+    out = []
+    for c in range(columns):
+        chunk = [v for v in values[int(c * step):int((c + 1) * step)] if v == v]
+        out.append(max(chunk) if chunk else math.nan)
+    return out
+
+
+class StatusHistory:
+    """Last 24 h of service state, port latency and refresh duration."""
+
+    def __init__(self, capacity=HISTORY_CAPACITY):
+        self.state = RingBuffer(capacity, "b")    # SCM state code, 0 = unknown
+        self.latency = RingBuffer(capacity, "f")  # ms, NaN = not reachable
+        self.refresh = RingBuffer(capacity, "f")  # ms per status snapshot
+
+    def record_state(self, state):
+        self.state.append(STATE_CODES.get(state, 0))
+
+    def record_latency(self, latency_ms):
+        self.latency.append(math.nan if latency_ms is None else latency_ms)
+
+    def record_refresh(self, duration_ms):
+        self.refresh.append(duration_ms)
+
+status_history = StatusHistory()
+sparklines = {}  # name -> (Canvas, StringVar for the summary)
+
+
+def draw_line_sparkline(canvas, values, color):
+    canvas.delete("all")
+    points = downsample(values, SPARKLINE_WIDTH)
+    finite = [v for v in points if v == v]
+    if not finite:
+        return
+    top = max(finite) or 1.0
+    h = SPARKLINE_HEIGHT - 2
+    coords = []
+    for x, v in enumerate(points):
+        if v != v:
+            # gap (not reachable): flush the current segment
+            if len(coords) >= 4:
+                canvas.create_line(*coords, fill=color)
+            coords = []
+            continue
+        coords += [x, 1 + h - (v / top) * h]
+    if len(coords) >= 4:
+        canvas.create_line(*coords, fill=color)
+
+
+def draw_state_sparkline(canvas, codes, th):
+    canvas.delete("all")
+    columns = downsample(array("f", codes), SPARKLINE_WIDTH)
+    running = STATE_CODES["RUNNING"]
+    for x, code in enumerate(columns):
+        if code != code or code == 0:
+            continue
+        if code == running:
+            color = th["badge_green_bg"]
+        elif SERVICE_STATES.get(int(code)) in PENDING_STATES:
+            color = th["badge_yellow_bg"]
+        else:
+            color = th["badge_red_bg"]
+        canvas.create_line(x, 2, x, SPARKLINE_HEIGHT - 2, fill=color)
+
+
+### Redraw all sparklines (Tk thread only) ###
+def draw_sparklines():
+    if not sparklines:
+        return
+    th = THEME[current_theme]
+
+    for name, (canvas, summary_var) in sparklines.items():
+        canvas.configure(bg=th["card"])
+        if name == "state":
+            _, codes = status_history.state.snapshot()
+            draw_state_sparkline(canvas, codes, th)
+            running = STATE_CODES["RUNNING"]
+            up = sum(1 for c in codes if c == running)
+            summary_var.set(f"{up / len(codes) * 100:.1f}% running (24 h)" if codes else "")
+            continue
+
+        buffer = status_history.latency if name == "latency" else status_history.refresh
+        _, values = buffer.snapshot()
+        draw_line_sparkline(canvas, values, th["accent"])
+        stats = summarize_window(values)
+        summary_var.set(
+            f"min {stats['min']:.1f} / avg {stats['mean']:.1f} / p95 {stats['p95']:.1f} / max {stats['max']:.1f} ms"
+            if stats else ""
+        )
+
+# ---------------- Fleet mode ---------------- #
+
+# Eine Zeile pro Host: "host[:port] [Anzeigename]", IPv6 als [addr]:port
+FLEET_INVENTORY_FILE = os.path.join(
+    os.environ.get("ProgramData", r"C:\ProgramData"),
+    "beszel-agent",
+    "fleet.txt"
+)
+FLEET_CONCURRENCY = 64
+FLEET_TIMEOUT = 2.0
+FLEET_NEGATIVE_TTL = 60.0   # unreachable hosts are not re-probed before this
+FLEET_INTERVAL = 30.0
+
+
+@dataclass(frozen=True)
+class FleetHost:
+    host: str
+    port: int = AGENT_PORT
+    name: str = ""
+
+
+@dataclass(frozen=True)
+class FleetResult:
+    latency_ms: float | None
+    error: str | None
+    checked: float          # time.time() of the real probe
+    cached: bool = False    # served from the negative cache
+
+
+### Parse a fleet inventory file ###
+def load_fleet_inventory(path=FLEET_INVENTORY_FILE):
+    hosts = []
+    with open(path, "r", encoding="utf-8") as f:
+        for raw in f:
+            line = raw.split("#", 1)[0].strip()
+            if not line:
+                continue
+            address, _, name = line.partition(" ")
+            port = AGENT_PORT
+            if address.startswith("["):
+                host, _, rest = address[1:].partition("]")
+                if rest.startswith(":"):
+                    port = int(rest[1:])
+            elif address.count(":") == 1:
+                host, port_str = address.split(":")
+                port = int(port_str)
+            else:
+                host = address
+            hosts.append(FleetHost(host, port, name.strip() or host))
+    return hosts
+
+
+class FleetProber:
+    """
+    Probes many agents with at most `concurrency` connects in flight.
+
+    A failed host is remembered for negative_ttl seconds and reported from
+    that cache instead of costing another full timeout on every sweep.
+    """
+
+    def __init__(self, hosts, concurrency=FLEET_CONCURRENCY, timeout=FLEET_TIMEOUT,
+                 negative_ttl=FLEET_NEGATIVE_TTL):
+        self.hosts = list(hosts)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.negative_ttl = negative_ttl
+        self.results = {}
+        self.histograms = {}
+        self.last_sweep_seconds = None
+        self._negative = {}  # FleetHost -> monotonic expiry
+
+    async def _probe(self, semaphore, fleet_host, force):
+        expiry = self._negative.get(fleet_host)
+        if not force and expiry is not None and time.monotonic() < expiry:
+            return fleet_host, replace(self.results[fleet_host], cached=True)
+
+        async with semaphore:
+            r = await probe_tcp(fleet_host.host, fleet_host.port, self.timeout)
+
+        if r.latency_ms is None:
+            self._negative[fleet_host] = time.monotonic() + self.negative_ttl
+        else:
+            self._negative.pop(fleet_host, None)
+            self.histograms.setdefault(fleet_host, LatencyHistogram(window=100)).record(r.latency_ms)
+        return fleet_host, FleetResult(r.latency_ms, r.error, time.time())
+
+    async def _sweep(self, force):
+        import asyncio
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*(self._probe(semaphore, h, force) for h in self.hosts))
+
+    def sweep(self, force=False):
+        import asyncio
+
+        start = time.perf_counter()
+        self.results.update(asyncio.run(self._sweep(force)))
+        self.last_sweep_seconds = time.perf_counter() - start
+        return dict(self.results)
+
+
+class FleetWindow:
+    """Table of all inventory hosts, swept in a background thread."""
+
+    COLUMNS = ("host", "port", "status", "latency", "checked")
+
+    def __init__(self, master, inventory_file=FLEET_INVENTORY_FILE):
+        self.prober = None
+        self.updates = queue.Queue()
+        self._wake = threading.Event()
+        self._force = False
+        self._closed = threading.Event()
+
+        self.win = tk.Toplevel(master)
+        self.win.title("Beszel Agent – Fleet")
+        self.win.geometry("900x550")
+        self.win.configure(bg=THEME[current_theme]["bg"])
+        self.win.protocol("WM_DELETE_WINDOW", self.close)
+
+        toolbar = ttk.Frame(self.win, style="Main.TFrame")
+        toolbar.pack(fill="x", padx=10, pady=(10, 0))
+        ttk.Button(toolbar, text="Load inventory…", style="Ghost.TButton", command=self.choose_inventory)\
+            .pack(side="left")
+        ttk.Button(toolbar, text="Refresh now", style="Ghost.TButton", command=self.refresh_now)\
+            .pack(side="left", padx=(6, 0))
+
+        self.summary_var = tk.StringVar(value="No inventory loaded.")
+        ttk.Label(toolbar, textvariable=self.summary_var, style="SubHeader.TLabel")\
+            .pack(side="right")
+
+        self.tree = ttk.Treeview(self.win, columns=self.COLUMNS, show="headings")
+        for col, width in zip(self.COLUMNS, (260, 70, 140, 120, 120)):
+            self.tree.heading(col, text=col.capitalize())
+            self.tree.column(col, width=width, anchor="w")
+        self.tree.pack(fill="both", expand=True, padx=10, pady=10)
+
+        threading.Thread(target=self._sweep_loop, name="FleetSweep", daemon=True).start()
+        self.win.after(200, self._apply_updates)
+
+        if os.path.exists(inventory_file):
+            self.load_inventory(inventory_file)
+
+    def choose_inventory(self):
+        path = filedialog.askopenfilename(
+            parent=self.win,
+            title="Fleet inventory",
+            filetypes=[("Inventory", "*.txt *.lst"), ("All files", "*.*")]
+        )
+        if path:
+            self.load_inventory(path)
+
+    def load_inventory(self, path):
+        try:
+            hosts = load_fleet_inventory(path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Fleet", f"Could not read inventory:\n{e}", parent=self.win)
+            return
+
+        self.prober = FleetProber(hosts)
+        self.tree.delete(*self.tree.get_children())
+        for i, h in enumerate(hosts):
+            self.tree.insert("", "end", iid=str(i), values=(h.name, h.port, "Checking…", "", ""))
+        self.summary_var.set(f"{len(hosts)} hosts")
+        self.refresh_now()
+
+    def refresh_now(self):
+        self._force = True
+        self._wake.set()
+
+    def close(self):
+        self._closed.set()
+        self._wake.set()
+        self.win.destroy()
+
+    def _sweep_loop(self):
+        while not self._closed.is_set():
+            prober = self.prober
+            if prober is not None:
+                force, self._force = self._force, False
+                try:
+                    results = prober.sweep(force=force)
+                    self.updates.put((prober, results))
+                except Exception as e:
+                    print("Fleet sweep failed:", e)
+            self._wake.wait(FLEET_INTERVAL)
+            self._wake.clear()
+
+    def _apply_updates(self):
+        if self._closed.is_set():
+            return
+        try:
+            while True:
+                prober, results = self.updates.get_nowait()
+                if prober is not self.prober:
+                    continue  # inventory was replaced meanwhile
+                self._show(prober, results)
+        except queue.Empty:
+            pass
+        self.win.after(200, self._apply_updates)
+
+    def _show(self, prober, results):
+        reachable = 0
+        for i, h in enumerate(prober.hosts):
+            r = results.get(h)
+            if r is None:
+                continue
+            if r.latency_ms is not None:
+                reachable += 1
+                status = "Connected"
+                p95 = prober.histograms[h].percentile(95)
+                latency = f"{r.latency_ms:.1f} ms (p95 {p95:.1f})"
+            else:
+                status = "Not reachable (cached)" if r.cached else "Not reachable"
+                latency = ""
+            checked = time.strftime("%H:%M:%S", time.localtime(r.checked))
+            self.tree.item(str(i), values=(h.name, h.port, status, latency, checked))
+
+        self.summary_var.set(
+            f"{reachable}/{len(prober.hosts)} reachable – sweep took {prober.last_sweep_seconds:.1f} s"
+        )
+
+
+### Open fleet window ###
+def open_fleet_window():
+    FleetWindow(root)
+
+# ---------------- Diagnostics window ---------------- #
+
+DIAGNOSTICS_REFRESH_MS = 1000
+
+
+### Everything a bug report needs, as one JSON-serialisable dict ###
+def collect_diagnostics():
+    return {
+        "exported": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version,
+        "frozen": FROZEN,
+        "probes": probe_timings.snapshot(),
+        "scheduler": refresh_scheduler.stats() if refresh_scheduler else {},
+        "version_resolver": version_resolver.stats(),
+        "registry_cache": parameters_cache.stats(),
+        "service_watcher": {
+            "state": service_watcher.state,
+            "notifications": service_watcher.notifications,
+            "polls": service_watcher.polls,
+        } if service_watcher else {},
+    }
+
+
+class DiagnosticsWindow:
+    """Live probe timing table (Ctrl+Shift+D), exportable as JSON."""
+
+    COLUMNS = ("probe", "calls", "errors", "last_ms", "avg_ms", "max_ms", "total_ms")
+
+    def __init__(self, master):
+        self.win = tk.Toplevel(master)
+        self.win.title("Beszel Agent – Diagnostics")
+        self.win.geometry("820x360")
+        self.win.configure(bg=THEME[current_theme]["bg"])
+
+        toolbar = ttk.Frame(self.win, style="Main.TFrame")
+        toolbar.pack(fill="x", padx=10, pady=(10, 0))
+        ttk.Button(toolbar, text="Export JSON…", style="Ghost.TButton", command=self.export)\
+            .pack(side="left")
+        ttk.Button(toolbar, text="Reset", style="Ghost.TButton", command=probe_timings.reset)\
+            .pack(side="left", padx=(6, 0))
+
+        self.summary_var = tk.StringVar()
+        ttk.Label(toolbar, textvariable=self.summary_var, style="SubHeader.TLabel")\
+            .pack(side="right")
+
+        self.tree = ttk.Treeview(self.win, columns=self.COLUMNS, show="headings")
+        for col, width in zip(self.COLUMNS, (260, 70, 70, 90, 90, 90, 100)):
+            self.tree.heading(col, text=col.replace("_ms", " (ms)").capitalize())
+            self.tree.column(col, width=width, anchor="w" if col == "probe" else "e")
+        self.tree.pack(fill="both", expand=True, padx=10, pady=10)
+
+        self._refresh()
+
+    def _refresh(self):
+        if not self.win.winfo_exists():
+            return
+        rows = probe_timings.snapshot()
+        self.tree.delete(*self.tree.get_children())
+        for row in rows:
+            tags = ("error",) if row["errors"] else ()
+            self.tree.insert("", "end", values=[row[c] for c in self.COLUMNS], tags=tags)
+        self.tree.tag_configure("error", foreground=THEME[current_theme]["badge_red_fg"])
+        self.summary_var.set(f"{len(rows)} probes – {sum(r['calls'] for r in rows)} calls")
+        self.win.after(DIAGNOSTICS_REFRESH_MS, self._refresh)
+
+    def export(self):
+        path = filedialog.asksaveasfilename(
+            parent=self.win,
+            title="Export diagnostics",
+            defaultextension=".json",
+            initialfile=f"beszel-diagnostics-{time.strftime('%Y%m%d-%H%M%S')}.json",
+            filetypes=[("JSON", "*.json"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(collect_diagnostics(), f, indent=2)
+        except OSError as e:
+            messagebox.showerror("Diagnostics", f"Could not write file:\n{e}", parent=self.win)
+
+diagnostics_window = None
+
+
+### Hidden: only reachable via Ctrl+Shift+D ###
+def open_diagnostics_window(event=None):
+    global diagnostics_window
+    if diagnostics_window is not None and diagnostics_window.win.winfo_exists():
+        diagnostics_window.win.lift()
+        return
+    diagnostics_window = DiagnosticsWindow(root)
+
+# ---------------- Background jobs ---------------- #
+
+SERVICE_START_TIMEOUT = 30.0
+SERVICE_STOP_TIMEOUT = 30.0
+AGENT_UPDATE_TIMEOUT = 300.0
+SERVICE_WAIT_POLL = 0.25
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """One background action; func(job) reports progress via job.report()."""
+
+    def __init__(self, key, title, func, on_event):
+        self.key = key
+        self.title = title
+        self.func = func
+        self.on_event = on_event
+        self.state = "pending"   # pending / running / done / failed / cancelled
+        self.started = None
+        self.finished = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    def report(self, message):
+        self.on_event(self, message)
+
+    def sleep(self, seconds):
+        """Sleep that ends early with JobCancelled when the user cancels."""
+        if self.cancel_event.wait(seconds):
+            raise JobCancelled()
+
+
+class JobManager:
+    """
+    Runs jobs in worker threads. Only one job per key can be active, so
+    e.g. a second restart while the first one is pending is rejected.
+    """
+
+    def __init__(self, on_event):
+        self.on_event = on_event
+        self.active = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, title, func):
+        """Start the job; returns None if a job with this key is still active."""
+        with self._lock:
+            if key in self.active:
+                return None
+            job = Job(key, title, func, self.on_event)
+            self.active[key] = job
+        threading.Thread(target=self._run, args=(job,), name=f"Job-{key}", daemon=True).start()
+        return job
+
+    def running(self, key):
+        with self._lock:
+            return self.active.get(key)
+
+    def cancel(self, key=None):
+        with self._lock:
+            if key is None:
+                jobs = list(self.active.values())
+            else:
+                jobs = [self.active[key]] if key in self.active else []
+        for job in jobs:
+            job.cancel_event.set()
+
+    def _run(self, job):
+        job.state = "running"
+        job.started = time.monotonic()
+        job.report("Started…")
+        try:
+            message = job.func(job) or "Done."
+            job.state = "done"
+        except JobCancelled:
+            message = "Cancelled."
+            job.state = "cancelled"
+        except Exception as e:
+            message = str(e) or type(e).__name__
+            job.state = "failed"
+        job.finished = time.monotonic()
+        with self._lock:
+            self.active.pop(job.key, None)
+        job.report(message)
+
+
+### Poll the service until it reaches `target` or the deadline passes ###
+def wait_for_service_state(job, target, timeout, service_name=SERVICE_NAME):
+    deadline = time.monotonic() + timeout
+    while True:
+        state = service_backend.query(service_name).state
+        if state == target:
+            return state
+        if time.monotonic() >= deadline:
+            raise TimeoutError(
+                f"Service did not reach {target} within {timeout:.0f} s (last state: {state})."
+            )
+        job.report(f"Waiting for {target} (currently {state})…")
+        job.sleep(SERVICE_WAIT_POLL)
+
+
+def start_service_job(job):
+    job.report("Starting service…")
+    service_backend.start(SERVICE_NAME)
+    wait_for_service_state(job, "RUNNING", SERVICE_START_TIMEOUT)
+    return "Service started."
+
+
+def stop_service_job(job):
+    job.report("Stopping service…")
+    service_backend.stop(SERVICE_NAME)
+    wait_for_service_state(job, "STOPPED", SERVICE_STOP_TIMEOUT)
+    return "Service stopped."
+
+
+def restart_service_job(job):
+    # Only start again once the SCM really reports STOPPED
+    stop_service_job(job)
+    start_service_job(job)
+    return "Service restarted."
+
+
+def update_agent_job(job, install_dir):
+    agent_exe = os.path.join(install_dir, "beszel-agent.exe")
+    job.report("Running beszel-agent update…")
+    metrics.inc("beszel_process_spawns_total", command="agent-update")
+    proc = subprocess.Popen(
+        [agent_exe, "update"],
+        cwd=install_dir,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        stdin=subprocess.DEVNULL,
+        text=True,
         creationflags=CREATE_NO_WINDOW
     )
+    deadline = time.monotonic() + AGENT_UPDATE_TIMEOUT
+    while True:
+        try:
+            output, _ = proc.communicate(timeout=0.5)
+            break
+        except subprocess.TimeoutExpired:
+            if job.cancel_event.is_set():
+                proc.kill()
+                proc.communicate()
+                raise JobCancelled()
+            if time.monotonic() >= deadline:
+                proc.kill()
+                proc.communicate()
+                raise TimeoutError(f"Update did not finish within {AGENT_UPDATE_TIMEOUT:.0f} s.")
+            job.report("Running beszel-agent update…")
+
+    if proc.returncode != 0:
+        raise RuntimeError(f"Error:\n{output}")
+    return "Beszel Agent has been updated."
+
+
+### Forward job progress to the Tk thread ###
+def on_job_event(job, message):
+    update = {"job": f"{job.title}: {message} ({job.elapsed:.1f} s)"}
+    if job.finished is not None:
+        update["job_result"] = (job.title, job.state, message)
+    status_queue.put(update)
+
+
+job_manager = JobManager(on_job_event)
+
+
+def submit_job(key, title, func):
+    if job_manager.submit(key, title, func) is None:
+        running = job_manager.running(key)
+        messagebox.showwarning(
+            "Busy",
+            f"{running.title if running else title} is still in progress."
+        )
+
+
+def cancel_jobs():
+    job_manager.cancel()
+
+
+### Show the final result of a job (Tk thread) ###
+def show_job_result(title, state, message):
     refresh_all()
-    messagebox.showinfo("Service", "Service started.")
+    if state == "done":
+        messagebox.showinfo(title, message)
+    elif state == "failed":
+        messagebox.showerror(f"{title} failed", message)
+
+# ---------------- GUI actions ---------------- #
+### Service control functions ###
+def start_service():
+    submit_job("service", "Start service", start_service_job)
+
 def stop_service():
-    subprocess.run(
-        ["sc", "stop", SERVICE_NAME],
-        creationflags=CREATE_NO_WINDOW
-    )
-    refresh_all()
-    messagebox.showinfo("Service", "Service stopped.")
+    submit_job("service", "Stop service", stop_service_job)
+
 def restart_service():
-    subprocess.run(
-        ["sc", "stop", SERVICE_NAME],
-        creationflags=CREATE_NO_WINDOW
-    )
-    subprocess.run(
-        ["sc", "start", SERVICE_NAME],
-        creationflags=CREATE_NO_WINDOW
-    )
-    refresh_all()
-    messagebox.showinfo("Service", "Service restarted.")
+    submit_job("service", "Restart service", restart_service_job)
 
 ### Open installation directory ###
 def open_install_directory():
@@ -288,6 +2232,525 @@ def open_install_directory():
     except Exception as e:
         messagebox.showerror("Error", f"Could not open directory:\n{e}")
 
+# ---------------- Log viewer ---------------- #
+
+LOG_INITIAL_BYTES = 64 * 1024   # tail shown when the window opens
+LOG_PAGE_BYTES = 64 * 1024      # older content loaded per scroll-up
+LOG_MAX_READ_BYTES = 256 * 1024 # max. new bytes appended per follow tick
+LOG_MAX_LINES = 5000            # lines kept in the Text widget
+LOG_FOLLOW_MS = 1000
+
+
+class LogTail:
+    """
+    Byte-offset window [start, end) over a growing log file.
+
+    Only complete lines are returned, as (text, byte_length) tuples, so the
+    viewer can drop lines again and move the window accordingly.
+    """
+
+    def __init__(self, path, initial_bytes=LOG_INITIAL_BYTES, page_bytes=LOG_PAGE_BYTES):
+        self.path = path
+        self.initial_bytes = initial_bytes
+        self.page_bytes = page_bytes
+        self.start = 0
+        self.end = 0
+
+    def _size(self):
+        return os.path.getsize(self.path)
+
+    def _read(self, offset, size):
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return f.read(size)
+
+    @staticmethod
+    def _split(data):
+        lines = []
+        for raw in data.splitlines(keepends=True):
+            text = raw.decode("utf-8", errors="ignore").rstrip("\r\n") + "\n"
+            lines.append((text, len(raw)))
+        return lines
+
+    def read_tail(self):
+        size = self._size()
+        start = max(0, size - self.initial_bytes)
+        data = self._read(start, size - start)
+
+        # Started mid-line: skip the partial first line
+        if start > 0:
+            idx = data.find(b"\n")
+            if idx >= 0:
+                start += idx + 1
+                data = data[idx + 1:]
+
+        # Keep a trailing partial line for the next read_new()
+        complete = data[:data.rfind(b"\n") + 1]
+        self.start = start
+        self.end = start + len(complete)
+        return self._split(complete)
+
+    def read_new(self, max_bytes=LOG_MAX_READ_BYTES):
+        """New complete lines since the last call; None if the file shrank."""
+        size = self._size()
+        if size < self.end:
+            return None
+        data = self._read(self.end, min(size - self.end, max_bytes))
+        complete = data[:data.rfind(b"\n") + 1]
+        self.end += len(complete)
+        return self._split(complete)
+
+    def read_older(self):
+        """The page of lines directly before start ([] at the top of the file)."""
+        page = self.page_bytes
+        while self.start > 0:
+            begin = max(0, self.start - page)
+            data = self._read(begin, self.start - begin)
+            if begin > 0:
+                idx = data.find(b"\n")
+                if idx < 0:
+                    page *= 2  # single line longer than a page
+                    continue
+                begin += idx + 1
+                data = data[idx + 1:]
+            self.start = begin
+            return self._split(data)
+        return []
+
+    def read_from(self, offset):
+        """Move the window to offset (a line start) and read one page forward."""
+        page = self.page_bytes
+        while True:
+            data = self._read(offset, page)
+            if b"\n" in data or len(data) < page:
+                break
+            page *= 2  # single line longer than a page
+        complete = data[:data.rfind(b"\n") + 1]
+        self.start = offset
+        self.end = offset + len(complete)
+        return self._split(complete)
+
+    def drop_head(self, nbytes):
+        self.start += nbytes
+
+    def drop_tail(self, nbytes):
+        self.end -= nbytes
+
+
+LOG_INDEX_MAGIC = 0x58444E494C5A5342  # b"BSZLINDX"
+LOG_SCAN_CHUNK = 4 * 1024 * 1024
+LOG_MAX_MATCHES = 10000
+LOG_JUMP_CONTEXT = 20
+
+
+class LineIndex:
+    """
+    Start offset of every line of a log file, kept in an array("Q").
+
+    Persisted next to the log as <log>.idx (header: magic, indexed bytes)
+    and extended incrementally, so only bytes appended since the last
+    update() are scanned. offset_of() is O(1), line_for_offset() O(log n).
+    """
+
+    def __init__(self, log_file, index_file=None):
+        self.log_file = log_file
+        self.index_file = index_file or log_file + ".idx"
+        self.offsets = array("Q", [0])
+        self.indexed = 0
+        self._lock = threading.Lock()
+        self._update_lock = threading.Lock()  # one scanner at a time
+        self._load()
+
+    def _load(self):
+        data = array("Q")
+        try:
+            with open(self.index_file, "rb") as f:
+                data.frombytes(f.read())
+        except (OSError, ValueError):
+            return
+        if len(data) >= 3 and data[0] == LOG_INDEX_MAGIC and data[2] == 0:
+            self.indexed = data[1]
+            self.offsets = data[2:]
+
+    def save(self):
+        with self._lock:
+            payload = array("Q", [LOG_INDEX_MAGIC, self.indexed]).tobytes() + self.offsets.tobytes()
+        tmp_file = f"{self.index_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_file, self.index_file)
+        except OSError as e:
+            print("Could not write log index:", e)
+
+    def update(self, cancel=None):
+        """Index bytes appended since the last call. Returns True if it grew."""
+        with self._update_lock:
+            return self._update(cancel)
+
+    def _update(self, cancel):
+        size = os.path.getsize(self.log_file)
+        if size < self.indexed:
+            # Truncated / recreated log – rebuild from scratch
+            with self._lock:
+                self.offsets = array("Q", [0])
+                self.indexed = 0
+        if size == self.indexed:
+            return False
+
+        with open(self.log_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = self.indexed
+            while pos < size:
+                if cancel is not None and cancel.is_set():
+                    break
+                end = min(size, pos + LOG_SCAN_CHUNK)
+                chunk = mm[pos:end]
+                found = array("Q")
+                i = chunk.find(b"\n")
+                while i >= 0:
+                    found.append(pos + i + 1)
+                    i = chunk.find(b"\n", i + 1)
+                with self._lock:
+                    self.offsets.extend(found)
+                    self.indexed = end
+                pos = end
+
+        self.save()
+        return True
+
+    def line_count(self):
+        with self._lock:
+            # Last offset == indexed means "next line not written yet"
+            if self.offsets[-1] >= self.indexed:
+                return len(self.offsets) - 1
+            return len(self.offsets)
+
+    def offset_of(self, line_no):
+        """Byte offset of 0-based line_no, or None if it is not indexed (yet)."""
+        if line_no < 0 or line_no >= self.line_count():
+            return None
+        with self._lock:
+            return self.offsets[line_no]
+
+    def line_for_offset(self, offset):
+        with self._lock:
+            return bisect_right(self.offsets, offset) - 1
+
+    def line_span(self, line_no):
+        with self._lock:
+            start = self.offsets[line_no]
+            end = self.offsets[line_no + 1] if line_no + 1 < len(self.offsets) else self.indexed
+        return start, end
+
+
+class LogSearch(threading.Thread):
+    """
+    Regex search over the memory-mapped log in a worker thread.
+
+    Results are streamed into out_queue as ("matches", [(line_no, text), ...])
+    batches while scanning, followed by ("done", count) or ("error", message).
+    Only the first match per line is reported.
+    """
+
+    def __init__(self, index, pattern, out_queue, ignore_case=True, max_matches=LOG_MAX_MATCHES):
+        super().__init__(name="LogSearch", daemon=True)
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+        # Raises re.error for invalid patterns – before the thread starts
+        self.regex = re.compile(pattern.encode("utf-8"), flags)
+        self.index = index
+        self.out_queue = out_queue
+        self.max_matches = max_matches
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        try:
+            count = self._search()
+            self.out_queue.put(("done", count))
+        except (OSError, ValueError) as e:
+            self.out_queue.put(("error", str(e)))
+
+    def _search(self):
+        self.index.update(self.cancelled)
+        size = self.index.indexed
+        if size == 0:
+            return 0
+
+        count = 0
+        last_line = -1
+        with open(self.index.log_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = 0
+            while pos < size and not self.cancelled.is_set():
+                # Chunks end on a line boundary, so no match is split
+                end = min(size, pos + LOG_SCAN_CHUNK)
+                if end < size:
+                    boundary = self.index.offset_of(self.index.line_for_offset(end))
+                    end = boundary if boundary and boundary > pos else end
+
+                batch = []
+                for m in self.regex.finditer(mm, pos, end):
+                    line_no = self.index.line_for_offset(m.start())
+                    if line_no == last_line:
+                        continue
+                    last_line = line_no
+                    start, stop = self.index.line_span(line_no)
+                    text = mm[start:stop].decode("utf-8", errors="ignore").rstrip("\r\n")
+                    batch.append((line_no, text))
+                    count += 1
+                    if count >= self.max_matches:
+                        break
+
+                if batch:
+                    self.out_queue.put(("matches", batch))
+                if count >= self.max_matches:
+                    break
+                pos = end
+        return count
+
+
+class LogViewer:
+    """
+    Toplevel that follows install.log and pages older lines in on scroll-up.
+    Search and "go to line" use the persisted LineIndex.
+    """
+
+    def __init__(self, master, log_file, max_lines=LOG_MAX_LINES):
+        self.tail = LogTail(log_file)
+        self.index = LineIndex(log_file)
+        self.max_lines = max_lines
+        self.line_sizes = deque()  # byte length of every line in the widget
+        self._loading_older = False
+        self.search = None
+        self.match_lines = []
+
+        self.win = tk.Toplevel(master)
+        self.win.title("Beszel Agent – Log file")
+        self.win.geometry("800x600")
+        self.win.bind("<Destroy>", self._on_destroy)
+
+        th = THEME[current_theme]
+
+        # Search / go-to toolbar
+        toolbar = ttk.Frame(self.win, style="Main.TFrame")
+        toolbar.pack(fill="x", padx=10, pady=(10, 0))
+
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(toolbar, textvariable=self.search_var, width=40)
+        search_entry.pack(side="left")
+        search_entry.bind("<Return>", lambda _: self.start_search())
+        ttk.Button(toolbar, text="Search", style="Ghost.TButton", command=self.start_search)\
+            .pack(side="left", padx=(6, 0))
+        ttk.Button(toolbar, text="Stop", style="Ghost.TButton", command=self.stop_search)\
+            .pack(side="left", padx=(6, 0))
+
+        self.line_var = tk.StringVar()
+        line_entry = ttk.Entry(toolbar, textvariable=self.line_var, width=10)
+        line_entry.bind("<Return>", lambda _: self.go_to_line())
+        ttk.Button(toolbar, text="Go to line", style="Ghost.TButton", command=self.go_to_line)\
+            .pack(side="right")
+        line_entry.pack(side="right", padx=(0, 6))
+
+        self.search_status_var = tk.StringVar(value="")
+        ttk.Label(self.win, textvariable=self.search_status_var, style="SubHeader.TLabel")\
+            .pack(anchor="w", padx=10)
+
+        self.results = tk.Listbox(
+            self.win,
+            height=6,
+            font=("Consolas", 9),
+            bg=th["card"],
+            fg=th["text"],
+            activestyle="none"
+        )
+        self.results.pack(side="bottom", fill="x", padx=10, pady=(0, 10))
+        self.results.bind("<<ListboxSelect>>", self._on_match_selected)
+
+        self.txt = scrolledtext.ScrolledText(
+            self.win,
+            wrap="word",
+            font=("Consolas", 10),
+            bg=th["card"],
+            fg=th["text"],
+            insertbackground=th["text"]
+        )
+        self.txt.pack(fill="both", expand=True, padx=10, pady=10)
+
+        # Scrollbar updates tell us when the top of the widget is reached
+        self._set_scrollbar = self.txt.vbar.set
+        self.txt.configure(yscrollcommand=self._on_scroll)
+
+        self.txt.tag_configure("jump", background=th["badge_yellow_bg"], foreground=th["badge_yellow_fg"])
+
+        self._append(self.tail.read_tail())
+        self.txt.config(state="disabled")
+        self.txt.see("end")
+        self.win.after(LOG_FOLLOW_MS, self._follow)
+
+        # Bring the line index up to date without blocking the window
+        threading.Thread(target=self._update_index, daemon=True).start()
+
+    def _update_index(self):
+        try:
+            self.index.update()
+        except (OSError, ValueError) as e:
+            print("Log index update failed:", e)
+
+    def _on_destroy(self, event):
+        if event.widget is self.win:
+            self.stop_search()
+
+    # ---------- Search / jump ---------- #
+
+    def start_search(self):
+        pattern = self.search_var.get()
+        if not pattern:
+            return
+        self.stop_search()
+
+        try:
+            self.search = LogSearch(self.index, pattern, queue.Queue())
+        except re.error as e:
+            messagebox.showerror("Search", f"Invalid regular expression:\n{e}", parent=self.win)
+            return
+
+        self.results.delete(0, "end")
+        self.match_lines = []
+        self.search_status_var.set("Searching…")
+        self.search.start()
+        self.win.after(100, self._drain_search, self.search)
+
+    def stop_search(self):
+        if self.search is not None:
+            self.search.cancel()
+            self.search = None
+
+    def _drain_search(self, search):
+        if search is not self.search or not self.win.winfo_exists():
+            return  # superseded or window closed
+
+        try:
+            while True:
+                kind, payload = search.out_queue.get_nowait()
+                if kind == "matches":
+                    for line_no, text in payload:
+                        self.match_lines.append(line_no)
+                        self.results.insert("end", f"{line_no + 1:>8}: {text}")
+                    self.search_status_var.set(f"Searching… {len(self.match_lines)} matches")
+                elif kind == "done":
+                    self.search_status_var.set(f"{payload} matches")
+                    self.search = None
+                    return
+                else:
+                    self.search_status_var.set(f"Search failed: {payload}")
+                    self.search = None
+                    return
+        except queue.Empty:
+            pass
+
+        self.win.after(100, self._drain_search, search)
+
+    def _on_match_selected(self, _):
+        selection = self.results.curselection()
+        if selection:
+            self.jump_to_line(self.match_lines[selection[0]])
+
+    def go_to_line(self):
+        try:
+            line_no = int(self.line_var.get()) - 1
+        except ValueError:
+            return
+        self.jump_to_line(line_no)
+
+    def jump_to_line(self, line_no):
+        """Show 0-based line_no with some context, highlighted (O(1) via index)."""
+        first = max(0, line_no - LOG_JUMP_CONTEXT)
+        offset = self.index.offset_of(first)
+        if self.index.offset_of(line_no) is None:
+            self.search_status_var.set(f"Line {line_no + 1} is not indexed (yet).")
+            return
+
+        self.txt.config(state="normal")
+        self.txt.delete("1.0", "end")
+        self.line_sizes.clear()
+        self._append(self.tail.read_from(offset))
+        self.txt.config(state="disabled")
+
+        row = line_no - first + 1
+        self.txt.tag_remove("jump", "1.0", "end")
+        self.txt.tag_add("jump", f"{row}.0", f"{row}.end")
+        self.txt.yview(f"{max(1, row - 3)}.0")
+
+    def _at_bottom(self):
+        return self.txt.yview()[1] >= 1.0
+
+    def _append(self, lines):
+        if not lines:
+            return
+        self.txt.insert("end-1c", "".join(text for text, _ in lines))
+        self.line_sizes.extend(size for _, size in lines)
+
+        # Cap: forget the oldest lines (they can be paged in again)
+        excess = len(self.line_sizes) - self.max_lines
+        if excess > 0:
+            self.txt.delete("1.0", f"{excess + 1}.0")
+            self.tail.drop_head(sum(self.line_sizes.popleft() for _ in range(excess)))
+
+    def _prepend(self, lines):
+        if not lines:
+            return
+        self.txt.insert("1.0", "".join(text for text, _ in lines))
+        self.line_sizes.extendleft(size for _, size in reversed(lines))
+
+        # Cap: forget the newest lines; _follow() reads them again later
+        excess = len(self.line_sizes) - self.max_lines
+        if excess > 0:
+            keep = len(self.line_sizes) - excess
+            self.txt.delete(f"{keep + 1}.0", "end-1c")
+            self.tail.drop_tail(sum(self.line_sizes.pop() for _ in range(excess)))
+
+        # Keep the line the user was looking at in view
+        self.txt.yview(f"{len(lines) + 1}.0")
+
+    def _on_scroll(self, first, last):
+        self._set_scrollbar(first, last)
+        if float(first) <= 0.0 and self.tail.start > 0 and not self._loading_older:
+            self._loading_older = True
+            self.win.after_idle(self._load_older)
+
+    def _load_older(self):
+        try:
+            self.txt.config(state="normal")
+            self._prepend(self.tail.read_older())
+            self.txt.config(state="disabled")
+        finally:
+            self._loading_older = False
+
+    def _follow(self):
+        if not self.win.winfo_exists():
+            return
+
+        # Only follow while the user looks at the end of the log
+        if self._at_bottom():
+            try:
+                lines = self.tail.read_new()
+            except OSError:
+                lines = []
+
+            self.txt.config(state="normal")
+            if lines is None:
+                # File was truncated/recreated – start over
+                self.txt.delete("1.0", "end")
+                self.line_sizes.clear()
+                lines = self.tail.read_tail()
+            self._append(lines)
+            self.txt.config(state="disabled")
+            if lines:
+                self.txt.see("end")
+
+        self.win.after(LOG_FOLLOW_MS, self._follow)
+
 ### Open logs directory ###
 def open_logs_window():
     install_path = get_install_path()
@@ -306,26 +2769,8 @@ def open_logs_window():
         messagebox.showwarning("Logs", f"Log file not found at:\n{log_file}")
         return
 
-    with open(log_file, "r", encoding="utf-8", errors="ignore") as f:
-        content = f.read()
-
-    win = tk.Toplevel(root)
-    win.title("Beszel Agent – Log file")
-    win.geometry("800x500")
-
-    th = THEME[current_theme]
-
-    txt = scrolledtext.ScrolledText(
-        win,
-        wrap="word",
-        font=("Consolas", 10),
-        bg=th["card"],
-        fg=th["text"],
-        insertbackground=th["text"]
-    )
-    txt.pack(fill="both", expand=True, padx=10, pady=10)
-    txt.insert("1.0", content)
-    txt.config(state="disabled")
+    # Tail + follow instead of reading the whole (ever-growing) file
+    LogViewer(root, log_file)
 
 ### Open environment variables window ###
 def open_env_window():
@@ -366,45 +2811,44 @@ def refresh_status_badge():
 
 ### Refresh all displayed information ###
 def refresh_all():
-    status = get_service_status()
-    start_type = get_start_type()
-    path = get_install_path()
-    version = get_installed_agent_version(os.path.join(path, "beszel-agent.exe"))
-
-    status_var.set(status)
-    starttype_var.set(start_type)
-    path_var.set(path)
-    version_var.set(version)
-
-    agent_exe = os.path.join(path, "beszel-agent.exe")
-    installed = get_installed_agent_version(agent_exe)
-    latest = get_github_latest_version()
-
-    status = compare_versions(installed, latest)
-
-    agent_installed_var.set(installed or "Unknown")
-    agent_latest_var.set(latest or "Failed to check")
-
-    # NEW: Only indicate update availability (no URLs)
-    if status == "Up to date":
-        update_available_var.set("✔ Agent is up to date")
-    else:
-        update_available_var.set("⚠ Update available")
+    # Probing happens in the StatusPoller thread; just ask for a fresh snapshot
+    if refresh_scheduler is not None:
+        refresh_scheduler.request("status")
+
+### Apply changed status fields to the UI (Tk thread only) ###
+def apply_status_diff(diff):
+    for field, value in diff.items():
+        var = status_vars.get(field)
+        if var is not None:
+            var.set(value)
+
+    if "status" in diff:
+        refresh_status_badge()
+    if "connection" in diff:
+        update_connection_badge()
+    if "history" in diff:
+        draw_sparklines()
+    if "job_result" in diff:
+        show_job_result(*diff["job_result"])
 
-    refresh_status_badge()
-    update_connection_badge()
+### Drain the poller queue on the Tk event loop ###
+def process_status_queue():
+    try:
+        while True:
+            apply_status_diff(status_queue.get_nowait())
+    except queue.Empty:
+        pass
 
-    # Auto-refresh every 5 seconds
-    root.after(5000, refresh_all)
+    root.after(100, process_status_queue)
 
 ### Update connection badge to beszel agent port ###
 def update_connection_badge():
     th = THEME[current_theme]
     status = connection_status_var.get()
 
-    if status == "Connected":
+    if status.startswith("Connected"):
         connection_badge.configure(
-            text="Connected",
+            text=status,
             bg=th["badge_green_bg"],
             fg=th["badge_green_fg"]
         )
@@ -423,14 +2867,9 @@ def update_connection_badge():
 
 ### Run connection test to beszel agent port ###
 def run_connection_test():
-    ok = test_agent_connection()
-
-    if ok:
-        connection_status_var.set("Connected")
-    else:
-        connection_status_var.set("Not reachable")
-
-    update_connection_badge()
+    # Result arrives via on_probe_result() → status queue
+    if refresh_scheduler is not None:
+        refresh_scheduler.request("port")
 
 ### Update beszel agent ###
 def update_beszel_agent():
@@ -455,70 +2894,95 @@ def update_beszel_agent():
         )
         return
 
-    update_command = (
-        f'powershell -Command "& {{'
-        f'Set-Location -Path \'{install_dir}\'; '
-        f'./beszel-agent.exe update }}"'
-    )
-
-    try:
-        result = subprocess.run(
-            update_command,
-            shell=True,
-            capture_output=True,
-            text=True
-        )
+    # Runs in a worker; progress shows up next to the action buttons
+    submit_job("update", "Agent update", lambda job: update_agent_job(job, install_dir))
 
-        if result.returncode == 0:
-            messagebox.showinfo(
-                "Update successful",
-                "Beszel Agent has been updated."
-            )
-        else:
-            messagebox.showerror(
-                "Update failed",
-                f"Error:\n{result.stdout}\n{result.stderr}"
-            )
+### Read InstalledVersion written by the installer ###
+@timed
+def read_installed_version_value():
+    value = parameters_cache.get().get("InstalledVersion")
+    if value:
+        return str(value).strip()
+    return None
 
-    except Exception as e:
-        messagebox.showerror("Update failed", str(e))
-
-### Get installed agent version from registry or by running agent.exe ###
-def get_installed_agent_version(agent_path):
-    try:
-        key = winreg.OpenKey(
-            winreg.HKEY_LOCAL_MACHINE,
-            r"SYSTEM\CurrentControlSet\Services\beszelagent\Parameters",
-            0,
-            winreg.KEY_READ
-        )
-        value, _ = winreg.QueryValueEx(key, "InstalledVersion")
-        if value:
-            return value.strip()
-    except Exception:
-        pass  # ignore, fallback below
-
-    # ---------------------------
-    # 2) Fallback: run agent.exe
-    # ---------------------------
+### Ask agent.exe itself (slow: new process + AV scan) ###
+@timed
+def probe_agent_version(agent_path):
     if agent_path and os.path.exists(agent_path):
         try:
+            metrics.inc("beszel_process_spawns_total", command="agent-version")
             result = subprocess.run(
                 [agent_path, "--version"],
                 capture_output=True,
-                text=True
+                text=True,
+                timeout=15,
+                creationflags=CREATE_NO_WINDOW
             )
             output = (result.stdout or "").strip()
 
             if output and "version" in output.lower():
                 return output
-        except:
+        except Exception:
             pass
+    return None
+
+class AgentVersionResolver:
+    """
+    Memoizes the installed agent version.
 
-    # ---------------------------
-    # 3) If everything fails
-    # ---------------------------
-    return "Unknown"
+    The cache key is (path, size, mtime, InstalledVersion), so agent.exe is
+    only started again after the binary or the registry value changed.
+    """
+
+    def __init__(self, read_registry=read_installed_version_value, probe=probe_agent_version):
+        self.read_registry = read_registry
+        self.probe = probe
+        self.hits = 0
+        self.misses = 0
+        self._cache = {}  # normalized path -> (key, version)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stat_key(agent_path):
+        try:
+            st = os.stat(agent_path)
+        except (OSError, TypeError, ValueError):
+            return None
+        return (st.st_size, st.st_mtime_ns)
+
+    def resolve(self, agent_path):
+        registry_value = self.read_registry()
+        path = os.path.normcase(os.path.abspath(agent_path)) if agent_path else ""
+        key = (self._stat_key(agent_path), registry_value)
+
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is not None and cached[0] == key:
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        # 1) Registry, 2) Fallback: run agent.exe, 3) If everything fails
+        version = registry_value or self.probe(agent_path) or "Unknown"
+
+        with self._lock:
+            self._cache[path] = (key, version)
+        return version
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+version_resolver = AgentVersionResolver()
+
+### Get installed agent version from registry or by running agent.exe ###
+@timed
+def get_installed_agent_version(agent_path):
+    return version_resolver.resolve(agent_path)
 
 # ---------------- THEME APPLY ---------------- #
 
@@ -561,6 +3025,8 @@ def apply_theme(theme_name):
     if connection_badge is not None:
         update_connection_badge()
 
+    draw_sparklines()
+
 
 def toggle_theme():
     if current_theme == "light":
@@ -569,208 +3035,523 @@ def toggle_theme():
         apply_theme("light")
 
 
-# ---------------- GUI SETUP ---------------- #
+# ---------------- Startup diagnostics ---------------- #
 
-root = tk.Tk()
-icon_path = os.path.join(os.path.dirname(__file__), "beszelagent.ico")
+FROZEN = getattr(sys, "frozen", False)
+# Script budget: 100 ms from process start until the module is imported (interpreter alone ~25 ms)
+SCRIPT_BUDGET_MS = 100
+# PyInstaller --onefile unpacks itself to %TEMP% first; that extraction gets its own allowance
+FROZEN_BUDGET_MS = 1500
+STARTUP_BUDGET_MS = float(os.environ.get("BESZEL_STARTUP_BUDGET_MS", FROZEN_BUDGET_MS if FROZEN else SCRIPT_BUDGET_MS))
+STARTUP_RUNS = 5
+# Heavy modules that must not be loaded before they are actually used
+LAZY_MODULES = ("requests", "urllib3", "tkinter", "asyncio", "zipfile", "argparse", "statistics")
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
 
-try:
-    root.iconbitmap(icon_path)
-except Exception as e:
-    print("Could not set icon:", e)
-root.title("Beszel Agent – Control Center")
-root.minsize(900, 480)
 
-# Windows-typische Schrift
-default_font = ("Segoe UI", 10)
-root.option_add("*Font", default_font)
+### Windowed (PyInstaller --noconsole) builds have no stdout ###
+def attach_parent_console():
+    if sys.stdout is not None or os.name != "nt":
+        return
+    if ctypes.windll.kernel32.AttachConsole(-1):  # ATTACH_PARENT_PROCESS
+        sys.stdout = open("CONOUT$", "w", encoding="utf-8")
+        sys.stderr = sys.stdout
+
+
+### Command line that starts this program again (script or frozen exe) ###
+def self_command(*args):
+    if FROZEN:
+        return [sys.executable, *args]
+    return [sys.executable, os.path.abspath(__file__), *args]
+
+
+### Cold start = fresh process per run that exits right after the imports ###
+def measure_cold_start(runs=STARTUP_RUNS):
+    samples, eager = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run(
+            self_command("--startup-probe"),
+            capture_output=True, text=True, creationflags=CREATE_NO_WINDOW if os.name == "nt" else 0
+        )
+        samples.append((time.perf_counter() - start) * 1000)
+        try:
+            eager = json.loads(proc.stdout)
+        except ValueError:
+            pass
+    return sorted(samples), eager
 
-style = ttk.Style()
-try:
-    style.theme_use("clam")
-except tk.TclError:
-    pass
 
-# Grund-Styles (werden von apply_theme überschrieben)
-style.configure("Main.TFrame", background="#f3f3f3")
-style.configure("Card.TFrame", background="#ffffff", borderwidth=1, relief="solid")
-style.configure("Header.TLabel", font=("Segoe UI Semibold", 16))
-style.configure("SubHeader.TLabel", font=("Segoe UI", 10))
-style.configure("Accent.TButton", font=("Segoe UI Semibold", 10), padding=(14, 6))
-style.configure("Ghost.TButton", padding=(12, 5))
-
-outer = ttk.Frame(root, style="Main.TFrame", padding=20)
-outer.pack(fill="both", expand=True)
-
-# Header
-header = ttk.Frame(outer, style="Main.TFrame")
-header.pack(fill="x", pady=(0, 15))
-
-header_left = ttk.Frame(header, style="Main.TFrame")
-header_left.pack(side="left", fill="x", expand=True)
-
-ttk.Label(
-    header_left,
-    text="Beszel Agent Control Center",
-    style="Header.TLabel"
-).pack(anchor="w")
-
-ttk.Label(
-    header_left,
-    text="Monitor and control the Beszel Agent Windows service.",
-    style="SubHeader.TLabel"
-).pack(anchor="w", pady=(2, 0))
-
-header_right = ttk.Frame(header, style="Main.TFrame")
-header_right.pack(side="right")
-
-dark_btn = ttk.Button(
-    header_right,
-    text="Toggle dark mode",
-    style="Ghost.TButton",
-    command=toggle_theme
-)
-dark_btn.pack(anchor="e")
-
-# Info Card
-info_card = ttk.Frame(outer, style="Card.TFrame", padding=15)
-info_card.pack(fill="x", pady=(0, 15))
-
-status_var = tk.StringVar()
-starttype_var = tk.StringVar()
-path_var = tk.StringVar()
-version_var = tk.StringVar()
-connection_status_var = tk.StringVar(value="Unknown")
-
-# Agent update system variables
-agent_installed_var = tk.StringVar(value="Unknown")
-agent_latest_var = tk.StringVar(value="Checking…")
-agent_update_url_var = tk.StringVar(value="")
-update_available_var = tk.StringVar(value="")
-
-# ------------------------------
-# UPDATE SECTION (separate frame)
-# ------------------------------
-update_frame = ttk.Frame(outer, style="Card.TFrame", padding=15)
-update_frame.pack(fill="x", pady=(0, 15))
-
-ttk.Label(update_frame, text="Installed Agent Version:", style="Body.TLabel")\
-    .pack(anchor="w", pady=(0, 0))
-ttk.Label(update_frame, textvariable=agent_installed_var, style="Subtle.TLabel")\
-    .pack(anchor="w", pady=(0, 8))
-
-ttk.Label(update_frame, text="Latest Agent Version:", style="Body.TLabel")\
-    .pack(anchor="w", pady=(0, 0))
-ttk.Label(update_frame, textvariable=agent_latest_var, style="Subtle.TLabel")\
-    .pack(anchor="w", pady=(0, 8))
-
-ttk.Button(
-    update_frame,
-    text="Download Latest Agent",
-    style="Accent.TButton",
-    command=download_latest_agent
-).pack(anchor="w", pady=(8, 0))
-
-# Service status row
-status_label = ttk.Label(info_card, text="Service status:", font=("Segoe UI", 10, "bold"))
-status_label.grid(row=0, column=0, sticky="w")
-
-status_badge = tk.Label(
-    info_card,
-    textvariable=status_var,
-    padx=8,
-    pady=2,
-    bd=0,
-    relief="flat",
-    highlightthickness=0
-)
-status_badge.grid(row=0, column=1, sticky="w", padx=(8,0))
+### -X importtime breakdown of the top-level imports (not available frozen) ###
+def measure_import_times(top=15):
+    if FROZEN:
+        return None
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", os.path.abspath(__file__), "--startup-probe"],
+        capture_output=True, text=True, creationflags=CREATE_NO_WINDOW if os.name == "nt" else 0
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = IMPORTTIME_LINE.match(line)
+        if m and len(m.group(3)) == 1:  # one space = imported directly by us / site
+            rows.append({"module": m.group(4), "self_us": int(m.group(1)), "cumulative_us": int(m.group(2))})
+    rows.sort(key=lambda r: r["cumulative_us"], reverse=True)
+    return rows[:top]
+
+
+def startup_report(runs=STARTUP_RUNS, budget_ms=STARTUP_BUDGET_MS):
+    samples, eager = measure_cold_start(runs)
+    median = samples[len(samples) // 2]
+    return {
+        "frozen": FROZEN,
+        "runs": runs,
+        "median_ms": round(median, 1),
+        "min_ms": round(samples[0], 1),
+        "max_ms": round(samples[-1], 1),
+        "budget_ms": budget_ms,
+        "eager_modules": eager,
+        "within_budget": median <= budget_ms and not eager,
+        "imports": measure_import_times(),
+    }
 
-# Start type
-ttk.Label(info_card, text="Start type:", font=("Segoe UI", 10, "bold")).grid(
-    row=1, column=0, sticky="w", pady=(6, 0)
-)
-ttk.Label(info_card, textvariable=starttype_var).grid(
-    row=1, column=1, sticky="w", padx=(8, 0), pady=(6, 0)
-)
 
-# Install path
-ttk.Label(info_card, text="Install path:", font=("Segoe UI", 10, "bold")).grid(
-    row=2, column=0, sticky="nw", pady=(6, 0)
+def format_startup_report(report):
+    lines = [
+        f"Cold start: median {report['median_ms']:.1f} ms "
+        f"(min {report['min_ms']:.1f}, max {report['max_ms']:.1f}, {report['runs']} runs)",
+        f"Budget:     {report['budget_ms']:.0f} ms – {'OK' if report['within_budget'] else 'EXCEEDED'}",
+        f"Loaded too early: {', '.join(report['eager_modules']) or 'none'}",
+    ]
+    if report["imports"]:
+        lines.append("")
+        lines.append(f"{'cumulative':>12} {'self':>10}  module")
+        for row in report["imports"]:
+            lines.append(f"{row['cumulative_us'] / 1000:>9.1f} ms {row['self_us'] / 1000:>7.1f} ms  {row['module']}")
+    return "\n".join(lines)
+
+
+### --startup-probe (used by the benchmark) / --startup-report [--json] ###
+def run_startup_diagnostics(argv):
+    if argv[0] == "--startup-probe":
+        loaded = set(sys.modules) - PRELOADED_MODULES
+        print(json.dumps([name for name in LAZY_MODULES if name in loaded]))
+        return 0
+
+    attach_parent_console()
+    report = startup_report()
+    print(json.dumps(report) if "--json" in argv else format_startup_report(report), flush=True)
+    return 0 if report["within_budget"] else 1
+
+
+# ---------------- Headless CLI ---------------- #
+
+CLI_USAGE_EPILOG = (
+    "Exit code: 0 = service RUNNING and agent port reachable, "
+    "1 = otherwise, 2 = usage error. "
+    "--startup-report [--json] benchmarks the cold start against the budget. "
+    "--metrics serves Prometheus metrics until Ctrl+C."
 )
-path_label = ttk.Label(info_card, textvariable=path_var, wraplength=540, justify="left")
-path_label.grid(row=2, column=1, sticky="w", padx=(8, 0), pady=(6, 0))
 
-# Version
-ttk.Label(info_card, text="Agent version:", font=("Segoe UI", 10, "bold")).grid(
-    row=3, column=0, sticky="w", pady=(6, 0)
-)
-ttk.Label(info_card, textvariable=version_var).grid(
-    row=3, column=1, sticky="w", padx=(8, 0), pady=(6, 0)
-)
 
-# Connection test
-ttk.Label(info_card, text="Agent port:", font=("Segoe UI", 10, "bold")).grid(
-    row=6, column=0, sticky="w", pady=(6, 0)
-)
-ttk.Label(info_card, text=str(AGENT_PORT)).grid(
-    row=6, column=1, sticky="w", padx=(8, 0), pady=(6, 0)
-)
+### Install path may be the agent.exe itself (NSSM Application) or its folder ###
+def resolve_agent_exe(path):
+    if path.lower().endswith(".exe"):
+        return path
+    return os.path.join(path, "beszel-agent.exe")
+
+
+### Machine-readable status snapshot (same probes as the GUI) ###
+def build_status_report(check_latest=True):
+    service = query_service()
+    path = get_install_path(service)
+    installed = get_installed_agent_version(resolve_agent_exe(path))
+    latest = get_github_latest_version() if check_latest else None
+
+    results = PortProber(targets=["127.0.0.1", "::1"]).probe_once()
+    reachable = [r for r in results if r.latency_ms is not None]
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "service": {
+            "name": SERVICE_NAME,
+            "exists": service.exists,
+            "state": service.state,
+            "status": get_service_status(service),
+            "start_type": service.start_type,
+            "start_type_label": get_start_type(service),
+            "path": service.application,
+        },
+        "version": {
+            "installed": None if installed == "Unknown" else installed,
+            "latest": latest,
+            "status": compare_versions(installed, latest),
+        },
+        "port": {
+            "port": AGENT_PORT,
+            "reachable": bool(reachable),
+            "latency_ms": round(min(r.latency_ms for r in reachable), 3) if reachable else None,
+            "probes": {r.host: r.error or "ok" for r in results},
+        },
+    }
+
+
+def format_status_report(report):
+    service, version, port = report["service"], report["version"], report["port"]
+    connection = f"Connected ({port['latency_ms']:.1f} ms)" if port["reachable"] else "Not reachable"
+    return "\n".join([
+        f"Service status:  {service['status']}",
+        f"Start type:      {service['start_type_label']}",
+        f"Install path:    {service['path'] or 'Unknown'}",
+        f"Installed:       {version['installed'] or 'Unknown'}",
+        f"Latest:          {version['latest'] or 'Unknown'}  ({version['status']})",
+        f"Agent port:      {port['port']} – {connection}",
+    ])
+
+
+def report_is_healthy(report):
+    return report["service"]["state"] == "RUNNING" and report["port"]["reachable"]
+
+
+### Headless exporter: same scheduler lanes as the GUI, without Tk ###
+def serve_metrics(port, bind):
+    global metrics_server
+    prober = PortProber(record_port_metrics)
+    scheduler = RefreshScheduler()
+    scheduler.add("status", collect_status_snapshot, FULL_REFRESH_INTERVAL)
+    scheduler.add("port", prober.sweep, PROBE_INTERVAL)
+    scheduler.start()
+    ServiceStateWatcher(lambda state: scheduler.request("status")).start()
+
+    metrics_server = start_metrics_server(port, bind)
+    print(f"Serving metrics on http://{bind}:{port}/metrics", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        scheduler.stop()
+        metrics_server.shutdown()
+        return 0
+
+
+def run_cli(argv):
+    if argv[0] in ("--startup-probe", "--startup-report"):
+        return run_startup_diagnostics(argv)
+
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="BeszelAgentControlCenter",
+        description="Beszel Agent status without the GUI.",
+        epilog=CLI_USAGE_EPILOG
+    )
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--status", action="store_true", help="print one status snapshot")
+    mode.add_argument("--watch", action="store_true", help="print a snapshot every --interval seconds")
+    mode.add_argument("--metrics", action="store_true", help="serve /metrics (Prometheus) until interrupted")
+    parser.add_argument("--json", action="store_true", help="JSON output (one object per line with --watch)")
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between snapshots (--watch)")
+    parser.add_argument("--no-latest", action="store_true", help="skip the GitHub release lookup")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT or METRICS_DEFAULT_PORT,
+                        help="port for --metrics (default 45877)")
+    parser.add_argument("--metrics-bind", default=METRICS_BIND, help="address to listen on (--metrics)")
+    args = parser.parse_args(argv)
+
+    attach_parent_console()
+
+    if args.metrics:
+        return serve_metrics(args.metrics_port, args.metrics_bind)
+
+    def emit(report):
+        if args.json:
+            print(json.dumps(report), flush=True)
+        else:
+            print(format_status_report(report), flush=True)
+
+    if args.status:
+        report = build_status_report(check_latest=not args.no_latest)
+        emit(report)
+        return 0 if report_is_healthy(report) else 1
+
+    try:
+        while True:
+            emit(build_status_report(check_latest=not args.no_latest))
+            if not args.json:
+                print(flush=True)
+            time.sleep(max(0.5, args.interval))
+    except KeyboardInterrupt:
+        return 0
+
+# ---------------- GUI SETUP ---------------- #
+
+if __name__ == "__main__":
+    # Headless mode (--status / --watch): no tkinter, no UAC prompt
+    if len(sys.argv) > 1 and sys.argv[1].startswith("-"):
+        sys.exit(run_cli(sys.argv[1:]))
+
+    ensure_admin()
+
+    import tkinter as tk
+    from tkinter import ttk, scrolledtext, messagebox, filedialog
+
+    root = tk.Tk()
+    icon_path = os.path.join(os.path.dirname(__file__), "beszelagent.ico")
+
+    try:
+        root.iconbitmap(icon_path)
+    except Exception as e:
+        print("Could not set icon:", e)
+    root.title("Beszel Agent – Control Center")
+    root.minsize(900, 480)
+    root.bind_all("<Control-Shift-D>", open_diagnostics_window)
+
+    # Windows-typische Schrift
+    default_font = ("Segoe UI", 10)
+    root.option_add("*Font", default_font)
+
+    style = ttk.Style()
+    try:
+        style.theme_use("clam")
+    except tk.TclError:
+        pass
+
+    # Grund-Styles (werden von apply_theme überschrieben)
+    style.configure("Main.TFrame", background="#f3f3f3")
+    style.configure("Card.TFrame", background="#ffffff", borderwidth=1, relief="solid")
+    style.configure("Header.TLabel", font=("Segoe UI Semibold", 16))
+    style.configure("SubHeader.TLabel", font=("Segoe UI", 10))
+    style.configure("Accent.TButton", font=("Segoe UI Semibold", 10), padding=(14, 6))
+    style.configure("Ghost.TButton", padding=(12, 5))
+
+    outer = ttk.Frame(root, style="Main.TFrame", padding=20)
+    outer.pack(fill="both", expand=True)
+
+    # Header
+    header = ttk.Frame(outer, style="Main.TFrame")
+    header.pack(fill="x", pady=(0, 15))
+
+    header_left = ttk.Frame(header, style="Main.TFrame")
+    header_left.pack(side="left", fill="x", expand=True)
+
+    ttk.Label(
+        header_left,
+        text="Beszel Agent Control Center",
+        style="Header.TLabel"
+    ).pack(anchor="w")
+
+    ttk.Label(
+        header_left,
+        text="Monitor and control the Beszel Agent Windows service.",
+        style="SubHeader.TLabel"
+    ).pack(anchor="w", pady=(2, 0))
+
+    header_right = ttk.Frame(header, style="Main.TFrame")
+    header_right.pack(side="right")
+
+    dark_btn = ttk.Button(
+        header_right,
+        text="Toggle dark mode",
+        style="Ghost.TButton",
+        command=toggle_theme
+    )
+    dark_btn.pack(anchor="e")
+
+    # Info Card
+    info_card = ttk.Frame(outer, style="Card.TFrame", padding=15)
+    info_card.pack(fill="x", pady=(0, 15))
+
+    status_var = tk.StringVar()
+    starttype_var = tk.StringVar()
+    path_var = tk.StringVar()
+    version_var = tk.StringVar()
+    connection_status_var = tk.StringVar(value="Unknown")
+
+    # Agent update system variables
+    agent_installed_var = tk.StringVar(value="Unknown")
+    agent_latest_var = tk.StringVar(value="Checking…")
+    agent_update_url_var = tk.StringVar(value="")
+    update_available_var = tk.StringVar(value="")
+
+    # ------------------------------
+    # UPDATE SECTION (separate frame)
+    # ------------------------------
+    update_frame = ttk.Frame(outer, style="Card.TFrame", padding=15)
+    update_frame.pack(fill="x", pady=(0, 15))
+
+    ttk.Label(update_frame, text="Installed Agent Version:", style="Body.TLabel")\
+        .pack(anchor="w", pady=(0, 0))
+    ttk.Label(update_frame, textvariable=agent_installed_var, style="Subtle.TLabel")\
+        .pack(anchor="w", pady=(0, 8))
+
+    ttk.Label(update_frame, text="Latest Agent Version:", style="Body.TLabel")\
+        .pack(anchor="w", pady=(0, 0))
+    ttk.Label(update_frame, textvariable=agent_latest_var, style="Subtle.TLabel")\
+        .pack(anchor="w", pady=(0, 8))
 
-ttk.Label(info_card, text="Connection:", font=("Segoe UI", 10, "bold")).grid(
-    row=7, column=0, sticky="w", pady=(6, 0)
-)
-connection_badge = tk.Label(
-    info_card,
-    textvariable=connection_status_var,
-    padx=8,
-    pady=2,
-    bd=0,
-    relief="flat",
-    highlightthickness=0
-)
-connection_badge.grid(row=7, column=1, sticky="w", padx=(8, 0), pady=(6, 0))
-
-for i in range(2):
-    info_card.columnconfigure(i, weight=1)
-
-# Actions Card
-actions_card = ttk.Frame(outer, style="Card.TFrame", padding=15)
-actions_card.pack(fill="x")
-
-btn_row = ttk.Frame(actions_card, style="Card.TFrame")
-btn_row.pack(fill="x", pady=5)
-
-button_list = [
-    ("Start service", start_service, "Accent.TButton"),
-    ("Stop service", stop_service, "Ghost.TButton"),
-    ("Restart service", restart_service, "Ghost.TButton"),
-    ("View log file", open_logs_window, "Ghost.TButton"),
-    ("View environment variables", open_env_window, "Ghost.TButton"),
-    ("Open install directory", open_install_directory, "Ghost.TButton"),
-    ("Test connection", run_connection_test, "Ghost.TButton"),
-    #("Update agent", update_beszel_agent, "Ghost.TButton"),
-]
-
-col = 0
-row = 0
-buttons_per_row = 3
-
-for text, cmd, style_name in button_list:
     ttk.Button(
-        btn_row,
-        text=text,
-        style=style_name,
-        command=cmd
-    ).pack(side="left", padx=6, pady=6)
-
-# Initial theme + first refresh
-root.update_idletasks()
-apply_theme("dark")  # oder "light", wenn du standardmäßig Light willst
-refresh_all()
-update_connection_badge()
-# Run agent update check after UI is initialized
-root.after(500, trigger_agent_update_check)
-root.geometry(f"{root.winfo_reqwidth()}x{root.winfo_reqheight()}")
-root.mainloop()
-###
\ No newline at end of file
+        update_frame,
+        text="Download Latest Agent",
+        style="Accent.TButton",
+        command=download_latest_agent
+    ).pack(anchor="w", pady=(8, 0))
+
+    # Service status row
+    status_label = ttk.Label(info_card, text="Service status:", font=("Segoe UI", 10, "bold"))
+    status_label.grid(row=0, column=0, sticky="w")
+
+    status_badge = tk.Label(
+        info_card,
+        textvariable=status_var,
+        padx=8,
+        pady=2,
+        bd=0,
+        relief="flat",
+        highlightthickness=0
+    )
+    status_badge.grid(row=0, column=1, sticky="w", padx=(8,0))
+
+    # Start type
+    ttk.Label(info_card, text="Start type:", font=("Segoe UI", 10, "bold")).grid(
+        row=1, column=0, sticky="w", pady=(6, 0)
+    )
+    ttk.Label(info_card, textvariable=starttype_var).grid(
+        row=1, column=1, sticky="w", padx=(8, 0), pady=(6, 0)
+    )
+
+    # Install path
+    ttk.Label(info_card, text="Install path:", font=("Segoe UI", 10, "bold")).grid(
+        row=2, column=0, sticky="nw", pady=(6, 0)
+    )
+    path_label = ttk.Label(info_card, textvariable=path_var, wraplength=540, justify="left")
+    path_label.grid(row=2, column=1, sticky="w", padx=(8, 0), pady=(6, 0))
+
+    # Version
+    ttk.Label(info_card, text="Agent version:", font=("Segoe UI", 10, "bold")).grid(
+        row=3, column=0, sticky="w", pady=(6, 0)
+    )
+    ttk.Label(info_card, textvariable=version_var).grid(
+        row=3, column=1, sticky="w", padx=(8, 0), pady=(6, 0)
+    )
+
+    # Connection test
+    ttk.Label(info_card, text="Agent port:", font=("Segoe UI", 10, "bold")).grid(
+        row=6, column=0, sticky="w", pady=(6, 0)
+    )
+    ttk.Label(info_card, text=str(AGENT_PORT)).grid(
+        row=6, column=1, sticky="w", padx=(8, 0), pady=(6, 0)
+    )
+
+    ttk.Label(info_card, text="Connection:", font=("Segoe UI", 10, "bold")).grid(
+        row=7, column=0, sticky="w", pady=(6, 0)
+    )
+    connection_badge = tk.Label(
+        info_card,
+        textvariable=connection_status_var,
+        padx=8,
+        pady=2,
+        bd=0,
+        relief="flat",
+        highlightthickness=0
+    )
+    connection_badge.grid(row=7, column=1, sticky="w", padx=(8, 0), pady=(6, 0))
+
+    ttk.Label(info_card, text="Refresh time:", font=("Segoe UI", 10, "bold")).grid(
+        row=8, column=0, sticky="w", pady=(6, 0)
+    )
+
+    # 24h-Sparklines (Service-Status, Port-Latenz, Refresh-Dauer)
+    for name, row in (("state", 0), ("latency", 7), ("refresh", 8)):
+        canvas = tk.Canvas(
+            info_card,
+            width=SPARKLINE_WIDTH,
+            height=SPARKLINE_HEIGHT,
+            highlightthickness=0,
+            bd=0
+        )
+        canvas.grid(row=row, column=2, sticky="e", padx=(8, 0), pady=(6, 0))
+        summary_var = tk.StringVar()
+        ttk.Label(info_card, textvariable=summary_var, width=32).grid(
+            row=row, column=3, sticky="w", padx=(6, 0), pady=(6, 0)
+        )
+        sparklines[name] = (canvas, summary_var)
+
+    for i in range(2):
+        info_card.columnconfigure(i, weight=1)
+
+    # Actions Card
+    actions_card = ttk.Frame(outer, style="Card.TFrame", padding=15)
+    actions_card.pack(fill="x")
+
+    btn_row = ttk.Frame(actions_card, style="Card.TFrame")
+    btn_row.pack(fill="x", pady=5)
+
+    # Fortschritt laufender Aktionen (Start/Stop/Restart/Update)
+    job_status_var = tk.StringVar(value="")
+    job_row = ttk.Frame(actions_card, style="Card.TFrame")
+    job_row.pack(fill="x", pady=(0, 5))
+    ttk.Label(job_row, textvariable=job_status_var).pack(side="left", padx=6)
+    ttk.Button(job_row, text="Cancel", style="Ghost.TButton", command=cancel_jobs)\
+        .pack(side="right", padx=6)
+
+    button_list = [
+        ("Start service", start_service, "Accent.TButton"),
+        ("Stop service", stop_service, "Ghost.TButton"),
+        ("Restart service", restart_service, "Ghost.TButton"),
+        ("View log file", open_logs_window, "Ghost.TButton"),
+        ("View environment variables", open_env_window, "Ghost.TButton"),
+        ("Open install directory", open_install_directory, "Ghost.TButton"),
+        ("Test connection", run_connection_test, "Ghost.TButton"),
+        ("Fleet view", open_fleet_window, "Ghost.TButton"),
+        #("Update agent", update_beszel_agent, "Ghost.TButton"),
+    ]
+
+    col = 0
+    row = 0
+    buttons_per_row = 3
+
+    for text, cmd, style_name in button_list:
+        ttk.Button(
+            btn_row,
+            text=text,
+            style=style_name,
+            command=cmd
+        ).pack(side="left", padx=6, pady=6)
+
+    # StringVars, die vom StatusPoller aktualisiert werden
+    status_vars = {
+        "status": status_var,
+        "start_type": starttype_var,
+        "path": path_var,
+        "version": version_var,
+        "agent_installed": agent_installed_var,
+        "agent_latest": agent_latest_var,
+        "update_available": update_available_var,
+        "connection": connection_status_var,
+        "job": job_status_var,
+    }
+
+    # Initial theme + first refresh
+    root.update_idletasks()
+    apply_theme("dark")  # oder "light", wenn du standardmäßig Light willst
+    # Genau eine Refresh-Schleife pro Probe (statt root.after-Ketten)
+    status_poller = StatusPoller(status_queue)
+    port_prober = PortProber(on_probe_result)
+    refresh_scheduler = RefreshScheduler()
+    refresh_scheduler.add("status", status_poller.poll_once, FULL_REFRESH_INTERVAL)
+    refresh_scheduler.add("port", port_prober.sweep, PROBE_INTERVAL)
+    refresh_scheduler.start()
+    # Statuswechsel sofort anzeigen (SCM-Benachrichtigung oder adaptives Polling)
+    service_watcher = ServiceStateWatcher(lambda state: refresh_all())
+    service_watcher.start()
+    # Optional /metrics endpoint (BESZEL_METRICS_PORT), fed by the lanes above
+    if METRICS_PORT:
+        try:
+            metrics_server = start_metrics_server(METRICS_PORT)
+        except OSError as e:
+            print("Could not start metrics endpoint:", e)
+    process_status_queue()
+    update_connection_badge()
+    # Run agent update check after UI is initialized
+    root.after(500, trigger_agent_update_check)
+    root.geometry(f"{root.winfo_reqwidth()}x{root.winfo_reqheight()}")
+    root.mainloop()
+    ###
\ No newline at end of file
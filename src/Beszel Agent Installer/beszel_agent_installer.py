@@ -1,13 +1,33 @@
+import sys
+
+# Taken before our own imports (startup diagnostics)
+PRELOADED_MODULES = frozenset(sys.modules)
+
+import hashlib
+import json
 import os
+import queue
+import random
+import re
 import subprocess
 import shutil
-import requests
-import zipfile
+import socket
+import struct
+import tempfile
 import time
-import tkinter as tk
-from tkinter import messagebox, scrolledtext, ttk
 import threading
+import zlib
 import ctypes
+from ctypes import wintypes
+from dataclasses import dataclass, field, replace
+
+try:
+    import winreg
+except ImportError:  # non-Windows: only the fake backends are usable
+    winreg = None
+
+SERVICE_NAME = "beszelagent"
+CREATE_NO_WINDOW = 0x08000000
 
 base_path = os.path.dirname(os.path.abspath(__file__))
 icon_path = os.path.join(base_path, "beszelagent.ico")
@@ -34,10 +54,10 @@ THEME = {
 }
 
 current_theme = "dark"
-style: ttk.Style | None = None
+style = None  # ttk.Style, created in apply_theme() once Tk is up
 
 
-def apply_theme(root: tk.Tk):
+def apply_theme(root: "tk.Tk"):
     """Apply Windows 11-like theme to the installer window."""
     global style, current_theme
     th = THEME[current_theme]
@@ -105,12 +125,1828 @@ def apply_theme(root: tk.Tk):
         bordercolor=THEME[current_theme]["border"]
     )
 
-def toggle_theme(root: tk.Tk):
+def toggle_theme(root: "tk.Tk"):
     global current_theme
     current_theme = "dark" if current_theme == "light" else "light"
     apply_theme(root)
 
 
+# ---------------- GITHUB RELEASE CACHE ---------------- #
+
+GITHUB_RELEASE_API = "https://api.github.com/repos/henrygd/beszel/releases/latest"
+
+# Gemeinsamer Cache für Installer und Control Center (gleiches Format!)
+RELEASE_CACHE_FILE = os.path.join(
+    os.environ.get("ProgramData", r"C:\ProgramData"),
+    "beszel-agent",
+    "release-cache.json"
+)
+RELEASE_CACHE_TTL = int(os.environ.get("BESZEL_RELEASE_CACHE_TTL", "3600"))
+RELEASE_CACHE_JITTER = 0.2     # up to +20% of the TTL, so hosts don't refresh in lockstep
+RELEASE_CACHE_RETRY = 300      # retry delay after network errors / non-200 answers
+
+
+def load_release_cache(cache_file=RELEASE_CACHE_FILE):
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        return entry if isinstance(entry, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_release_cache(entry, cache_file=RELEASE_CACHE_FILE):
+    # Atomic replace so a second process never reads a half-written file
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print("Could not write release cache:", e)
+
+
+def get_latest_release(api_url=GITHUB_RELEASE_API, cache_file=RELEASE_CACHE_FILE,
+                       ttl=RELEASE_CACHE_TTL, force=False):
+    """
+    Return the latest release metadata ({"tag_name", "assets"}) or None.
+
+    Served from the on-disk cache while it is fresh. Otherwise GitHub is asked
+    with If-None-Match, so an unchanged release costs a 304 that does not count
+    against the rate limit. X-RateLimit-* headers are honoured: once the limit
+    is used up, nothing is sent before X-RateLimit-Reset.
+    """
+    entry = load_release_cache(cache_file)
+    data = entry.get("data")
+    now = time.time()
+
+    if not force and data and now < entry.get("expires", 0):
+        return data
+    if entry.get("ratelimit_remaining") == 0 and now < entry.get("ratelimit_reset", 0):
+        return data
+
+    # Networking stack only when a request is really needed
+    import requests
+
+    headers = {"Accept": "application/vnd.github+json"}
+    if data and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+
+    expires = now + ttl + random.uniform(0, ttl * RELEASE_CACHE_JITTER)
+    try:
+        resp = requests.get(api_url, headers=headers, timeout=5)
+    except requests.RequestException as e:
+        print("Release check failed:", e)
+        entry["expires"] = now + RELEASE_CACHE_RETRY
+        save_release_cache(entry, cache_file)
+        return data
+
+    remaining = resp.headers.get("X-RateLimit-Remaining")
+    reset = resp.headers.get("X-RateLimit-Reset")
+    if remaining is not None and remaining.isdigit():
+        entry["ratelimit_remaining"] = int(remaining)
+    if reset is not None and reset.isdigit():
+        entry["ratelimit_reset"] = int(reset)
+
+    if resp.status_code == 200:
+        try:
+            payload = resp.json()
+            data = {
+                "tag_name": payload.get("tag_name", ""),
+                "assets": [
+                    {"name": a.get("name", ""), "browser_download_url": a.get("browser_download_url", "")}
+                    for a in payload.get("assets", [])
+                ],
+            }
+            entry["data"] = data
+            entry["etag"] = resp.headers.get("ETag")
+        except ValueError:
+            expires = now + RELEASE_CACHE_RETRY
+    elif resp.status_code != 304:
+        # 403/429 (rate limited) or server error: keep the old data, try later
+        expires = now + RELEASE_CACHE_RETRY
+
+    if entry.get("ratelimit_remaining") == 0:
+        expires = max(expires, entry.get("ratelimit_reset", 0))
+
+    entry["expires"] = expires
+    entry["checked"] = now
+    save_release_cache(entry, cache_file)
+    return data
+
+
+# ---------------- SERVICE QUERY BACKEND ---------------- #
+
+PARAMETERS_KEY = r"SYSTEM\CurrentControlSet\Services\beszelagent\Parameters"
+
+# SCM constants (winsvc.h)
+SC_MANAGER_CONNECT = 0x0001
+SERVICE_QUERY_CONFIG = 0x0001
+SERVICE_QUERY_STATUS = 0x0004
+SERVICE_START = 0x0010
+SERVICE_STOP = 0x0020
+SERVICE_CONTROL_STOP = 1
+SERVICE_CONFIG_DELAYED_AUTO_START_INFO = 3
+ERROR_INSUFFICIENT_BUFFER = 122
+ERROR_SERVICE_ALREADY_RUNNING = 1056
+ERROR_SERVICE_NOT_ACTIVE = 1062
+
+SERVICE_STATES = {
+    1: "STOPPED",
+    2: "START_PENDING",
+    3: "STOP_PENDING",
+    4: "RUNNING",
+    5: "CONTINUE_PENDING",
+    6: "PAUSE_PENDING",
+    7: "PAUSED",
+}
+SERVICE_START_TYPES = {
+    0: "BOOT_START",
+    1: "SYSTEM_START",
+    2: "AUTO_START",
+    3: "DEMAND_START",
+    4: "DISABLED",
+}
+
+
+class SERVICE_STATUS(ctypes.Structure):
+    _fields_ = [
+        ("dwServiceType", wintypes.DWORD),
+        ("dwCurrentState", wintypes.DWORD),
+        ("dwControlsAccepted", wintypes.DWORD),
+        ("dwWin32ExitCode", wintypes.DWORD),
+        ("dwServiceSpecificExitCode", wintypes.DWORD),
+        ("dwCheckPoint", wintypes.DWORD),
+        ("dwWaitHint", wintypes.DWORD),
+    ]
+
+
+class QUERY_SERVICE_CONFIGW(ctypes.Structure):
+    _fields_ = [
+        ("dwServiceType", wintypes.DWORD),
+        ("dwStartType", wintypes.DWORD),
+        ("dwErrorControl", wintypes.DWORD),
+        ("lpBinaryPathName", wintypes.LPWSTR),
+        ("lpLoadOrderGroup", wintypes.LPWSTR),
+        ("dwTagId", wintypes.DWORD),
+        ("lpDependencies", wintypes.LPWSTR),
+        ("lpServiceStartName", wintypes.LPWSTR),
+        ("lpDisplayName", wintypes.LPWSTR),
+    ]
+
+
+@dataclass(frozen=True)
+class ServiceSnapshot:
+    """State, start type and install path of a service, read in one go."""
+    exists: bool
+    state: str = "UNKNOWN"          # SCM name, e.g. "RUNNING", "STOP_PENDING"
+    start_type: str = "UNKNOWN"     # "AUTO_START", "DELAYED_AUTO_START", ...
+    application: str | None = None  # Parameters\Application (expanded)
+
+
+def read_service_application(service_name=SERVICE_NAME):
+    """Read Parameters\\Application via winreg (no reg.exe)."""
+    key_path = rf"SYSTEM\CurrentControlSet\Services\{service_name}\Parameters"
+    try:
+        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, key_path, 0, winreg.KEY_READ) as key:
+            value, _ = winreg.QueryValueEx(key, "Application")
+    except OSError:
+        return None
+    if not value:
+        return None
+    # Expand %PROGRAMFILES%, %SYSTEMROOT%, etc.
+    return os.path.expandvars(str(value).strip().strip('"'))
+
+
+class WindowsServiceBackend:
+    """Queries and controls services via the Service Control Manager in-process."""
+
+    def __init__(self, read_application=read_service_application):
+        self.read_application = read_application
+
+    @staticmethod
+    def _advapi32():
+        advapi32 = ctypes.WinDLL("advapi32", use_last_error=True)
+        advapi32.OpenSCManagerW.restype = wintypes.HANDLE
+        advapi32.OpenServiceW.restype = wintypes.HANDLE
+        advapi32.OpenServiceW.argtypes = [wintypes.HANDLE, wintypes.LPCWSTR, wintypes.DWORD]
+        advapi32.CloseServiceHandle.argtypes = [wintypes.HANDLE]
+        return advapi32
+
+    def _control(self, service_name, access, action, ignored_error):
+        advapi32 = self._advapi32()
+        scm = advapi32.OpenSCManagerW(None, None, SC_MANAGER_CONNECT)
+        if not scm:
+            raise ctypes.WinError(ctypes.get_last_error())
+        try:
+            svc = advapi32.OpenServiceW(scm, service_name, access)
+            if not svc:
+                raise ctypes.WinError(ctypes.get_last_error())
+            try:
+                if not action(advapi32, wintypes.HANDLE(svc)):
+                    err = ctypes.get_last_error()
+                    if err != ignored_error:
+                        raise ctypes.WinError(err)
+            finally:
+                advapi32.CloseServiceHandle(svc)
+        finally:
+            advapi32.CloseServiceHandle(scm)
+
+    def start(self, service_name=SERVICE_NAME):
+        """
+        Ask the SCM to start the service.
+
+        Returns once the service program has connected to the SCM (state may
+        still be START_PENDING). A program that never connects blocks this for
+        the SCM's 30 s pipe timeout and then fails with ERROR_SERVICE_REQUEST_TIMEOUT.
+        """
+        self._control(
+            service_name, SERVICE_START,
+            lambda api, svc: api.StartServiceW(svc, 0, None),
+            ERROR_SERVICE_ALREADY_RUNNING
+        )
+
+    def stop(self, service_name=SERVICE_NAME):
+        """Send SERVICE_CONTROL_STOP (returns before it is STOPPED)."""
+        status = SERVICE_STATUS()
+        self._control(
+            service_name, SERVICE_STOP,
+            lambda api, svc: api.ControlService(svc, SERVICE_CONTROL_STOP, ctypes.byref(status)),
+            ERROR_SERVICE_NOT_ACTIVE
+        )
+
+    def query(self, service_name=SERVICE_NAME):
+        advapi32 = self._advapi32()
+
+        scm = advapi32.OpenSCManagerW(None, None, SC_MANAGER_CONNECT)
+        if not scm:
+            return ServiceSnapshot(exists=False)
+        try:
+            svc = advapi32.OpenServiceW(scm, service_name, SERVICE_QUERY_STATUS | SERVICE_QUERY_CONFIG)
+            if not svc:
+                return ServiceSnapshot(exists=False)
+            try:
+                return ServiceSnapshot(
+                    exists=True,
+                    state=self._query_state(advapi32, svc),
+                    start_type=self._query_start_type(advapi32, svc),
+                    application=self.read_application(service_name),
+                )
+            finally:
+                advapi32.CloseServiceHandle(svc)
+        finally:
+            advapi32.CloseServiceHandle(scm)
+
+    @staticmethod
+    def _query_state(advapi32, svc):
+        status = SERVICE_STATUS()
+        if not advapi32.QueryServiceStatus(wintypes.HANDLE(svc), ctypes.byref(status)):
+            return "UNKNOWN"
+        return SERVICE_STATES.get(status.dwCurrentState, "UNKNOWN")
+
+    @staticmethod
+    def _query_start_type(advapi32, svc):
+        needed = wintypes.DWORD(0)
+        advapi32.QueryServiceConfigW(wintypes.HANDLE(svc), None, 0, ctypes.byref(needed))
+        if ctypes.get_last_error() != ERROR_INSUFFICIENT_BUFFER:
+            return "UNKNOWN"
+
+        buf = ctypes.create_string_buffer(needed.value)
+        if not advapi32.QueryServiceConfigW(wintypes.HANDLE(svc), buf, needed, ctypes.byref(needed)):
+            return "UNKNOWN"
+        config = ctypes.cast(buf, ctypes.POINTER(QUERY_SERVICE_CONFIGW)).contents
+        start_type = SERVICE_START_TYPES.get(config.dwStartType, "UNKNOWN")
+
+        if start_type == "AUTO_START":
+            delayed = wintypes.BOOL(0)
+            if advapi32.QueryServiceConfig2W(
+                wintypes.HANDLE(svc),
+                SERVICE_CONFIG_DELAYED_AUTO_START_INFO,
+                ctypes.byref(delayed),
+                ctypes.sizeof(delayed),
+                ctypes.byref(needed)
+            ) and delayed.value:
+                start_type = "DELAYED_AUTO_START"
+        return start_type
+
+
+class FakeServiceBackend:
+    """In-memory backend for tests and benchmarks on non-Windows hosts."""
+
+    def __init__(self, services=None):
+        self.services = dict(services or {})
+        self.queries = 0
+        self.controls = []
+
+    def set(self, service_name=SERVICE_NAME, **fields):
+        current = self.services.get(service_name, ServiceSnapshot(exists=True))
+        self.services[service_name] = replace(current, exists=True, **fields)
+
+    def query(self, service_name=SERVICE_NAME):
+        self.queries += 1
+        return self.services.get(service_name, ServiceSnapshot(exists=False))
+
+    def start(self, service_name=SERVICE_NAME):
+        self.controls.append(("start", service_name))
+        self.set(service_name, state="RUNNING")
+
+    def stop(self, service_name=SERVICE_NAME):
+        self.controls.append(("stop", service_name))
+        self.set(service_name, state="STOPPED")
+
+
+service_backend = WindowsServiceBackend()
+
+
+# ---------------- REGISTRY WRITER ---------------- #
+
+# winreg value types (numeric, so the fake backend works without winreg)
+REG_SZ = 1
+REG_EXPAND_SZ = 2
+REG_DWORD = 4
+REG_MULTI_SZ = 7
+
+SERVICES_KEY = r"SYSTEM\CurrentControlSet\Services"
+MACHINE_ENVIRONMENT_KEY = r"SYSTEM\CurrentControlSet\Control\Session Manager\Environment"
+
+
+class RegistryWriteError(OSError):
+    pass
+
+
+@dataclass(frozen=True)
+class RegistryChange:
+    """One HKLM value; value=None deletes it."""
+    key: str
+    name: str
+    value: object = None
+    type: int = REG_SZ
+
+
+class WindowsRegistryWriter:
+    """HKLM reads/writes via winreg, in-process (no reg.exe)."""
+
+    def read(self, key_path, name):
+        try:
+            with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, key_path, 0, winreg.KEY_READ) as key:
+                return winreg.QueryValueEx(key, name)
+        except FileNotFoundError:
+            return None
+
+    def write(self, key_path, name, value, value_type):
+        with winreg.CreateKeyEx(winreg.HKEY_LOCAL_MACHINE, key_path, 0, winreg.KEY_SET_VALUE) as key:
+            winreg.SetValueEx(key, name, 0, value_type, value)
+
+    def delete(self, key_path, name):
+        try:
+            with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, key_path, 0, winreg.KEY_SET_VALUE) as key:
+                winreg.DeleteValue(key, name)
+        except FileNotFoundError:
+            pass
+
+
+class FakeRegistryWriter:
+    """Dict-backed stand-in; `fail_on` names make write() raise like a denied SetValueEx."""
+
+    def __init__(self, values=None, fail_on=()):
+        self.values = {(k.lower(), n.lower()): v for (k, n), v in (values or {}).items()}
+        self.fail_on = {n.lower() for n in fail_on}
+        self.writes = 0
+
+    def read(self, key_path, name):
+        return self.values.get((key_path.lower(), name.lower()))
+
+    def write(self, key_path, name, value, value_type):
+        self.writes += 1
+        if name.lower() in self.fail_on:
+            raise PermissionError(5, "Access is denied", name)
+        self.values[(key_path.lower(), name.lower())] = (value, value_type)
+
+    def delete(self, key_path, name):
+        self.writes += 1
+        self.values.pop((key_path.lower(), name.lower()), None)
+
+
+class RegistryBatch:
+    """
+    Collects registry changes and applies them all-or-nothing.
+
+    Values that already hold the wanted data are skipped. Everything written
+    is read back; if a write fails or does not verify, the values touched so
+    far are restored to what they were before (or deleted again).
+    """
+
+    def __init__(self, writer=None):
+        self.writer = writer or registry_writer
+        self.changes = []
+        self.written = []
+        self.skipped = 0
+
+    def set(self, key, name, value, value_type=REG_SZ):
+        self.changes.append(RegistryChange(key, name, value, value_type))
+
+    def delete(self, key, name):
+        self.changes.append(RegistryChange(key, name))
+
+    def _current(self, change):
+        return self.writer.read(change.key, change.name)
+
+    def _wanted(self, change):
+        return None if change.value is None else (change.value, change.type)
+
+    def apply(self):
+        """Returns the number of values actually written; raises RegistryWriteError after rolling back."""
+        undo = []
+        try:
+            for change in self.changes:
+                before = self._current(change)
+                if before == self._wanted(change):
+                    self.skipped += 1
+                    continue
+                undo.append((change, before))
+                if change.value is None:
+                    self.writer.delete(change.key, change.name)
+                else:
+                    self.writer.write(change.key, change.name, change.value, change.type)
+
+            for change, _ in undo:
+                if self._current(change) != self._wanted(change):
+                    raise RegistryWriteError(f"{change.key}\\{change.name} did not verify after writing")
+        except OSError as e:
+            self._rollback(undo)
+            if isinstance(e, RegistryWriteError):
+                raise
+            raise RegistryWriteError(f"Registry write failed, {len(undo)} change(s) rolled back: {e}") from e
+
+        self.written = [change for change, _ in undo]
+        return len(self.written)
+
+    def _rollback(self, undo):
+        for change, before in reversed(undo):
+            try:
+                if before is None:
+                    self.writer.delete(change.key, change.name)
+                else:
+                    self.writer.write(change.key, change.name, *before)
+            except OSError as e:
+                print(f"Rollback of {change.key}\\{change.name} failed: {e}")
+
+
+registry_writer = WindowsRegistryWriter()
+
+
+# ---------------- SERVICE MANAGER ---------------- #
+
+# Default: nssm.exe hosts the agent (as in Beszel's own Windows installer).
+# BESZEL_SERVICE_MANAGER=native registers beszel-agent.exe itself as the service image,
+# which only works if the binary answers the SCM.
+SERVICE_MANAGER = os.environ.get("BESZEL_SERVICE_MANAGER", "nssm").lower()
+
+SC_MANAGER_CREATE_SERVICE = 0x0002
+SERVICE_CHANGE_CONFIG = 0x0002
+SERVICE_DELETE = 0x00010000
+SERVICE_WIN32_OWN_PROCESS = 0x00000010
+SERVICE_ERROR_NORMAL = 1
+SERVICE_NO_CHANGE = 0xFFFFFFFF
+SERVICE_CONFIG_DESCRIPTION = 1
+ERROR_SERVICE_DOES_NOT_EXIST = 1060
+ERROR_SERVICE_EXISTS = 1073
+ERROR_SERVICE_REQUEST_TIMEOUT = 1053
+
+# Installer choice → (dwStartType, delayed)
+START_TYPE_CODES = {
+    "auto": (2, False),
+    "delayed": (2, True),
+    "manual": (3, False),
+    "disabled": (4, False),
+}
+
+
+@dataclass
+class ServiceConfig:
+    """Everything a manager needs to register the agent service."""
+    binary: str
+    start_type: str = "auto"
+    environment: dict = field(default_factory=dict)
+    name: str = SERVICE_NAME
+    display_name: str = "Beszel Agent"
+    description: str = "Beszel monitoring agent"
+
+
+class SERVICE_DESCRIPTIONW(ctypes.Structure):
+    _fields_ = [("lpDescription", wintypes.LPWSTR)]
+
+
+class NativeServiceManager:
+    """
+    Creates/updates the service with CreateServiceW / ChangeServiceConfigW, in-process.
+
+    Opt-in (BESZEL_SERVICE_MANAGER=native): the agent binary itself is the service image; KEY & co. go into the
+    service's own Environment (REG_MULTI_SZ), which the SCM hands to the
+    process. Parameters\\Application is written too, so the Control Center
+    finds the install path the same way as for NSSM services.
+    """
+    name = "native"
+
+    def _advapi32(self):
+        advapi32 = WindowsServiceBackend._advapi32()
+        advapi32.CreateServiceW.restype = wintypes.HANDLE
+        advapi32.CreateServiceW.argtypes = [
+            wintypes.HANDLE, wintypes.LPCWSTR, wintypes.LPCWSTR, wintypes.DWORD, wintypes.DWORD,
+            wintypes.DWORD, wintypes.DWORD, wintypes.LPCWSTR, wintypes.LPCWSTR, wintypes.LPVOID,
+            wintypes.LPCWSTR, wintypes.LPCWSTR, wintypes.LPCWSTR,
+        ]
+        advapi32.ChangeServiceConfigW.argtypes = [
+            wintypes.HANDLE, wintypes.DWORD, wintypes.DWORD, wintypes.DWORD, wintypes.LPCWSTR,
+            wintypes.LPCWSTR, wintypes.LPVOID, wintypes.LPCWSTR, wintypes.LPCWSTR, wintypes.LPCWSTR,
+            wintypes.LPCWSTR,
+        ]
+        advapi32.ChangeServiceConfig2W.argtypes = [wintypes.HANDLE, wintypes.DWORD, wintypes.LPVOID]
+        advapi32.DeleteService.argtypes = [wintypes.HANDLE]
+        return advapi32
+
+    def image_path(self, config):
+        return f'"{config.binary}"'
+
+    def install(self, config):
+        start_code, delayed = START_TYPE_CODES.get(config.start_type, START_TYPE_CODES["auto"])
+        advapi32 = self._advapi32()
+        scm = advapi32.OpenSCManagerW(None, None, SC_MANAGER_CONNECT | SC_MANAGER_CREATE_SERVICE)
+        if not scm:
+            raise ctypes.WinError(ctypes.get_last_error())
+        try:
+            svc = advapi32.CreateServiceW(
+                scm, config.name, config.display_name, SERVICE_CHANGE_CONFIG | SERVICE_QUERY_STATUS,
+                SERVICE_WIN32_OWN_PROCESS, start_code, SERVICE_ERROR_NORMAL, self.image_path(config),
+                None, None, None, None, None
+            )
+            if not svc:
+                if ctypes.get_last_error() != ERROR_SERVICE_EXISTS:
+                    raise ctypes.WinError(ctypes.get_last_error())
+                # Reinstall: reconfigure the existing service instead of delete + recreate
+                svc = advapi32.OpenServiceW(scm, config.name, SERVICE_CHANGE_CONFIG | SERVICE_QUERY_STATUS)
+                if not svc:
+                    raise ctypes.WinError(ctypes.get_last_error())
+                try:
+                    if not advapi32.ChangeServiceConfigW(
+                        svc, SERVICE_WIN32_OWN_PROCESS, start_code, SERVICE_ERROR_NORMAL, self.image_path(config),
+                        None, None, None, None, None, config.display_name
+                    ):
+                        raise ctypes.WinError(ctypes.get_last_error())
+                except OSError:
+                    advapi32.CloseServiceHandle(svc)
+                    raise
+            try:
+                delayed_info = wintypes.BOOL(delayed)
+                description = SERVICE_DESCRIPTIONW(config.description)
+                if not advapi32.ChangeServiceConfig2W(svc, SERVICE_CONFIG_DELAYED_AUTO_START_INFO,
+                                                      ctypes.byref(delayed_info)):
+                    raise ctypes.WinError(ctypes.get_last_error())
+                if not advapi32.ChangeServiceConfig2W(svc, SERVICE_CONFIG_DESCRIPTION, ctypes.byref(description)):
+                    raise ctypes.WinError(ctypes.get_last_error())
+            finally:
+                advapi32.CloseServiceHandle(svc)
+        finally:
+            advapi32.CloseServiceHandle(scm)
+        self.write_parameters(config)
+
+    def write_parameters(self, config):
+        service_key = rf"{SERVICES_KEY}\{config.name}"
+        environment = [f"{k}={v}" for k, v in config.environment.items()]
+        batch = RegistryBatch()
+        if environment:
+            batch.set(service_key, "Environment", environment, REG_MULTI_SZ)
+        else:
+            batch.delete(service_key, "Environment")
+        batch.set(service_key + r"\Parameters", "Application", config.binary, REG_EXPAND_SZ)
+        batch.apply()
+
+    def remove(self, service_name=SERVICE_NAME):
+        advapi32 = self._advapi32()
+        scm = advapi32.OpenSCManagerW(None, None, SC_MANAGER_CONNECT)
+        if not scm:
+            raise ctypes.WinError(ctypes.get_last_error())
+        try:
+            svc = advapi32.OpenServiceW(scm, service_name, SERVICE_DELETE)
+            if not svc:
+                if ctypes.get_last_error() == ERROR_SERVICE_DOES_NOT_EXIST:
+                    return
+                raise ctypes.WinError(ctypes.get_last_error())
+            try:
+                if not advapi32.DeleteService(svc):
+                    raise ctypes.WinError(ctypes.get_last_error())
+            finally:
+                advapi32.CloseServiceHandle(svc)
+        finally:
+            advapi32.CloseServiceHandle(scm)
+
+
+class NssmServiceManager(NativeServiceManager):
+    """
+    Same SCM calls, but nssm.exe is the service image and runs the agent.
+
+    For binaries that do not speak the service protocol. The Parameters
+    values are NSSM's own registry layout, so no `nssm install` / `nssm set`
+    processes are needed.
+    """
+    name = "nssm"
+
+    def __init__(self, nssm_path):
+        self.nssm_path = nssm_path
+
+    def image_path(self, config):
+        return f'"{self.nssm_path}"'
+
+    def write_parameters(self, config):
+        parameters_key = rf"{SERVICES_KEY}\{config.name}\Parameters"
+        batch = RegistryBatch()
+        # Left over from a native registration; KEY lives in AppEnvironmentExtra here
+        batch.delete(rf"{SERVICES_KEY}\{config.name}", "Environment")
+        batch.set(parameters_key, "Application", config.binary, REG_EXPAND_SZ)
+        batch.set(parameters_key, "AppDirectory", os.path.dirname(config.binary), REG_EXPAND_SZ)
+        batch.set(parameters_key, "AppParameters", "", REG_EXPAND_SZ)
+        batch.set(parameters_key, "AppEnvironmentExtra",
+                  [f"{k}={v}" for k, v in config.environment.items()], REG_MULTI_SZ)
+        batch.apply()
+
+
+class FakeServiceManager:
+    """Records configs and mirrors them into a FakeServiceBackend."""
+    name = "fake"
+
+    def __init__(self, backend=None):
+        self.backend = backend or FakeServiceBackend()
+        self.configs = {}
+
+    def install(self, config):
+        self.configs[config.name] = config
+        start_type = {"auto": "AUTO_START", "delayed": "DELAYED_AUTO_START",
+                      "manual": "DEMAND_START", "disabled": "DISABLED"}.get(config.start_type, "AUTO_START")
+        current = self.backend.services.get(config.name)
+        self.backend.set(config.name, start_type=start_type, application=config.binary,
+                         state=current.state if current and current.exists else "STOPPED")
+
+    def remove(self, service_name=SERVICE_NAME):
+        self.configs.pop(service_name, None)
+        self.backend.services.pop(service_name, None)
+
+
+def make_service_manager(kind=SERVICE_MANAGER, nssm_path=None):
+    if kind == "nssm":
+        return NssmServiceManager(nssm_path)
+    if kind == "fake":
+        return FakeServiceManager(service_backend if isinstance(service_backend, FakeServiceBackend) else None)
+    return NativeServiceManager()
+
+
+# ---------------- WAITS ---------------- #
+
+AGENT_PORT = 45876
+SERVICE_START_TIMEOUT = 30.0   # = SCM's own start timeout
+SERVICE_STOP_TIMEOUT = 30.0
+AGENT_UPDATE_TIMEOUT = 300.0
+FILE_UNLOCK_TIMEOUT = 10.0
+TOOL_TIMEOUT = 60.0
+
+
+class WaitTimeout(Exception):
+    """A wait_for() deadline passed; `reason` says what we were waiting for."""
+
+    def __init__(self, reason, waited):
+        super().__init__(f"Timed out after {waited:.1f}s waiting for {reason}")
+        self.reason = reason
+        self.waited = waited
+
+
+def wait_for(predicate, timeout, reason, log=None, initial=0.05, factor=2.0, max_interval=1.0,
+             clock=time.monotonic, sleep=time.sleep):
+    """
+    Poll predicate() with exponential backoff until it returns something truthy.
+
+    Returns that value; raises WaitTimeout once `timeout` seconds have passed.
+    The predicate is checked once more at the deadline, and the actual wait
+    time goes to `log` either way.
+    """
+    start = clock()
+    interval = initial
+    while True:
+        value = predicate()
+        waited = clock() - start
+        if value:
+            if log:
+                log(f"Waited {waited:.2f}s for {reason}.")
+            return value
+        remaining = timeout - waited
+        if remaining <= 0:
+            if log:
+                log(f"Gave up after {waited:.2f}s waiting for {reason}.")
+            raise WaitTimeout(reason, waited)
+        sleep(min(interval, remaining))
+        interval = min(interval * factor, max_interval)
+
+
+### Predicates for wait_for() ###
+def service_in_state(*states, service_name=SERVICE_NAME):
+    """Current state if it is one of `states` ("GONE" = service does not exist)."""
+    def check():
+        snapshot = service_backend.query(service_name)
+        state = snapshot.state if snapshot.exists else "GONE"
+        return state if state in states else None
+    return check
+
+
+def port_listening(port=AGENT_PORT, host="127.0.0.1"):
+    def check():
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return True
+        except OSError:
+            return False
+    return check
+
+
+def file_unlocked(path):
+    """True once `path` can be opened for writing (or is gone)."""
+    def check():
+        try:
+            with open(path, "r+b"):
+                return True
+        except FileNotFoundError:
+            return True
+        except OSError:
+            return False
+    return check
+
+
+def tool_available(name):
+    return lambda: shutil.which(name)
+
+
+def path_removed(path):
+    """Retry rmtree until Windows has released every handle below `path`."""
+    def check():
+        shutil.rmtree(path, ignore_errors=True)
+        return not os.path.exists(path)
+    return check
+
+
+# ---------------- POWERSHELL SESSION ---------------- #
+
+POWERSHELL_TIMEOUT = 60.0
+CHOCO_BOOTSTRAP_TIMEOUT = 600.0  # downloads and unpacks Chocolatey itself
+RESULT_FRAME = "##beszel-result##"
+
+# Host loop: one JSON request per stdin line → one framed JSON result line.
+# Arguments arrive as a hashtable and are splatted into the script's param() block,
+# so nothing is ever interpolated into the script text.
+POWERSHELL_HOST = r"""
+$utf8 = New-Object System.Text.UTF8Encoding $false
+try { [Console]::InputEncoding = $utf8; [Console]::OutputEncoding = $utf8 } catch { }
+$ProgressPreference = 'SilentlyContinue'
+while ($null -ne ($line = [Console]::In.ReadLine())) {
+    if (-not $line) { continue }
+    $req = $line | ConvertFrom-Json
+    $params = @{}
+    if ($req.args) { foreach ($p in $req.args.PSObject.Properties) { $params[$p.Name] = $p.Value } }
+    $global:LASTEXITCODE = 0
+    $ok = $true; $err = $null; $out = ''
+    try {
+        $out = & ([scriptblock]::Create($req.script)) @params 2>&1 | Out-String -Width 4096
+    } catch {
+        $ok = $false; $err = $_.Exception.Message
+    }
+    $res = @{ id = $req.id; ok = $ok; exit = [int]$LASTEXITCODE; output = [string]$out; error = $err }
+    [Console]::Out.WriteLine('##beszel-result##' + ($res | ConvertTo-Json -Compress))
+    [Console]::Out.Flush()
+}
+"""
+
+# Same protocol with Python snippets instead of PowerShell (tests on Linux):
+# `script` is exec()'d with the arguments as globals, print() is the output.
+STAND_IN_HOST = r"""
+import contextlib, io, json, sys
+for line in sys.stdin:
+    if not line.strip():
+        continue
+    req = json.loads(line)
+    out, ok, err, code = io.StringIO(), True, None, 0
+    try:
+        with contextlib.redirect_stdout(out):
+            exec(req["script"], dict(req.get("args") or {}))
+    except SystemExit as e:
+        code = e.code or 0
+    except Exception as e:
+        ok, err = False, str(e)
+    res = {"id": req["id"], "ok": ok, "exit": code, "output": out.getvalue(), "error": err}
+    print("##beszel-result##" + json.dumps(res), flush=True)
+"""
+
+
+class PowerShellError(Exception):
+    pass
+
+
+class PowerShellTimeout(PowerShellError):
+    pass
+
+
+@dataclass
+class PowerShellResult:
+    ok: bool
+    exit_code: int
+    output: str
+    error: str | None
+    duration: float
+
+    @property
+    def succeeded(self):
+        return self.ok and self.exit_code == 0
+
+
+class PowerShellBroker:
+    """
+    One long-lived PowerShell host for all of the installer's PowerShell work.
+
+    Saves the 0.5–2 s cold start per command. Commands run one at a time;
+    long-running work (the Chocolatey bootstrap) passes a longer timeout,
+    and time spent queueing behind it counts against the others' timeouts.
+    If a command runs into its timeout the host is killed, because a
+    running pipeline cannot be interrupted from outside, and the next
+    command starts a fresh host.
+    """
+
+    def __init__(self, command=None, timeout=POWERSHELL_TIMEOUT):
+        self.command = command
+        self.timeout = timeout
+        self.process = None
+        self.frames = None
+        self.started = 0
+        self._ids = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def stand_in(cls, timeout=POWERSHELL_TIMEOUT):
+        return cls([sys.executable, "-u", "-c", STAND_IN_HOST], timeout=timeout)
+
+    def _host_command(self):
+        if self.command:
+            return self.command
+        import base64
+        encoded = base64.b64encode(POWERSHELL_HOST.encode("utf-16-le")).decode("ascii")
+        return ["powershell", "-NoLogo", "-NoProfile", "-NonInteractive",
+                "-ExecutionPolicy", "Bypass", "-EncodedCommand", encoded]
+
+    def _ensure(self):
+        if self.process and self.process.poll() is None:
+            return
+        self.process = subprocess.Popen(
+            self._host_command(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            creationflags=CREATE_NO_WINDOW if os.name == "nt" else 0
+        )
+        self.frames = queue.Queue()
+        self.started += 1
+        threading.Thread(target=self._read, args=(self.process, self.frames), daemon=True).start()
+
+    @staticmethod
+    def _read(process, frames):
+        # Everything that is not a result frame (banners, stray host output) is dropped
+        for line in process.stdout:
+            if line.startswith(RESULT_FRAME):
+                try:
+                    frames.put(json.loads(line[len(RESULT_FRAME):]))
+                except ValueError:
+                    pass
+        frames.put(None)
+
+    def run(self, script, timeout=None, **args):
+        """
+        Run `script` with `args` bound to its param() block; returns a PowerShellResult.
+
+        `timeout` covers waiting for the session too: install steps run in
+        parallel and queue up here behind whatever command is running.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        if not self._lock.acquire(timeout=timeout):
+            raise PowerShellTimeout(f"PowerShell session stayed busy for {timeout:g}s")
+        try:
+            self._ensure()
+            self._ids += 1
+            request_id = self._ids
+            start = time.perf_counter()
+            try:
+                self.process.stdin.write(json.dumps({"id": request_id, "script": script, "args": args}) + "\n")
+                self.process.stdin.flush()
+            except OSError as e:
+                self._kill()
+                raise PowerShellError(f"PowerShell host is gone: {e}")
+
+            while True:
+                try:
+                    frame = self.frames.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    self._kill()
+                    raise PowerShellTimeout(f"PowerShell command timed out after {timeout:g}s")
+                if frame is None:
+                    self._kill()
+                    raise PowerShellError("PowerShell host exited unexpectedly")
+                if frame.get("id") == request_id:
+                    break
+        finally:
+            self._lock.release()
+
+        return PowerShellResult(
+            ok=bool(frame.get("ok")),
+            exit_code=int(frame.get("exit") or 0),
+            output=frame.get("output") or "",
+            error=frame.get("error"),
+            duration=time.perf_counter() - start,
+        )
+
+    def _kill(self):
+        if self.process:
+            try:
+                self.process.kill()
+                self.process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        self.process = None
+
+    def close(self):
+        with self._lock:
+            if self.process and self.process.poll() is None:
+                try:
+                    self.process.stdin.close()
+                    self.process.wait(timeout=5)
+                except (OSError, subprocess.TimeoutExpired):
+                    self._kill()
+            self.process = None
+
+powershell = PowerShellBroker()
+
+
+# ---------------- STARTUP DIAGNOSTICS ---------------- #
+
+FROZEN = getattr(sys, "frozen", False)
+# Script budget: 100 ms from process start until the module is imported (interpreter alone ~25 ms)
+SCRIPT_BUDGET_MS = 100
+# PyInstaller --onefile unpacks itself to %TEMP% first; that extraction gets its own allowance
+FROZEN_BUDGET_MS = 1500
+STARTUP_BUDGET_MS = float(os.environ.get("BESZEL_STARTUP_BUDGET_MS", FROZEN_BUDGET_MS if FROZEN else SCRIPT_BUDGET_MS))
+STARTUP_RUNS = 5
+# Heavy modules that must not be loaded before they are actually used
+LAZY_MODULES = ("requests", "urllib3", "tkinter", "asyncio", "zipfile", "argparse")
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+### Windowed (PyInstaller --noconsole) builds have no stdout ###
+def attach_parent_console():
+    if sys.stdout is not None or os.name != "nt":
+        return
+    if ctypes.windll.kernel32.AttachConsole(-1):  # ATTACH_PARENT_PROCESS
+        sys.stdout = open("CONOUT$", "w", encoding="utf-8")
+        sys.stderr = sys.stdout
+
+
+### Command line that starts this program again (script or frozen exe) ###
+def self_command(*args):
+    if FROZEN:
+        return [sys.executable, *args]
+    return [sys.executable, os.path.abspath(__file__), *args]
+
+
+### Cold start = fresh process per run that exits right after the imports ###
+def measure_cold_start(runs=STARTUP_RUNS):
+    samples, eager = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run(
+            self_command("--startup-probe"),
+            capture_output=True, text=True, creationflags=CREATE_NO_WINDOW if os.name == "nt" else 0
+        )
+        samples.append((time.perf_counter() - start) * 1000)
+        try:
+            eager = json.loads(proc.stdout)
+        except ValueError:
+            pass
+    return sorted(samples), eager
+
+
+### -X importtime breakdown of the top-level imports (not available frozen) ###
+def measure_import_times(top=15):
+    if FROZEN:
+        return None
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", os.path.abspath(__file__), "--startup-probe"],
+        capture_output=True, text=True, creationflags=CREATE_NO_WINDOW if os.name == "nt" else 0
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = IMPORTTIME_LINE.match(line)
+        if m and len(m.group(3)) == 1:  # one space = imported directly by us / site
+            rows.append({"module": m.group(4), "self_us": int(m.group(1)), "cumulative_us": int(m.group(2))})
+    rows.sort(key=lambda r: r["cumulative_us"], reverse=True)
+    return rows[:top]
+
+
+def startup_report(runs=STARTUP_RUNS, budget_ms=STARTUP_BUDGET_MS):
+    samples, eager = measure_cold_start(runs)
+    median = samples[len(samples) // 2]
+    return {
+        "frozen": FROZEN,
+        "runs": runs,
+        "median_ms": round(median, 1),
+        "min_ms": round(samples[0], 1),
+        "max_ms": round(samples[-1], 1),
+        "budget_ms": budget_ms,
+        "eager_modules": eager,
+        "within_budget": median <= budget_ms and not eager,
+        "imports": measure_import_times(),
+    }
+
+
+def format_startup_report(report):
+    lines = [
+        f"Cold start: median {report['median_ms']:.1f} ms "
+        f"(min {report['min_ms']:.1f}, max {report['max_ms']:.1f}, {report['runs']} runs)",
+        f"Budget:     {report['budget_ms']:.0f} ms – {'OK' if report['within_budget'] else 'EXCEEDED'}",
+        f"Loaded too early: {', '.join(report['eager_modules']) or 'none'}",
+    ]
+    if report["imports"]:
+        lines.append("")
+        lines.append(f"{'cumulative':>12} {'self':>10}  module")
+        for row in report["imports"]:
+            lines.append(f"{row['cumulative_us'] / 1000:>9.1f} ms {row['self_us'] / 1000:>7.1f} ms  {row['module']}")
+    return "\n".join(lines)
+
+
+### --startup-probe (used by the benchmark) / --startup-report [--json] ###
+def run_startup_diagnostics(argv):
+    if argv[0] == "--startup-probe":
+        loaded = set(sys.modules) - PRELOADED_MODULES
+        print(json.dumps([name for name in LAZY_MODULES if name in loaded]))
+        return 0
+
+    attach_parent_console()
+    report = startup_report()
+    print(json.dumps(report) if "--json" in argv else format_startup_report(report), flush=True)
+    return 0 if report["within_budget"] else 1
+
+
+# ---------------- DOWNLOADER ---------------- #
+
+DOWNLOAD_TIMEOUT = (10, 30)          # (connect, read) seconds
+DOWNLOAD_RETRIES = 5                 # resumed from where it stopped if the server does ranges
+DOWNLOAD_BACKOFF = 1.0               # doubled per retry
+DOWNLOAD_MIN_CHUNK = 64 * 1024
+DOWNLOAD_MAX_CHUNK = 4 * 1024 * 1024
+DOWNLOAD_CHUNK_SECONDS = 0.25        # aim for about four reads per second and stream
+DOWNLOAD_PROGRESS_INTERVAL = 0.2
+
+
+class DownloadError(Exception):
+    """Download failed after all retries (or the server answered nonsense)."""
+
+
+class ConnectionDropped(DownloadError):
+    """The connection ended before the announced length (retried)."""
+
+
+class RemoteChanged(DownloadError):
+    """The server would not continue a resume (file changed or ranges ignored), start over."""
+
+
+@dataclass
+class DownloadStatus:
+    done: int
+    total: int | None
+    rate: float  # bytes/s, smoothed
+
+    @property
+    def eta(self):
+        if not self.total or self.rate <= 0:
+            return None
+        return max(0.0, (self.total - self.done) / self.rate)
+
+    def describe(self):
+        mb = 1024 * 1024
+        text = f"{self.done / mb:.1f}"
+        if self.total:
+            text += f" / {self.total / mb:.1f}"
+        text += f" MB – {self.rate / mb:.2f} MB/s"
+        if self.eta is not None:
+            minutes, seconds = divmod(int(self.eta + 0.5), 60)
+            text += f" – ETA {minutes}:{seconds:02d}"
+        return text
+
+
+class AdaptiveChunk:
+    """Read size following the measured throughput of one stream."""
+
+    def __init__(self):
+        self.size = DOWNLOAD_MIN_CHUNK
+
+    def update(self, nbytes, seconds):
+        target = nbytes / seconds * DOWNLOAD_CHUNK_SECONDS if seconds > 0 else self.size * 2
+        self.size = int(min(DOWNLOAD_MAX_CHUNK, max(DOWNLOAD_MIN_CHUNK, target)))
+
+
+class Downloader:
+    """
+    Streams an HTTP body into a sink (the ZIP extractor), optionally mirrored
+    to a `.part` file so that the next run can pick up where this one died.
+
+    Connect/read timeouts, retries with exponential backoff and throttled
+    DownloadStatus progress callbacks; resume details are in stream().
+    """
+
+    def __init__(self, on_progress=None, timeout=DOWNLOAD_TIMEOUT,
+                 retries=DOWNLOAD_RETRIES, backoff=DOWNLOAD_BACKOFF):
+        self.on_progress = on_progress
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.retried = 0
+        self.elapsed = 0.0
+        self.total = None
+        self.resumed = 0
+        self._done = 0
+
+    @staticmethod
+    def _session():
+        import requests
+
+        session = requests.Session()
+        session.headers["Accept-Encoding"] = "identity"  # ranges address the raw bytes
+        return session
+
+    @staticmethod
+    def _load_part(part, url):
+        """(etag, total, size) of a resumable `part` for `url`, or None."""
+        try:
+            with open(part + ".json", "r", encoding="utf-8") as f:
+                state = json.load(f)
+            size = os.path.getsize(part)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(state, dict) or state.get("url") != url or not state.get("etag"):
+            return None
+        total = state.get("total")
+        if not size or (total is not None and size > total):
+            return None
+        return state["etag"], total, size
+
+    @staticmethod
+    def _save_part(part, url, etag, total):
+        tmp = f"{part}.json.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"url": url, "etag": etag, "total": total}, f)
+        os.replace(tmp, part + ".json")
+
+    @staticmethod
+    def discard(part):
+        """Forget a partial download (after success, or when its bytes are useless)."""
+        for path in (part, part + ".json"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def stream(self, url, sink, part=None):
+        """
+        Feed the body of `url` to sink(data) in order, in one pass. A dropped
+        connection continues at the next byte (Range + If-Range) if the
+        server supports it; sink errors abort.
+
+        With `part` the raw bytes are also appended to that file and url,
+        ETag and length go to `<part>.json`. A later call with the same part
+        replays it into the (fresh) sink and only fetches the rest; if the
+        server answers that with the whole file, RemoteChanged is raised and
+        the caller has to discard the part and start over with a new sink.
+        """
+        import requests
+        import urllib3
+
+        start = time.perf_counter()
+        session = self._session()
+        chunk = AdaptiveChunk()
+        etag = None
+        offset = 0
+        attempt = 0
+        self._done = 0
+        self.total = None
+        self.resumed = 0
+
+        part_file = None
+        if part:
+            saved = self._load_part(part, url)
+            if saved:
+                etag, self.total, self.resumed = saved
+                part_file = open(part, "r+b")
+            else:
+                self.discard(part)
+                part_file = open(part, "wb")
+
+        try:
+            # Replay what an earlier run already fetched, the file position then sits at its end
+            while part_file and offset < self.resumed:
+                data = part_file.read(min(DOWNLOAD_MAX_CHUNK, self.resumed - offset))
+                if not data:
+                    raise RemoteChanged(f"{part} shrank while it was replayed")
+                sink(data)
+                offset += len(data)
+            self._done = offset
+            rate, last_done, last_time = 0.0, offset, time.perf_counter()
+
+            while self.total is None or offset < self.total:
+                headers = {}
+                if offset:
+                    headers["Range"] = f"bytes={offset}-"
+                    if etag:
+                        headers["If-Range"] = etag
+                try:
+                    with session.get(url, headers=headers, stream=True, timeout=self.timeout) as resp:
+                        if offset and resp.status_code == 200:
+                            raise RemoteChanged(f"server sent the whole file instead of bytes {offset}-")
+                        if offset and resp.status_code != 206:
+                            raise DownloadError(f"server cannot resume at byte {offset} (HTTP {resp.status_code})")
+                        if not offset:
+                            if resp.status_code != 200:
+                                raise DownloadError(f"HTTP {resp.status_code}")
+                            etag = resp.headers.get("ETag") or resp.headers.get("Last-Modified")
+                            length = resp.headers.get("Content-Length")
+                            self.total = int(length) if length and length.isdigit() else None
+                            # Only worth keeping if the next run can ask for the rest
+                            if part_file and etag and resp.headers.get("Accept-Ranges", "").lower() == "bytes":
+                                self._save_part(part, url, etag, self.total)
+
+                        while True:
+                            read_start = time.perf_counter()
+                            data = resp.raw.read(chunk.size)
+                            if not data:
+                                break
+                            chunk.update(len(data), time.perf_counter() - read_start)
+                            if part_file:
+                                part_file.write(data)
+                            sink(data)
+                            offset += len(data)
+                            self._done = offset
+
+                            now = time.perf_counter()
+                            if self.on_progress and now - last_time >= DOWNLOAD_PROGRESS_INTERVAL:
+                                sample = (offset - last_done) / (now - last_time)
+                                rate = sample if rate == 0 else 0.7 * rate + 0.3 * sample
+                                last_done, last_time = offset, now
+                                self.on_progress(DownloadStatus(offset, self.total, rate))
+
+                    if self.total is not None and offset < self.total:
+                        raise ConnectionDropped(f"connection closed at byte {offset}")
+                    break
+                except (requests.RequestException, urllib3.exceptions.HTTPError,
+                        ConnectionError, TimeoutError, ConnectionDropped) as e:
+                    attempt += 1
+                    if attempt > self.retries:
+                        raise DownloadError(f"{e} (after {attempt} attempts)") from e
+                    self.retried += 1
+                    time.sleep(min(30.0, self.backoff * 2 ** (attempt - 1)))
+        finally:
+            if part_file:
+                part_file.close()
+
+        self.elapsed = time.perf_counter() - start
+        if self.on_progress:
+            self.on_progress(DownloadStatus(offset, self.total, offset / self.elapsed if self.elapsed else 0.0))
+
+    def summary(self):
+        rate = self._done / self.elapsed if self.elapsed else 0.0
+        text = f"{self._done / (1024 * 1024):.1f} MB in {self.elapsed:.1f} s, {rate / (1024 * 1024):.2f} MB/s"
+        if self.resumed:
+            text += f", resumed at {self.resumed / (1024 * 1024):.1f} MB"
+        if self.retried:
+            text += f", {self.retried} retries"
+        return text
+
+
+# ---------------- STREAMING ZIP EXTRACT ---------------- #
+
+ZIP_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")  # 30 bytes, APPNOTE 4.3.7
+ZIP_LOCAL_SIG = 0x04034B50
+ZIP_CENTRAL_SIG = 0x02014B50
+ZIP_END_SIG = 0x06054B50
+ZIP_DESCRIPTOR_SIG = 0x08074B50
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+ZIP_FLAG_DESCRIPTOR = 0x0008  # sizes/CRC follow the data
+ZIP_FLAG_UTF8 = 0x0800
+
+
+class ZipStreamExtractor:
+    """
+    Parses a ZIP archive front to back while its bytes arrive (local file
+    headers only, the central directory is never needed) and inflates the
+    first member with match(name) into `out`. Every byte fed is hashed.
+    """
+
+    def __init__(self, match, out):
+        self.match = match
+        self.out = out
+        self.sha256 = hashlib.sha256()
+        self.received = 0
+        self.member = None     # name of the extracted member
+        self.size = 0          # its uncompressed size
+        self.done = False
+        self._buffer = bytearray()
+        self._state = "header"
+        self._entry = None
+
+    def feed(self, data):
+        self.sha256.update(data)
+        self.received += len(data)
+        if self._state == "end":
+            return
+        self._buffer += data
+        while self._state != "end" and self._step():
+            pass
+
+    def close(self):
+        if not self.done:
+            raise ValueError("archive ended before an agent executable was found")
+
+    def _step(self):
+        if self._state == "header":
+            return self._read_header()
+        if self._state == "data":
+            return self._read_data()
+        return self._read_descriptor()
+
+    def _read_header(self):
+        if len(self._buffer) < 4:
+            return False
+        signature = int.from_bytes(self._buffer[:4], "little")
+        if signature in (ZIP_CENTRAL_SIG, ZIP_END_SIG):
+            self._state = "end"
+            return False
+        if signature != ZIP_LOCAL_SIG:
+            raise ValueError("not a ZIP archive (bad local header)")
+        if len(self._buffer) < ZIP_LOCAL_HEADER.size:
+            return False
+        (_, _, flags, method, _, _, crc, csize, _, name_len, extra_len) = \
+            ZIP_LOCAL_HEADER.unpack_from(self._buffer)
+        header_len = ZIP_LOCAL_HEADER.size + name_len + extra_len
+        if len(self._buffer) < header_len:
+            return False
+
+        raw_name = bytes(self._buffer[ZIP_LOCAL_HEADER.size:ZIP_LOCAL_HEADER.size + name_len])
+        name = raw_name.decode("utf-8" if flags & ZIP_FLAG_UTF8 else "cp437")
+        del self._buffer[:header_len]
+
+        target = not self.done and self.match(name)
+        has_descriptor = bool(flags & ZIP_FLAG_DESCRIPTOR)
+        if method not in (ZIP_STORED, ZIP_DEFLATED) and (target or has_descriptor):
+            raise ValueError(f"unsupported compression method {method} for {name}")
+        if method == ZIP_STORED and has_descriptor:
+            raise ValueError(f"stored member {name} without sizes cannot be streamed")
+
+        self._entry = {
+            "name": name,
+            "target": target,
+            "crc": crc,
+            "remaining": None if has_descriptor else csize,
+            "descriptor": has_descriptor,
+            "inflate": zlib.decompressobj(-15) if method == ZIP_DEFLATED and (target or has_descriptor) else None,
+            "crc_out": 0,
+        }
+        self._state = "data"
+        return True
+
+    def _write(self, data):
+        entry = self._entry
+        if entry["target"] and data:
+            self.out.write(data)
+            entry["crc_out"] = zlib.crc32(data, entry["crc_out"])
+            self.size += len(data)
+
+    def _read_data(self):
+        entry = self._entry
+        if entry["remaining"] is None:
+            # Sizes unknown: the deflate stream itself marks the end
+            if not self._buffer:
+                return False
+            self._write(entry["inflate"].decompress(bytes(self._buffer)))
+            if entry["inflate"].eof:
+                self._buffer = bytearray(entry["inflate"].unused_data)
+                self._state = "descriptor"
+                return True
+            self._buffer.clear()
+            return False
+
+        n = min(len(self._buffer), entry["remaining"])
+        data = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        entry["remaining"] -= n
+        if entry["target"]:
+            self._write(entry["inflate"].decompress(data) if entry["inflate"] else data)
+        if entry["remaining"]:
+            return False
+        if entry["inflate"] is not None:
+            self._write(entry["inflate"].flush())
+        if entry["descriptor"]:
+            self._state = "descriptor"
+        else:
+            self._finish(entry["crc"])
+        return True
+
+    def _read_descriptor(self):
+        if len(self._buffer) < 4:
+            return False
+        has_sig = int.from_bytes(self._buffer[:4], "little") == ZIP_DESCRIPTOR_SIG
+        length = 16 if has_sig else 12
+        if len(self._buffer) < length:
+            return False
+        crc = int.from_bytes(self._buffer[length - 12:length - 8], "little")
+        del self._buffer[:length]
+        self._finish(crc)
+        return True
+
+    def _finish(self, crc):
+        entry = self._entry
+        if entry["target"]:
+            if entry["crc_out"] != crc:
+                raise ValueError(f"CRC mismatch in {entry['name']}")
+            self.member = entry["name"]
+            self.done = True
+            self._state = "end"  # the rest is only hashed
+        else:
+            self._state = "header"
+
+AGENT_MEMBER = re.compile(r"beszel-agent.*\.exe$", re.IGNORECASE)
+
+# Official NSSM build, fetched directly (no Chocolatey); nssm.cc publishes no checksums,
+# so the archive hash is pinned here and must change together with NSSM_VERSION
+NSSM_VERSION = "2.24"
+NSSM_URL = f"https://nssm.cc/release/nssm-{NSSM_VERSION}.zip"
+NSSM_SHA256 = "727d1e42275c605e0f04aba98095c38a8e1e46def453cdffce42869428aa6743"
+# 32-bit Windows only if neither the process nor WOW64 reports a 64-bit CPU; ARM64 runs the x64 build
+NSSM_ARCH = "win32" if (
+    os.environ.get("PROCESSOR_ARCHITECTURE", "").lower() == "x86" and not os.environ.get("PROCESSOR_ARCHITEW6432")
+) else "win64"
+NSSM_MEMBER = re.compile(rf"(^|/){NSSM_ARCH}/nssm\.exe$", re.IGNORECASE)
+
+
+### sha256 of `asset_name` from a goreleaser checksums.txt (None if unavailable) ###
+def fetch_release_checksum(checksums_url, asset_name):
+    import requests
+
+    try:
+        resp = requests.get(checksums_url, timeout=DOWNLOAD_TIMEOUT)
+        resp.raise_for_status()
+    except requests.RequestException as e:
+        print("Could not fetch checksums:", e)
+        return None
+    for line in resp.text.splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[1].lstrip("*") == asset_name:
+            return parts[0].lower()
+    return None
+
+
+# ---------------- ARTIFACT CACHE ---------------- #
+
+ARTIFACT_CACHE_DIR = os.path.join(
+    os.environ.get("ProgramData", r"C:\ProgramData"), "beszel-agent", "artifacts"
+)
+ARTIFACT_CACHE_MAX_BYTES = int(os.environ.get("BESZEL_ARTIFACT_CACHE_MB", "512")) * 1024 * 1024
+HASH_BLOCK = 1024 * 1024
+CHOCO_NSSM_PATH = r"C:\ProgramData\chocolatey\bin\nssm.exe"
+# Stable copy outside the install dir: NSSM is the service binary and must outlive rmtree()
+LOCAL_NSSM_PATH = os.path.join(os.path.dirname(ARTIFACT_CACHE_DIR), "nssm.exe")
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+### "0.16.1" from a release asset URL / tag ###
+def agent_version_from(text):
+    match = re.search(r"v?(\d+\.\d+\.\d+)", text or "")
+    return match.group(1) if match else None
+
+
+class ArtifactCache:
+    """
+    Content-addressed binaries under ProgramData.
+
+    Files live in objects/<sha256[:2]>/<sha256>; index.json maps the hash to
+    kind ("agent", "nssm"), version, size, last use and the pin flag.
+    Every lookup re-hashes the file, so a damaged object is dropped instead
+    of installed. Above max_bytes the least recently used unpinned objects
+    are evicted.
+    """
+
+    def __init__(self, root=ARTIFACT_CACHE_DIR, max_bytes=ARTIFACT_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.index_file = os.path.join(root, "index.json")
+        self._lock = threading.Lock()
+
+    def object_path(self, sha):
+        return os.path.join(self.root, "objects", sha[:2], sha)
+
+    def _load(self):
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                return json.load(f).get("artifacts", {})
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def _save(self, index):
+        os.makedirs(self.root, exist_ok=True)
+        # Per-process name: the installer and its --cache CLI may save at the same time
+        tmp = f"{self.index_file}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"format": 1, "artifacts": index}, f, indent=1)
+        os.replace(tmp, self.index_file)
+
+    def _drop(self, index, sha):
+        index.pop(sha, None)
+        try:
+            os.remove(self.object_path(sha))
+        except OSError:
+            pass
+
+    def _intact(self, sha, entry):
+        path = self.object_path(sha)
+        try:
+            return os.path.getsize(path) == entry.get("size") and sha256_file(path) == sha
+        except OSError:
+            return False
+
+    def lookup(self, kind, version=None):
+        """(sha256, path) of the newest intact `kind` artifact, or None."""
+        with self._lock:
+            index = self._load()
+            candidates = sorted(
+                (item for item in index.items()
+                 if item[1].get("kind") == kind and version in (None, item[1].get("version"))),
+                key=lambda item: item[1].get("added", 0), reverse=True
+            )
+            found = None
+            for sha, entry in candidates:
+                if self._intact(sha, entry):
+                    entry["last_used"] = time.time()
+                    found = (sha, self.object_path(sha))
+                    break
+                print(f"Artifact cache: dropping damaged {kind} {entry.get('version')} ({sha[:12]})")
+                self._drop(index, sha)
+            if candidates:
+                self._save(index)
+            return found
+
+    def put(self, path, kind, version, pinned=False, **meta):
+        """Store a copy of `path`; returns its sha256."""
+        sha = sha256_file(path)
+        with self._lock:
+            index = self._load()
+            entry = index.get(sha, {})
+            if not self._intact(sha, entry):
+                target = self.object_path(sha)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                tmp = f"{target}.{os.getpid()}.tmp"
+                shutil.copyfile(path, tmp)
+                os.replace(tmp, target)
+            now = time.time()
+            entry.update(meta, kind=kind, version=version, size=os.path.getsize(path), last_used=now)
+            entry.setdefault("added", now)
+            entry["pinned"] = pinned or entry.get("pinned", False)
+            index[sha] = entry
+            self._evict(index)
+            self._save(index)
+        return sha
+
+    def pin(self, ref, pinned=True):
+        """Pin/unpin by sha256 prefix or version; returns the number of entries changed."""
+        with self._lock:
+            index = self._load()
+            matched = [e for sha, e in index.items() if sha.startswith(ref) or e.get("version") == ref]
+            for entry in matched:
+                entry["pinned"] = pinned
+            if matched:
+                self._save(index)
+            return len(matched)
+
+    def entries(self):
+        with self._lock:
+            return sorted(self._load().items(), key=lambda item: item[1].get("last_used", 0), reverse=True)
+
+    def prune(self):
+        with self._lock:
+            index = self._load()
+            for sha, entry in list(index.items()):
+                if not self._intact(sha, entry):
+                    self._drop(index, sha)
+            self._evict(index)
+            self._save(index)
+
+    def _evict(self, index):
+        total = sum(e.get("size", 0) for e in index.values())
+        for sha, entry in sorted(index.items(), key=lambda item: item[1].get("last_used", 0)):
+            if total <= self.max_bytes:
+                break
+            if entry.get("pinned"):
+                continue
+            total -= entry.get("size", 0)
+            self._drop(index, sha)
+
+artifact_cache = ArtifactCache()
+
+
+### --cache list | pin REF | unpin REF | prune ###
+def run_cache_cli(argv):
+    attach_parent_console()
+    command = argv[1] if len(argv) > 1 else "list"
+    if command in ("pin", "unpin") and len(argv) > 2:
+        count = artifact_cache.pin(argv[2], pinned=command == "pin")
+        print(f"{command}ned {count} artifact(s)." if count else f"No artifact matches {argv[2]}.")
+        return 0 if count else 1
+    if command == "prune":
+        artifact_cache.prune()
+    elif command != "list":
+        print("usage: --cache [list | pin <sha256|version> | unpin <sha256|version> | prune]")
+        return 2
+
+    entries = artifact_cache.entries()
+    for sha, e in entries:
+        used = time.strftime("%Y-%m-%d %H:%M", time.localtime(e.get("last_used", 0)))
+        pin = "pinned" if e.get("pinned") else ""
+        print(f"{sha[:12]}  {e.get('kind', '?'):<6} {e.get('version', '?'):<12} "
+              f"{e.get('size', 0) / (1024 * 1024):7.1f} MB  {used}  {pin}")
+    total = sum(e.get("size", 0) for _, e in entries)
+    print(f"{len(entries)} artifact(s), {total / (1024 * 1024):.1f} of "
+          f"{artifact_cache.max_bytes / (1024 * 1024):.0f} MB in {artifact_cache.root}")
+    return 0
+
+
+# ---------------- INSTALL STEP GRAPH ---------------- #
+
+INSTALL_WORKERS = 4
+
+_step_local = threading.local()
+
+
+class InstallError(Exception):
+    """A required install step failed; the message is shown to the user."""
+
+
+@dataclass
+class InstallStep:
+    name: str
+    func: object
+    after: tuple = ()          # steps that must be done before this one starts
+    optional: bool = False     # failure is logged, the install goes on
+    state: str = "pending"     # pending / running / done / failed / skipped
+    started: float = 0.0
+    finished: float = 0.0
+    error: str = ""
+    log: list = field(default_factory=list)  # buffered (log_func, message)
+
+    @property
+    def duration(self):
+        return self.finished - self.started if self.finished else 0.0
+
+
+### Log buffer of the step running on this thread (None outside of steps) ###
+def step_log_buffer():
+    return getattr(_step_local, "buffer", None)
+
+
+class StepGraph:
+    """
+    Runs InstallSteps on a bounded thread pool as soon as all steps in
+    their `after` are done.
+
+    Steps must be declared after their dependencies (so the graph can't
+    have cycles). Log lines written inside a step are buffered and flushed
+    in declaration order, so install.log reads the same however the steps
+    overlapped.
+    """
+
+    def __init__(self, steps, workers=INSTALL_WORKERS, on_progress=None):
+        self.steps = {}
+        for step in steps:
+            for dep in step.after:
+                if dep not in self.steps:
+                    raise ValueError(f"Step '{step.name}' depends on '{dep}', which is not declared before it")
+            self.steps[step.name] = step
+        self.order = list(self.steps.values())
+        self.workers = workers
+        self.on_progress = on_progress
+        self.wall = 0.0
+
+    def _run_step(self, step):
+        _step_local.buffer = step.log
+        step.started = time.perf_counter()
+        try:
+            step.func()
+            step.state = "done"
+        except Exception as e:
+            step.error = str(e) or type(e).__name__
+            step.state = "failed"
+        finally:
+            step.finished = time.perf_counter()
+            _step_local.buffer = None
+
+    def _submit_ready(self, pool, running):
+        for step in self.order:
+            if step.state != "pending":
+                continue
+            deps = [self.steps[d] for d in step.after]
+            if any(d.state in ("failed", "skipped") for d in deps):
+                step.state = "skipped"
+            elif all(d.state == "done" for d in deps):
+                step.state = "running"
+                running[pool.submit(self._run_step, step)] = step
+
+    def _flush(self, flushed, log):
+        while flushed < len(self.order) and self.order[flushed].state not in ("pending", "running"):
+            step = self.order[flushed]
+            for func, message in step.log:
+                func(message)
+            step.log.clear()
+            if step.state == "failed":
+                log(f"Step '{step.name}' failed: {step.error}")
+            elif step.state == "skipped":
+                log(f"Step '{step.name}' skipped.")
+            flushed += 1
+        return flushed
+
+    def run(self, log):
+        """Run all steps; raises InstallError for the first failed required step."""
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+        start = time.perf_counter()
+        running = {}
+        flushed = 0
+        failed = None
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="InstallStep") as pool:
+            self._submit_ready(pool, running)
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    if step.state == "failed" and not step.optional and failed is None:
+                        failed = step
+                if failed is None:
+                    self._submit_ready(pool, running)
+                flushed = self._flush(flushed, log)
+                if self.on_progress:
+                    finished = sum(s.state in ("done", "failed") for s in self.order)
+                    self.on_progress(finished, len(self.order))
+
+        for step in self.order:
+            if step.state == "pending":
+                step.state = "skipped"
+        self._flush(flushed, log)
+        self.wall = time.perf_counter() - start
+        self.report(log)
+
+        if failed is not None:
+            raise InstallError(failed.error)
+
+    def critical_path(self):
+        """Chain of steps that determined the wall-clock time."""
+        ran = [s for s in self.order if s.finished]
+        if not ran:
+            return []
+        step = max(ran, key=lambda s: s.finished)
+        path = [step]
+        while True:
+            deps = [self.steps[d] for d in step.after if self.steps[d].finished]
+            if not deps:
+                break
+            step = max(deps, key=lambda s: s.finished)
+            path.append(step)
+        return path[::-1]
+
+    def report(self, log):
+        sequential = sum(s.duration for s in self.order)
+        for step in self.order:
+            log(f"  {step.name:<16} {step.state:<8} {step.duration:6.1f} s")
+        log(
+            f"Install steps took {self.wall:.1f} s "
+            f"(sequential {sequential:.1f} s, saved {sequential - self.wall:.1f} s)"
+        )
+        log("Critical path: " + " → ".join(f"{s.name} ({s.duration:.1f} s)" for s in self.critical_path()))
+
 # ---------------- INSTALLER APP ---------------- #
 def ensure_admin():
     """
@@ -130,8 +1966,6 @@ def ensure_admin():
         )
         sys.exit()
 
-# Call immediately at startup
-ensure_admin()
 class InstallerApp:
     def __init__(self, root):
         self.root = root
@@ -156,7 +1990,6 @@ class InstallerApp:
         ) if os.path.exists(os.environ.get("ProgramW6432", os.environ.get("ProgramFiles", "C:\\Program Files"))) else os.path.join("C:\\Programme", "beszel-agent")
 
         self.custom_install_path = tk.StringVar(value=self.install_path)
-        self.downloads_folder = os.path.join(os.environ["USERPROFILE"], "Downloads")
 
         self.log_file = os.path.join(self.custom_install_path.get(), "install.log")
         self.control_center_source = os.path.join(
@@ -244,6 +2077,10 @@ class InstallerApp:
     # ---------- Utility ---------- #
 
     def log(self, message):
+        buffer = step_log_buffer()
+        if buffer is not None:
+            buffer.append((self.log, message))  # flushed in step order by StepGraph
+            return
         os.makedirs(self.install_path, exist_ok=True)
         with open(self.log_file, "a", encoding="utf-8", errors="ignore") as log:
             log.write(message + "\n")
@@ -754,35 +2591,41 @@ class InstallerApp:
     # ---------- Chocolatey / Download / Install ---------- #
 
     def check_and_install_choco(self):
+        """Full path of choco.exe, installing Chocolatey first if it is missing."""
         self.log("Checking if Chocolatey is installed...")
-        result = subprocess.run("choco -v", shell=True, capture_output=True, text=True)
-
-        if "not recognized" in result.stderr or result.returncode != 0:
-            self.log("Chocolatey is not installed. Installing...")
-            install_command = (
-                "Set-ExecutionPolicy Bypass -Scope Process -Force; "
-                "[System.Net.ServicePointManager]::SecurityProtocol = "
-                "[System.Net.ServicePointManager]::SecurityProtocol -bor 3072; "
-                "iex ((New-Object System.Net.WebClient).DownloadString('https://community.chocolatey.org/install.ps1'))"
-            )
-            result = subprocess.run(["powershell", "-Command", install_command], capture_output=True, text=True)
-            self.log(result.stdout + result.stderr)
-
-            if result.returncode != 0:
-                self.log("Error: Chocolatey could not be installed!")
-                messagebox.showerror("Error", "Chocolatey could not be installed. Please install it manually and try again.")
-                return False
-
-            self.log("Waiting 5 seconds for Chocolatey to initialize...")
-            time.sleep(5)
-
-            os.environ["PATH"] += os.pathsep + r"C:\ProgramData\chocolatey\bin"
-            self.log("Chocolatey added to PATH")
-
-        else:
-            self.log("Chocolatey is already installed.")
-
-        return True
+        choco = tool_available("choco")()
+        if choco:
+            result = subprocess.run([choco, "-v"], capture_output=True, text=True, creationflags=CREATE_NO_WINDOW)
+            if result.returncode == 0:
+                self.log(f"Chocolatey {result.stdout.strip()} is already installed.")
+                return choco
+
+        self.log("Chocolatey is not installed. Installing...")
+        install_script = (
+            "param($Url) "
+            "Set-ExecutionPolicy Bypass -Scope Process -Force; "
+            "[System.Net.ServicePointManager]::SecurityProtocol = "
+            "[System.Net.ServicePointManager]::SecurityProtocol -bor 3072; "
+            "iex ((New-Object System.Net.WebClient).DownloadString($Url))"
+        )
+        try:
+            result = powershell.run(install_script, timeout=CHOCO_BOOTSTRAP_TIMEOUT,
+                                    Url="https://community.chocolatey.org/install.ps1")
+            self.log(result.output + (result.error or ""))
+        except PowerShellError as e:
+            self.log(str(e))
+            result = None
+
+        if not result or not result.succeeded:
+            self.log("Error: Chocolatey could not be installed!")
+            raise InstallError("Chocolatey could not be installed. Please install it manually and try again.")
+
+        os.environ["PATH"] += os.pathsep + r"C:\ProgramData\chocolatey\bin"
+        self.log("Chocolatey added to PATH")
+        try:
+            return wait_for(tool_available("choco"), TOOL_TIMEOUT, "choco.exe to appear", log=self.log)
+        except WaitTimeout as e:
+            raise InstallError(f"Chocolatey was installed but is not usable: {e}")
 
     def page_installation(self):
         self.clear_frame()
@@ -797,6 +2640,9 @@ class InstallerApp:
         )
         self.progress.pack(pady=10)
 
+        self.download_status_var = tk.StringVar(value="")
+        ttk.Label(self.frame, textvariable=self.download_status_var, style="CardText.TLabel").pack()
+
         self.install_log_text = scrolledtext.ScrolledText(self.frame, wrap=tk.WORD, height=10, width=80, state=tk.DISABLED)
         self.install_log_text.pack(pady=10, fill="both", expand=True)
 
@@ -806,67 +2652,24 @@ class InstallerApp:
 
         threading.Thread(target=self.install_agent, daemon=True).start()
 
-    def get_latest_beszel_agent_url(self):
-        api_url = "https://api.github.com/repos/henrygd/beszel/releases/latest"
-        response = requests.get(api_url)
-        if response.status_code == 200:
-            data = response.json()
-            for asset in data.get("assets", []):
-                if "beszel-agent_windows_amd64.zip" in asset.get("name", ""):
-                    return asset.get("browser_download_url")
-        self.log("Could not determine latest agent version.")
-        return None
-
-    def download_file(self, url, dest):
-        self.log(f"Downloading {url} to {dest}...")
-        response = requests.get(url, stream=True)
-        if response.status_code == 200:
-            with open(dest, "wb") as file:
-                for chunk in response.iter_content(chunk_size=8192):
-                    file.write(chunk)
-            self.log("Download completed.")
-        else:
-            self.log(f"Download failed: HTTP {response.status_code}")
-            messagebox.showerror("Error", f"Error while downloading file: HTTP {response.status_code}")
-            return False
-        return True
-
-    def extract_zip(self, zip_path, extract_to):
-        self.log(f"Checking ZIP file: {zip_path}")
-
-        if not os.path.exists(zip_path) or os.path.getsize(zip_path) == 0:
-            self.log("Error: ZIP file missing or empty!")
-            messagebox.showerror("Error", "ZIP file missing or empty. Installation aborted.")
-            return False
-
-        try:
-            with zipfile.ZipFile(zip_path, "r") as zip_ref:
-                self.log("ZIP is valid. Extracting...")
-                zip_contents = zip_ref.namelist()
-                self.log(f"ZIP contents: {zip_contents}")
-
-                if not zip_contents:
-                    self.log("Error: ZIP is empty after content check!")
-                    messagebox.showerror("Error", "ZIP file is empty. Installation aborted.")
-                    return False
-
-                os.makedirs(extract_to, exist_ok=True)
-                zip_ref.extractall(extract_to)
-                self.log("ZIP extraction completed successfully.")
-
-            os.remove(zip_path)
-            self.log("ZIP file deleted after extraction.")
-            return True
-
-        except zipfile.BadZipFile:
-            self.log("Error: ZIP file is corrupted!")
-            messagebox.showerror("Error", "The downloaded ZIP file is corrupted. Please try again.")
-            return False
-
-        except PermissionError:
-            self.log("Error: Permission denied while extracting ZIP!")
-            messagebox.showerror("Error", "No permission to extract ZIP. Try running as Administrator.")
-            return False
+    def find_latest_agent_assets(self):
+        """ZIP and checksums.txt URL of the latest release (shared release cache)."""
+        data = get_latest_release()
+        zip_asset = checksums_url = None
+        for asset in (data or {}).get("assets", []):
+            name = asset.get("name", "")
+            if "beszel-agent_windows_amd64.zip" in name:
+                zip_asset = (name, asset.get("browser_download_url"))
+            elif name.endswith("checksums.txt"):
+                checksums_url = asset.get("browser_download_url")
+        if not zip_asset:
+            self.log("Could not determine latest agent version.")
+        return zip_asset, checksums_url
+
+    def show_download_progress(self, status):
+        self.download_fraction = status.done / status.total if status.total else 0.0
+        self.root.after(0, lambda: self.download_status_var.set(status.describe()))
+        self.set_install_progress()
 
     def install_control_center(self):
         target_dir = os.path.join(self.install_path, "control-center")
@@ -886,35 +2689,21 @@ class InstallerApp:
             desktop = os.path.join(os.environ["USERPROFILE"], "Desktop")
             shortcut_path = os.path.join(desktop, "Beszel Control Center.lnk")
 
-            # PowerShell Script (absolut stabil)
-            ps_script = f'''
-                $WshShell = New-Object -ComObject WScript.Shell
-                $Shortcut = $WshShell.CreateShortcut("{shortcut_path}")
-                $Shortcut.TargetPath = "{target_path}"
-                $Shortcut.WorkingDirectory = "{os.path.dirname(target_path)}"
-                $Shortcut.IconLocation = "{target_path},0"
+            # Pfade als Parameter, nicht in den Skripttext eingesetzt
+            result = powershell.run(
+                """
+                param($Link, $Target, $WorkingDirectory)
+                $Shortcut = (New-Object -ComObject WScript.Shell).CreateShortcut($Link)
+                $Shortcut.TargetPath = $Target
+                $Shortcut.WorkingDirectory = $WorkingDirectory
+                $Shortcut.IconLocation = "$Target,0"
                 $Shortcut.Save()
-                '''
-
-            # Schreibe temporäre PS-Datei
-            temp_ps_path = os.path.join(self.install_path, "create_shortcut.ps1")
-            with open(temp_ps_path, "w", encoding="utf-8") as f:
-                f.write(ps_script)
-
-            # Führe Skript aus
-            result = subprocess.run(
-                ["powershell", "-ExecutionPolicy", "Bypass", "-File", temp_ps_path],
-                capture_output=True, text=True
+                """,
+                Link=shortcut_path, Target=target_path, WorkingDirectory=os.path.dirname(target_path)
             )
 
-            # Lösche temporäres Skript
-            try:
-                os.remove(temp_ps_path)
-            except:
-                pass
-
-            if result.returncode != 0:
-                self.log_install(f"Shortcut creation failed: {result.stderr}")
+            if not result.succeeded:
+                self.log_install(f"Shortcut creation failed: {result.error or result.output}")
             else:
                 self.log_install(f"Desktop shortcut created at {shortcut_path}")
 
@@ -939,78 +2728,172 @@ class InstallerApp:
             self.log(f"Failed to copy installer: {e}")
 
     def install_agent(self):
-        self.progress["value"] = 10
-
-        if not self.check_and_install_choco():
-            return
+        self.set_progress(10)
 
         self.log_install("Starting installation...")
         self.install_path = self.custom_install_path.get().strip()
         os.makedirs(self.install_path, exist_ok=True)
+        self.steps_finished, self.download_fraction = 0, 0.0
+
+        # Native: no Chocolatey/NSSM at all; NSSM only on request or as fallback in start_service()
+        use_nssm = SERVICE_MANAGER == "nssm"
+        manager_steps = [InstallStep("nssm", self.install_nssm)] if use_nssm else []
+
+        # Reihenfolge = Log-Reihenfolge; after=() heißt: läuft sofort parallel los
+        graph = StepGraph(manager_steps + [
+            InstallStep("lookup", self.lookup_latest_agent),
+            InstallStep("fetch", self.fetch_agent, after=("lookup",)),
+            InstallStep("version", self.write_installed_version, after=("lookup",)),
+            InstallStep("control_center", self.install_control_center),
+            InstallStep("shortcut", self.create_control_center_shortcut, after=("control_center",), optional=True),
+            InstallStep("self_copy", self.copy_installer_self, optional=True),
+            InstallStep("env", self.apply_env_vars),
+            InstallStep("service", self.create_service, after=("nssm", "fetch") if use_nssm else ("fetch",)),
+            InstallStep("start", self.start_service, after=("service", "version", "env")),
+            InstallStep("firewall", self.ensure_firewall_rule, optional=True),
+        ], on_progress=self.on_steps_finished)
+        self.steps_total = len(graph.order)
 
-        latest_url = self.get_latest_beszel_agent_url()
-        if not latest_url:
-            self.log("Error: Could not retrieve latest Beszel Agent version.")
-            messagebox.showerror("Error", "Could not retrieve latest Beszel Agent version.")
+        try:
+            graph.run(self.log_install)
+        except InstallError as e:
+            self.log("Installation aborted.")
+            message = str(e)
+            self.root.after(0, lambda: messagebox.showerror("Error", message))
             return
 
-        zip_path = os.path.join(self.downloads_folder, "beszel-agent.zip")
+        self.set_progress(100)
+        self.root.after(2000, self.page_summary)
 
-        self.log_install("Downloading latest Beszel Agent...")
-        if not self.download_file(latest_url, zip_path):
+    def on_steps_finished(self, finished, total):
+        self.steps_finished, self.steps_total = finished, total
+        self.set_install_progress()
+
+    def set_install_progress(self):
+        # A running download counts as the finished fraction of its step
+        done = self.steps_finished + (self.download_fraction if self.download_fraction < 1 else 0)
+        value = 10 + 90 * done / self.steps_total
+        self.root.after(0, lambda: self.progress.configure(value=value))
+
+    # ---------- Install steps (run by the StepGraph) ---------- #
+
+    def lookup_latest_agent(self):
+        zip_asset, checksums_url = self.find_latest_agent_assets()
+        if not zip_asset:
+            raise InstallError("Could not retrieve latest Beszel Agent version.")
+        self.zip_name, self.latest_url = zip_asset
+        self.checksums_url = checksums_url
+        self.latest_version = agent_version_from(self.latest_url)
+
+    def fetch_agent(self):
+        """Cached copy if we have this version, else download → hash → inflate → atomic rename, in one pass."""
+        self.final_agent_path = os.path.join(self.install_path, "beszel-agent.exe")
+
+        cached = artifact_cache.lookup("agent", self.latest_version) if self.latest_version else None
+        if cached:
+            sha, _ = cached
+            self.log_install(f"Using cached Beszel Agent {self.latest_version} ({sha[:12]}), no download needed.")
+            self.install_from_cache(sha, self.final_agent_path)
             return
 
-        extract_path = os.path.join(self.downloads_folder, "beszel-agent-extracted")
-        shutil.rmtree(extract_path, ignore_errors=True)
-        os.makedirs(extract_path, exist_ok=True)
-
-        self.log_install("Extracting agent ZIP...")
-        with zipfile.ZipFile(zip_path, "r") as z:
-            z.extractall(extract_path)
-
-        agent_exe_path = None
-        for name in os.listdir(extract_path):
-            if name.startswith("beszel-agent") and name.endswith(".exe"):
-                agent_exe_path = os.path.join(extract_path, name)
-                break
+        self.archive_sha256 = fetch_release_checksum(self.checksums_url, self.zip_name) if self.checksums_url else None
+        if self.archive_sha256:
+            self.log(f"Expected SHA-256 of {self.zip_name}: {self.archive_sha256}")
+        else:
+            self.log(f"WARNING: no published checksum for {self.zip_name}, only the ZIP CRC is checked.")
 
-        if not agent_exe_path:
-            messagebox.showerror("Error", "Extracted Beszel Agent EXE not found.")
-            return
+        self.log_install("Downloading and extracting latest Beszel Agent...")
 
-        final_agent_path = os.path.join(self.install_path, "beszel-agent.exe")
-        shutil.copy(agent_exe_path, final_agent_path)
-        self.log_install(f"Agent copied to: {final_agent_path}")
+        # Raw ZIP bytes survive a crash here, the next run resumes from them
+        part = os.path.join(self.install_path, f".{self.zip_name}.part")
+        # Temp file next to the target: same volume, so os.replace() is atomic
+        tmp = tempfile.NamedTemporaryFile(
+            dir=self.install_path, prefix=".beszel-agent-", suffix=".tmp", delete=False
+        )
+        try:
+            with tmp:
+                downloader = Downloader(on_progress=self.show_download_progress)
+                extractor = self.stream_zip_member(
+                    downloader, self.latest_url, part, lambda name: AGENT_MEMBER.match(os.path.basename(name)), tmp
+                )
+                tmp.flush()
+                os.fsync(tmp.fileno())
+
+            digest = extractor.sha256.hexdigest()
+            self.log(f"Downloaded {self.latest_url} ({downloader.summary()}), SHA-256 {digest}")
+            if self.archive_sha256 and digest != self.archive_sha256.lower():
+                Downloader.discard(part)
+                raise InstallError(f"Checksum mismatch for the agent ZIP:\n{digest}\nexpected {self.archive_sha256}")
+
+            os.replace(tmp.name, self.final_agent_path)
+            Downloader.discard(part)
+        except (DownloadError, ValueError, zlib.error) as e:
+            self.log(f"Download failed: {e}")
+            raise InstallError(f"Error while downloading the Beszel Agent: {e}")
+        finally:
+            if os.path.exists(tmp.name):
+                os.remove(tmp.name)
+
+        self.log_install(f"Agent ({extractor.member}, {extractor.size} bytes) installed to: {self.final_agent_path}")
+
+        if self.latest_version:
+            try:
+                artifact_cache.put(self.final_agent_path, "agent", self.latest_version,
+                                   name=self.zip_name, archive_sha256=self.archive_sha256)
+            except OSError as e:
+                self.log(f"Could not add the agent to the artifact cache: {e}")
+
+    def stream_zip_member(self, downloader, url, part, match, out):
+        """
+        Inflate the first member with match(name) of the ZIP at `url` into
+        `out`, resuming from `part`. Starts over once if the server will not
+        continue it; bytes that fail to parse are not kept for the next run.
+        """
+        for attempt in range(2):
+            out.seek(0)
+            out.truncate()
+            extractor = ZipStreamExtractor(match, out)
+            try:
+                downloader.stream(url, extractor.feed, part=part)
+                extractor.close()
+                return extractor
+            except RemoteChanged as e:
+                Downloader.discard(part)
+                if attempt:
+                    raise
+                self.log(f"{e}, downloading {url} again from the start.")
+            except (ValueError, zlib.error):
+                Downloader.discard(part)
+                raise
+
+    def install_from_cache(self, sha, target):
+        """Copy a verified cache object next to the target, then rename over it."""
+        if os.path.exists(target) and sha256_file(target) == sha:
+            return  # identical file already there (and maybe locked by the running service)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        try:
+            shutil.copyfile(artifact_cache.object_path(sha), tmp)
+            os.replace(tmp, target)
+        except OSError as e:
+            raise InstallError(f"Could not install {os.path.basename(target)} from the artifact cache: {e}")
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
 
-        # ---------------------------------------
-        # NEW: Extract and save installed version
-        # ---------------------------------------
-        import re
-        version_match = re.search(r"v?(\d+\.\d+\.\d+)", latest_url)
-        installed_version = version_match.group(1) if version_match else "Unknown"
+    def write_installed_version(self):
+        installed_version = self.latest_version or "Unknown"
 
         self.log_install(f"Detected Beszel Agent version: {installed_version}")
         self.log_install("Writing installed version to registry...")
 
-        subprocess.run(
-            [
-                "reg", "add",
-                r"HKLM\SYSTEM\CurrentControlSet\Services\beszelagent\Parameters",
-                "/v", "InstalledVersion",
-                "/t", "REG_SZ",
-                "/d", installed_version,
-                "/f"
-            ],
-            stdin=subprocess.DEVNULL,
-            capture_output=True,
-            text=True,
-            creationflags=0x08000000
-        )
-
-        self.log_install("Installing Control Center...")
-        self.install_control_center()
+        batch = RegistryBatch()
+        batch.set(PARAMETERS_KEY, "InstalledVersion", installed_version)
+        try:
+            batch.apply()
+        except RegistryWriteError as e:
+            raise InstallError(f"Could not write the installed version: {e}")
 
-        # Create desktop shortcut
+    def create_control_center_shortcut(self):
         control_center_exe = os.path.join(self.install_path, "control-center", "BeszelAgentControlCenter.exe")
         if os.path.exists(control_center_exe):
             self.log_install("Creating desktop shortcut...")
@@ -1018,122 +2901,177 @@ class InstallerApp:
         else:
             self.log_install("Control Center executable not found — cannot create shortcut.")
 
-        self.log_install("Copying installer to install directory...")
-        self.copy_installer_self()
-
+    def install_nssm(self):
+        self.nssm_path = LOCAL_NSSM_PATH
+        os.makedirs(os.path.dirname(self.nssm_path), exist_ok=True)
+        cached = artifact_cache.lookup("nssm")
+        if cached:
+            sha, _ = cached
+            self.log_install(f"Using cached NSSM ({sha[:12]}).")
+            self.install_from_cache(sha, self.nssm_path)
+            return
 
-        self.log_install("Installing NSSM...")
+        try:
+            sha = self.download_nssm()
+        except (DownloadError, ValueError, zlib.error, OSError) as e:
+            # nssm.cc is not always reachable; Chocolatey mirrors the same build
+            self.log(f"NSSM download failed ({e}), falling back to Chocolatey.")
+            sha = self.install_nssm_via_choco()
+        if sha:
+            self.install_from_cache(sha, self.nssm_path)
+        else:
+            self.nssm_path = CHOCO_NSSM_PATH
+
+    def download_nssm(self):
+        """nssm.exe straight from the release ZIP into the artifact cache; returns its sha256."""
+        self.log_install(f"Downloading NSSM {NSSM_VERSION}...")
+        part = os.path.join(os.path.dirname(self.nssm_path), f".nssm-{NSSM_VERSION}.zip.part")
+        tmp = tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(self.nssm_path), prefix=".nssm-", suffix=".tmp", delete=False
+        )
+        try:
+            with tmp:
+                downloader = Downloader()
+                extractor = self.stream_zip_member(downloader, NSSM_URL, part, lambda name: NSSM_MEMBER.search(name), tmp)
+            digest = extractor.sha256.hexdigest()
+            self.log(f"Downloaded {NSSM_URL} ({downloader.summary()}), SHA-256 {digest}")
+            Downloader.discard(part)
+            if digest != NSSM_SHA256:
+                raise DownloadError(f"checksum mismatch for nssm-{NSSM_VERSION}.zip: {digest}, expected {NSSM_SHA256}")
+            self.log(f"NSSM archive verified, {extractor.member} ({extractor.size} bytes)")
+            return artifact_cache.put(tmp.name, "nssm", NSSM_VERSION, name="nssm.exe", url=NSSM_URL)
+        finally:
+            if os.path.exists(tmp.name):
+                os.remove(tmp.name)
+
+    def install_nssm_via_choco(self):
+        """Fallback; returns the cached sha256, or None to run the Chocolatey shim directly."""
+        choco = self.check_and_install_choco()
+        self.log_install("Installing NSSM via Chocolatey...")
         result = subprocess.run(
-            "choco install nssm -y",
-            shell=True,
+            [choco, "install", "nssm", "-y"],
             capture_output=True,
-            text=True
+            text=True,
+            creationflags=CREATE_NO_WINDOW
         )
         self.log(result.stdout + result.stderr)
 
-        nssm_path = r"C:\ProgramData\chocolatey\bin\nssm.exe"
-        if not os.path.exists(nssm_path):
-            messagebox.showerror("Error", "NSSM not found after installation.")
-            return
-
-        self.progress["value"] = 30
+        if not os.path.exists(CHOCO_NSSM_PATH):
+            raise InstallError("NSSM not found after installation.")
 
-        self.log_install("Creating service via NSSM...")
-        subprocess.run(
-            [nssm_path, "install", "beszelagent", final_agent_path],
-            stdin=subprocess.DEVNULL,
-            capture_output=True,
-            text=True,
-            creationflags=0x08000000
+        # The choco shim only forwards to the real binary, which is what we cache
+        real_nssm = os.path.join(os.path.dirname(os.path.dirname(CHOCO_NSSM_PATH)), "lib", "NSSM", "tools", "nssm.exe")
+        version = re.search(r"nssm v?(\d+(?:\.\d+)+)", result.stdout, re.IGNORECASE)
+        try:
+            return artifact_cache.put(real_nssm if os.path.exists(real_nssm) else CHOCO_NSSM_PATH, "nssm",
+                                      version.group(1) if version else "unknown", name="nssm.exe")
+        except OSError as e:
+            self.log(f"Could not cache NSSM, using the Chocolatey copy: {e}")
+            return None
+
+    def service_config(self):
+        key = self.user_key.get().strip()
+        return ServiceConfig(
+            binary=self.final_agent_path,
+            start_type=self.service_start_type.get(),
+            environment={"KEY": key} if key else {},
         )
 
-        start_type_map = {
-            "auto": "SERVICE_AUTO_START",
-            "delayed": "SERVICE_DELAYED_START",
-            "manual": "SERVICE_DEMAND_START",
-            "disabled": "SERVICE_DISABLED"
-        }
-
-        st = self.service_start_type.get()
-        if st in start_type_map:
-            subprocess.run(
-                [nssm_path, "set", "beszelagent", "Start", start_type_map[st]],
-                stdin=subprocess.DEVNULL,
-                creationflags=0x08000000
-            )
-
-        if self.user_key.get():
-            subprocess.run(
-                [nssm_path, "set", "beszelagent", "AppEnvironmentExtra", f"KEY={self.user_key.get()}"],
-                stdin=subprocess.DEVNULL,
-                creationflags=0x08000000
-            )
+    def create_service(self):
+        self.service_manager = make_service_manager(nssm_path=getattr(self, "nssm_path", None))
+        self.log_install(f"Registering service ({self.service_manager.name})...")
+        try:
+            self.service_manager.install(self.service_config())
+        except OSError as e:
+            raise InstallError(f"Could not register the beszelagent service: {e}")
+        if self.user_key.get().strip():
             self.log_install("Public KEY applied.")
 
-        if self.env_vars:
-            self.log_install("Applying environment variables...")
-            for name, value in self.env_vars:
-                subprocess.run(
-                    [
-                        "reg", "add",
-                        r"HKLM\SYSTEM\CurrentControlSet\Control\Session Manager\Environment",
-                        "/v", name, "/t", "REG_SZ", "/d", value, "/f"
-                    ],
-                    stdin=subprocess.DEVNULL,
-                    capture_output=True,
-                    text=True,
-                    creationflags=0x08000000
-                )
-
-        self.progress["value"] = 50
-
+    def apply_env_vars(self):
+        if not self.env_vars:
+            return
+        self.log_install("Applying environment variables...")
+        batch = RegistryBatch()
+        for name, value in self.env_vars:
+            batch.set(MACHINE_ENVIRONMENT_KEY, name, value)
+        try:
+            written = batch.apply()
+        except RegistryWriteError as e:
+            raise InstallError(f"Could not apply the environment variables: {e}")
+        self.log_install(f"Environment variables: {written} written, {batch.skipped} unchanged.")
+
+    def start_service(self):
+        if self.service_start_type.get() == "disabled":
+            self.log_install("Start type is Disabled — not starting the service.")
+            return
         self.log_install("Starting service...")
-        subprocess.run(
-            ["sc", "start", "beszelagent"],
-            stdin=subprocess.DEVNULL,
-            capture_output=True,
-            text=True,
-            creationflags=0x08000000
-        )
 
-        time.sleep(2)
-
-        status = subprocess.run(
-            ["sc", "query", "beszelagent"],
-            capture_output=True,
-            text=True,
-            creationflags=0x08000000
-        ).stdout
+        if not self.try_start_service() and self.service_manager.name == "native":
+            # Opt-in native image failed (typically 1053: binary never connected to the SCM)
+            self.log_install("Agent could not run as a native service, switching to NSSM...")
+            self.install_nssm()
+            self.service_manager = make_service_manager("nssm", self.nssm_path)
+            try:
+                self.service_manager.install(self.service_config())
+            except OSError as e:
+                raise InstallError(f"Could not register the beszelagent service: {e}")
+            self.try_start_service()
 
-        if "RUNNING" not in status.upper():
-            messagebox.showerror("Service Error", "Beszel Agent failed to start. Check logs.")
+        if service_backend.query(SERVICE_NAME).state != "RUNNING":
+            self.root.after(0, lambda: messagebox.showerror("Service Error", "Beszel Agent failed to start. Check logs."))
             self.log("SERVICE FAILED TO START")
-        else:
-            self.log("Service is running.")
+            return
+        self.log("Service is running.")
 
-        rule_name = "Beszel Agent"
-        check = subprocess.run(
-            ["powershell", "-Command", f"Get-NetFirewallRule -DisplayName '{rule_name}' | Out-String"],
-            capture_output=True,
-            text=True,
-            creationflags=0x08000000
-        )
+        port = self.agent_port()
+        try:
+            wait_for(port_listening(port), SERVICE_START_TIMEOUT, f"the agent to listen on port {port}", log=self.log_install)
+        except WaitTimeout as e:
+            self.log_install(f"WARNING: {e}")
 
-        if rule_name not in check.stdout:
-            self.log("Creating firewall rule...")
-            subprocess.run(
-                [
-                    "powershell",
-                    "-Command",
-                    "New-NetFirewallRule -DisplayName 'Beszel Agent' -Direction Inbound -LocalPort 45876 -Protocol TCP -Action Allow"
-                ],
-                capture_output=True,
-                text=True,
-                creationflags=0x08000000
+    def try_start_service(self):
+        """True once RUNNING; False if it fails to start, stops again or the deadline passes."""
+        try:
+            service_backend.start(SERVICE_NAME)
+        except OSError as e:
+            self.log(f"StartService failed: {e}")
+            return False
+        try:
+            state = wait_for(service_in_state("RUNNING", "STOPPED"), SERVICE_START_TIMEOUT,
+                             "the service to leave START_PENDING", log=self.log_install)
+        except WaitTimeout:
+            return False
+        return state == "RUNNING"
+
+    def agent_port(self):
+        # LISTEN may be "45876", ":45876" or "0.0.0.0:45876"
+        for name, value in self.env_vars:
+            if name.upper() in ("LISTEN", "PORT"):
+                match = re.search(r"(\d+)$", value.strip())
+                if match:
+                    return int(match.group(1))
+        return AGENT_PORT
+
+    def ensure_firewall_rule(self):
+        # Check and create in one round trip
+        try:
+            result = powershell.run(
+                """
+                param($Name, $Port)
+                if (Get-NetFirewallRule -DisplayName $Name -ErrorAction SilentlyContinue) { 'exists'; return }
+                New-NetFirewallRule -DisplayName $Name -Direction Inbound -LocalPort $Port -Protocol TCP `
+                    -Action Allow -ErrorAction Stop | Out-Null
+                'created'
+                """,
+                Name="Beszel Agent", Port=self.agent_port()
             )
+        except PowerShellError as e:
+            raise InstallError(f"Firewall rule could not be checked: {e}")
 
-        self.progress["value"] = 100
-        self.root.after(2000, self.page_summary)
+        if not result.succeeded:
+            raise InstallError(f"Firewall rule could not be created: {result.error or result.output}")
+        if "created" in result.output:
+            self.log("Firewall rule created.")
 
     # ---------- Uninstall ---------- #
 
@@ -1157,63 +3095,31 @@ class InstallerApp:
 
         self.progress["value"] = 0
 
-        self.root.after(200, self.uninstall_agent)
+        threading.Thread(target=self.uninstall_agent, daemon=True).start()
 
     def uninstall_agent(self):
         self.log_uninstall("Starting uninstallation...")
-        self.progress["value"] = 20
+        self.set_progress(20)
 
-        nssm_path = r"C:\ProgramData\chocolatey\bin\nssm.exe"
         service_name = "beszelagent"
 
         # Stop service
         self.log_uninstall("Stopping service...")
-        stop_result = subprocess.run(
-            [nssm_path, "stop", service_name],
-            capture_output=True,
-            text=True,
-            stdin=subprocess.DEVNULL,
-            creationflags=0x08000000
-        )
-        self.log_uninstall(stop_result.stdout + stop_result.stderr)
+        try:
+            service_backend.stop(service_name)
+            wait_for(service_in_state("STOPPED", "GONE", service_name=service_name), SERVICE_STOP_TIMEOUT,
+                     "the service to stop", log=self.log_uninstall)
+        except (OSError, WaitTimeout) as e:
+            self.log_uninstall(f"Stop failed: {e}")
 
-        self.progress["value"] = 40
+        self.set_progress(40)
 
 # -------- NEW: Delete install directory via Registry -------- #
 
-        # Registry key identical to control center logic
-        reg_key = r"HKLM\SYSTEM\CurrentControlSet\Services\beszelagent\Parameters"
-
-        try:
-            result = subprocess.run(
-                ["reg", "query", reg_key, "/v", "Application"],
-                capture_output=True,
-                text=True,
-                creationflags=0x08000000
-            )
-            out = result.stdout
-
-            if "Application" in out:
-                # Determine REG type
-                if "REG_EXPAND_SZ" in out:
-                    parts = out.split("REG_EXPAND_SZ")
-                elif "REG_SZ" in out:
-                    parts = out.split("REG_SZ")
-                else:
-                    parts = None
-
-                if parts:
-                    raw_path = parts[1].strip().strip('"')
-                    expanded = os.path.expandvars(raw_path)
-                    # Remove EXE name → keep folder
-                    install_dir = os.path.dirname(expanded)
-                else:
-                    install_dir = None
-            else:
-                install_dir = None
-
-        except Exception as e:
-            install_dir = None
+        # Same in-process lookup as the Control Center (no reg.exe)
+        application = read_service_application(service_name)
+        # Remove EXE name → keep folder
+        install_dir = os.path.dirname(application) if application else None
 
         if not install_dir or not os.path.exists(install_dir):
             self.log_uninstall(f"Install directory not found via registry. Value: {install_dir}")
@@ -1221,42 +3127,29 @@ class InstallerApp:
             self.log_uninstall(f"Removing installation directory: {install_dir}")
 
             try:
-                if os.path.exists(install_dir):
-                    shutil.rmtree(install_dir, ignore_errors=True)
-
-                # Double check (Windows sometimes locks files)
-                if os.path.exists(install_dir):
-                    self.log_uninstall("Warning: Directory still exists, retrying...")
-                    time.sleep(1)
-                    shutil.rmtree(install_dir, ignore_errors=True)
-
-                if not os.path.exists(install_dir):
-                    self.log_uninstall("Directory removed successfully.")
-                else:
-                    self.log_uninstall("Warning: Could not fully delete directory.")
-
+                # Windows releases the agent's file handles a little after STOPPED
+                wait_for(path_removed(install_dir), FILE_UNLOCK_TIMEOUT, "the install directory to unlock",
+                         log=self.log_uninstall)
+                self.log_uninstall("Directory removed successfully.")
+            except WaitTimeout:
+                self.log_uninstall("Warning: Could not fully delete directory.")
             except Exception as e:
                 self.log_uninstall(f"Error deleting directory: {e}")
 
-        self.progress["value"] = 90
+        # Remove service (before the summary page replaces the log widget)
+        self.log_uninstall("Removing service...")
+        try:
+            make_service_manager().remove(service_name)
+            self.log_uninstall("Service removed.")
+        except OSError as e:
+            self.log_uninstall(f"Remove failed: {e}")
+
+        self.set_progress(90)
         self.log_uninstall("Uninstallation completed.")
         self.installation_status = "Uninstallation successful!"
-        self.progress["value"] = 100
+        self.set_progress(100)
         self.root.after(2000, self.page_summary)
 
-        # Remove service
-        self.log_uninstall("Removing service...")
-        remove_result = subprocess.run(
-            [nssm_path, "remove", service_name, "confirm"],
-            capture_output=True,
-            text=True,
-            stdin=subprocess.DEVNULL,
-            creationflags=0x08000000
-        )
-        self.log_uninstall(remove_result.stdout + remove_result.stderr)
-
-        self.progress["value"] = 60
-
     # ---------- Update ---------- #
 
     def page_update(self):
@@ -1279,40 +3172,123 @@ class InstallerApp:
 
         self.progress["value"] = 0
 
-        self.root.after(500, self.update_agent)
+        threading.Thread(target=self.update_agent, daemon=True).start()
 
     def update_agent(self):
         self.log_to_gui("Starting Beszel Agent update...")
-        self.progress["value"] = 10
+        self.set_progress(10)
 
         agent_path = os.path.join(self.install_path, "beszel-agent.exe")
 
         if not os.path.exists(agent_path):
             self.log_to_gui("Error: Beszel Agent not found! Update aborted.")
-            messagebox.showerror("Update error", "Beszel Agent not found. Cannot update.")
+            self.root.after(0, lambda: messagebox.showerror("Update error", "Beszel Agent not found. Cannot update."))
             self.root.after(1000, self.page_summary)
             return
 
-        update_command = f'powershell -Command "& {{Set-Location -Path \'{self.install_path}\'; ./beszel-agent update }}"'
+        try:
+            updated = self.update_from_cache(agent_path)
+        except Exception as e:
+            self.log_to_gui(f"Cached update failed: {e}")
+            updated = False
+        if updated:
+            self.finish_update()
+            return
 
-        self.progress["value"] = 40
+        self.set_progress(40)
 
         try:
-            result = subprocess.run(update_command, shell=True, capture_output=True, text=True)
+            # Direkt, ohne PowerShell-Hülle (wie im Control Center)
+            result = subprocess.run(
+                [agent_path, "update"],
+                cwd=self.install_path,
+                capture_output=True,
+                text=True,
+                stdin=subprocess.DEVNULL,
+                timeout=AGENT_UPDATE_TIMEOUT,
+                creationflags=CREATE_NO_WINDOW
+            )
             self.log_to_gui(result.stdout + result.stderr)
 
             if result.returncode == 0:
                 self.log_to_gui("Update completed successfully.")
+                # Ask the new binary itself, the update output also mentions the old version
+                try:
+                    probe = subprocess.run([agent_path, "-v"], capture_output=True, text=True, timeout=10,
+                                           stdin=subprocess.DEVNULL, creationflags=CREATE_NO_WINDOW)
+                    version = agent_version_from(probe.stdout)
+                    if version:
+                        artifact_cache.put(agent_path, "agent", version, name="beszel-agent.exe")
+                except (OSError, subprocess.SubprocessError) as e:
+                    self.log(f"Could not add the updated agent to the artifact cache: {e}")
             else:
                 self.log_to_gui(f"Update failed with code: {result.returncode}")
-                messagebox.showerror("Update error", f"Beszel Agent update failed. Code: {result.returncode}")
+                message = f"Beszel Agent update failed. Code: {result.returncode}"
+                self.root.after(0, lambda: messagebox.showerror("Update error", message))
         except Exception as e:
             self.log_to_gui(f"Update error: {e}")
-            messagebox.showerror("Update error", f"Error during update: {e}")
+            message = f"Error during update: {e}"
+            self.root.after(0, lambda: messagebox.showerror("Update error", message))
+
+        self.finish_update()
 
-        self.progress["value"] = 100
+    def finish_update(self):
+        def show_close():
+            self.progress["value"] = 100
+            ttk.Button(self.frame, text="Close", style="Accent.TButton", command=self.root.quit).pack(anchor="e", pady=10)
 
-        ttk.Button(self.frame, text="Close", style="Accent.TButton", command=self.root.quit).pack(anchor="e", pady=10)
+        self.root.after(0, show_close)
+
+    def update_from_cache(self, agent_path):
+        """Swap in the latest release from the artifact cache; False → fall back to `beszel-agent update`."""
+        latest = get_latest_release()
+        version = agent_version_from(latest.get("tag_name")) if latest else None
+        if not version:
+            return False
+        try:
+            installed = registry_writer.read(PARAMETERS_KEY, "InstalledVersion")
+        except OSError:
+            installed = None
+        if installed and installed[0] == version:
+            self.log_to_gui(f"Beszel Agent {version} is already installed.")
+            return True
+        cached = artifact_cache.lookup("agent", version)
+        if not cached:
+            return False
+
+        sha, _ = cached
+        self.log_to_gui(f"Beszel Agent {version} is cached ({sha[:12]}), replacing it offline...")
+        self.set_progress(30)
+        # Only a service that was running before gets started again afterwards
+        was_running = service_backend.query().state in ("RUNNING", "START_PENDING")
+        try:
+            if was_running:
+                service_backend.stop()
+                wait_for(service_in_state("STOPPED", "GONE"), SERVICE_STOP_TIMEOUT, "the service to stop", log=self.log_to_gui)
+            wait_for(file_unlocked(agent_path), FILE_UNLOCK_TIMEOUT, "beszel-agent.exe to unlock", log=self.log_to_gui)
+            self.set_progress(60)
+            self.install_from_cache(sha, agent_path)
+        except (OSError, WaitTimeout, InstallError) as e:
+            self.log_to_gui(f"Cannot replace the agent offline: {e}")
+            self.restart_after_update(was_running)
+            return False
+
+        self.latest_version = version
+        try:
+            self.write_installed_version()
+        except InstallError as e:
+            self.log_to_gui(str(e))
+        self.restart_after_update(was_running)
+        self.log_to_gui("Update completed successfully.")
+        return True
+
+    def restart_after_update(self, was_running):
+        if not was_running:
+            return
+        try:
+            service_backend.start()
+        except OSError as e:
+            self.log_to_gui(f"Service could not be started again: {e}")
 
     # ---------- Summary ---------- #
 
@@ -1333,24 +3309,40 @@ class InstallerApp:
 
     # ---------- Logging helpers ---------- #
 
+    # Update and uninstall run on worker threads: widgets are only touched via root.after
+
+    def set_progress(self, value):
+        self.root.after(0, lambda: self.progress.configure(value=value))
+
     def log_to_gui(self, message):
         self.log(message)
-        if self.log_text is not None:
-            self.log_text.config(state=tk.NORMAL)
-            self.log_text.insert(tk.END, message + "\n")
-            self.log_text.config(state=tk.DISABLED)
-            self.log_text.yview(tk.END)
+
+        def write():
+            if self.log_text is not None:
+                self.log_text.config(state=tk.NORMAL)
+                self.log_text.insert(tk.END, message + "\n")
+                self.log_text.config(state=tk.DISABLED)
+                self.log_text.yview(tk.END)
+
+        self.root.after(0, write)
 
     def log_uninstall(self, message):
         self.log(message)
-        if self.uninstall_log_text is not None:
-            self.uninstall_log_text.config(state=tk.NORMAL)
-            self.uninstall_log_text.insert(tk.END, message + "\n")
-            self.uninstall_log_text.config(state=tk.DISABLED)
-            self.uninstall_log_text.yview(tk.END)
-        self.root.update_idletasks()
+
+        def write():
+            if self.uninstall_log_text is not None:
+                self.uninstall_log_text.config(state=tk.NORMAL)
+                self.uninstall_log_text.insert(tk.END, message + "\n")
+                self.uninstall_log_text.config(state=tk.DISABLED)
+                self.uninstall_log_text.yview(tk.END)
+
+        self.root.after(0, write)
 
     def log_install(self, message):
+        buffer = step_log_buffer()
+        if buffer is not None:
+            buffer.append((self.log_install, message))
+            return
         self.log(message)
 
         def write():
@@ -1364,6 +3356,17 @@ class InstallerApp:
 
 
 if __name__ == "__main__":
+    # Diagnostics run without UAC prompt and without Tk
+    if len(sys.argv) > 1 and sys.argv[1] in ("--startup-probe", "--startup-report"):
+        sys.exit(run_startup_diagnostics(sys.argv[1:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "--cache":
+        sys.exit(run_cache_cli(sys.argv[1:]))
+
+    ensure_admin()
+
+    import tkinter as tk
+    from tkinter import messagebox, scrolledtext, ttk
+
     root = tk.Tk()
     # Titlebar Icon
     try:
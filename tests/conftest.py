@@ -0,0 +1,28 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+PROGRAMS = {
+    "control_center": SRC / "Beszel Agent Control Center" / "beszel_agent_control_center.py",
+    "installer": SRC / "Beszel Agent Installer" / "beszel_agent_installer.py",
+}
+
+
+def load_program(name):
+    """Import one of the single-file programs as a module (they run on Linux with fake backends)."""
+    module_name = f"beszel_{name}"
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name, PROGRAMS[name])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def installer():
+    return load_program("installer")
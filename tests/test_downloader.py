@@ -0,0 +1,205 @@
+import http.server
+import io
+import os
+import re
+import threading
+import types
+import zipfile
+
+import pytest
+
+
+class RangeServer(http.server.ThreadingHTTPServer):
+    """Serves `data` with an ETag; can ignore ranges and cut responses short."""
+
+    daemon_threads = True
+
+    def __init__(self, data):
+        super().__init__(("127.0.0.1", 0), RangeHandler)
+        self.data = data
+        self.etag = '"v1"'
+        self.ranges = True
+        self.drop_after = None   # bytes sent per response before the connection is cut
+        self.seen_ranges = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/file.zip"
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        srv = self.server
+        requested = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        srv.seen_ranges.append(requested)
+        start, code = 0, 200
+        if requested and srv.ranges and if_range in (None, srv.etag):
+            start, code = int(re.match(r"bytes=(\d+)-", requested).group(1)), 206
+        body = srv.data[start:]
+
+        self.send_response(code)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", srv.etag)
+        if srv.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        if code == 206:
+            self.send_header("Content-Range", f"bytes {start}-{len(srv.data) - 1}/{len(srv.data)}")
+        self.end_headers()
+
+        sent = len(body) if srv.drop_after is None else min(len(body), srv.drop_after)
+        try:
+            self.wfile.write(body[:sent])
+            self.wfile.flush()
+        except OSError:
+            pass
+        if sent < len(body):
+            self.close_connection = True
+            self.connection.shutdown(2)
+
+
+@pytest.fixture
+def server():
+    srv = RangeServer(os.urandom(3 * 1024 * 1024 + 17))
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+class Crash(Exception):
+    pass
+
+
+# Crashes once `after` bytes arrived (the first read is the smallest adaptive chunk)
+def crashing_sink(buffer, after):
+    def sink(data):
+        buffer.extend(data)
+        if len(buffer) >= after:
+            raise Crash()
+    return sink
+
+
+def downloader(installer):
+    return installer.Downloader(backoff=0)
+
+
+def test_plain_download(installer, server):
+    received = bytearray()
+    dl = downloader(installer)
+    dl.stream(server.url, received.extend)
+    assert received == server.data
+    assert server.seen_ranges == [None] and dl.retried == 0
+
+
+def test_dropped_connection_resumes_in_call(installer, server):
+    server.drop_after = 1024 * 1024
+    received = bytearray()
+    dl = downloader(installer)
+    dl.stream(server.url, received.extend)
+    assert received == server.data
+    assert dl.retried == 3
+    assert server.seen_ranges[1:] == [f"bytes={n * 1024 * 1024}-" for n in (1, 2, 3)]
+
+
+def test_dropped_connection_without_ranges_starts_over(installer, server):
+    server.ranges = False
+    server.drop_after = 1024 * 1024
+    with pytest.raises(installer.RemoteChanged):
+        downloader(installer).stream(server.url, bytearray().extend)
+
+
+def test_resume_from_part_after_crash(installer, server, tmp_path):
+    part = str(tmp_path / "file.zip.part")
+    first = bytearray()
+    with pytest.raises(Crash):
+        downloader(installer).stream(server.url, crashing_sink(first, 1), part=part)
+    kept = os.path.getsize(part)
+    assert 0 < kept < len(server.data) and server.data.startswith(open(part, "rb").read())
+
+    received = bytearray()
+    dl = downloader(installer)
+    dl.stream(server.url, received.extend, part=part)
+    assert received == server.data
+    assert dl.resumed == kept
+    assert server.seen_ranges[-1] == f"bytes={kept}-"
+
+
+def test_complete_part_needs_no_request(installer, server, tmp_path):
+    part = str(tmp_path / "file.zip.part")
+    downloader(installer).stream(server.url, bytearray().extend, part=part)
+    requests_before = len(server.seen_ranges)
+
+    received = bytearray()
+    downloader(installer).stream(server.url, received.extend, part=part)
+    assert received == server.data
+    assert len(server.seen_ranges) == requests_before
+
+
+def test_changed_remote_raises_and_discard_forgets_part(installer, server, tmp_path):
+    part = str(tmp_path / "file.zip.part")
+    with pytest.raises(Crash):
+        downloader(installer).stream(server.url, crashing_sink(bytearray(), 1), part=part)
+    server.etag = '"v2"'
+
+    with pytest.raises(installer.RemoteChanged):
+        downloader(installer).stream(server.url, bytearray().extend, part=part)
+    installer.Downloader.discard(part)
+    assert not os.path.exists(part) and not os.path.exists(part + ".json")
+
+
+def test_part_not_kept_resumable_without_ranges(installer, server, tmp_path):
+    server.ranges = False
+    part = str(tmp_path / "file.zip.part")
+    with pytest.raises(Crash):
+        downloader(installer).stream(server.url, crashing_sink(bytearray(), 1), part=part)
+    assert not os.path.exists(part + ".json")
+
+    received = bytearray()
+    dl = downloader(installer)
+    dl.stream(server.url, received.extend, part=part)
+    assert received == server.data and dl.resumed == 0
+
+
+def test_stream_zip_member_restarts_when_remote_changed(installer, server, tmp_path):
+    payload = os.urandom(2 * 1024 * 1024)
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_STORED) as zf:
+        zf.writestr("nssm-2.24/win64/nssm.exe", payload)
+    server.data = archive.getvalue()
+
+    part = str(tmp_path / "nssm.zip.part")
+    with pytest.raises(Crash):
+        downloader(installer).stream(server.url, crashing_sink(bytearray(), 1), part=part)
+    server.etag = '"v2"'
+
+    app = types.SimpleNamespace(log=lambda message: None)
+    out = open(tmp_path / "nssm.exe", "w+b")
+    with out:
+        extractor = installer.InstallerApp.stream_zip_member(
+            app, downloader(installer), server.url, part, installer.NSSM_MEMBER.search, out
+        )
+    assert extractor.member.endswith("win64/nssm.exe")
+    assert (tmp_path / "nssm.exe").read_bytes() == payload
+
+
+def test_nssm_with_wrong_hash_is_not_cached(installer, server, tmp_path, monkeypatch):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("nssm-2.24/win64/nssm.exe", b"not the real nssm")
+    server.data = archive.getvalue()
+    cached = []
+    monkeypatch.setattr(installer, "NSSM_URL", server.url)
+    monkeypatch.setattr(installer.artifact_cache, "put", lambda *args, **kwargs: cached.append(args))
+
+    app = types.SimpleNamespace(nssm_path=str(tmp_path / "nssm.exe"), log=lambda message: None,
+                                log_install=lambda message: None)
+    app.stream_zip_member = lambda *args: installer.InstallerApp.stream_zip_member(app, *args)
+    with pytest.raises(installer.DownloadError, match="checksum mismatch"):
+        installer.InstallerApp.download_nssm(app)
+    assert cached == [] and os.listdir(tmp_path) == []
@@ -0,0 +1,38 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import pytest
+
+from conftest import PROGRAMS, load_program
+
+RUNS = 5
+
+
+@pytest.mark.parametrize("name", sorted(PROGRAMS))
+def test_startup_probe_median_within_budget(name):
+    path = PROGRAMS[name]
+    budget_ms = load_program(name).STARTUP_BUDGET_MS
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, str(path), "--startup-probe"], capture_output=True, text=True)
+        samples.append((time.perf_counter() - start) * 1000)
+        assert proc.returncode == 0, proc.stderr
+        assert json.loads(proc.stdout) == [], "heavy modules imported at startup"
+    median = statistics.median(samples)
+    assert median <= budget_ms, f"median {median:.1f} ms > budget {budget_ms:.0f} ms"
+
+
+@pytest.mark.parametrize("name", sorted(PROGRAMS))
+def test_startup_report_runs_everywhere(name):
+    proc = subprocess.run(
+        [sys.executable, str(PROGRAMS[name]), "--startup-report", "--json"],
+        capture_output=True, text=True, env={**os.environ, "BESZEL_STARTUP_BUDGET_MS": "100000"}
+    )
+    assert proc.returncode == 0, proc.stderr
+    report = json.loads(proc.stdout)
+    assert report["within_budget"] and report["eager_modules"] == []